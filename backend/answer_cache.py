@@ -0,0 +1,190 @@
+"""
+Semantic answer cache for AI tutor questions
+Answers are cached per course and reused for questions that normalize to the
+same text (exact hash) or whose hashed n-gram vectors are close enough
+(cosine similarity). Entries are tied to the course's curriculum_version, so
+any course or lesson edit invalidates them. A question has a few dozen
+features, so vectors are kept sparse (~0.5 KB per entry) and only the most
+recently used courses are held.
+"""
+
+from cachetools import LRUCache
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import numpy as np
+import hashlib
+import re
+import time
+import zlib
+import os
+
+# Minimum cosine similarity for a semantic hit
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("AI_ANSWER_CACHE_THRESHOLD", 0.85))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("AI_ANSWER_CACHE_TTL_SECONDS", 24 * 3600))
+ANSWER_CACHE_MAX_PER_COURSE = int(os.environ.get("AI_ANSWER_CACHE_MAX_PER_COURSE", 500))
+ANSWER_CACHE_MAX_COURSES = int(os.environ.get("AI_ANSWER_CACHE_MAX_COURSES", 256))
+# Width of the hashed feature space; indices are stored as uint16
+VECTOR_DIM = 1 << 16
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+# Words that point back into a conversation ("what about it?", "explain that again")
+_CONTEXT_WORDS = frozenset(
+    "it its itself this that these those they them their above previous earlier again "
+    "else same also another before last further more instead".split()
+)
+STANDALONE_MIN_WORDS = 3
+
+
+def is_standalone(question: str) -> bool:
+    """Whether a question can be answered without the conversation before it, so a cached
+    answer from another student applies"""
+    words = normalize_question(question).split()
+    return len(words) >= STANDALONE_MIN_WORDS and not _CONTEXT_WORDS.intersection(words)
+
+
+def embed(normalized: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Unit-length sparse hashed vector of word unigrams, word bigrams and character trigrams,
+    as (sorted uint16 indices, float32 values)"""
+    words = normalized.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    if not features:
+        # One zero-valued feature keeps every entry non-empty for the segmented search
+        return np.zeros(1, dtype=np.uint16), np.zeros(1, dtype=np.float32)
+    # crc32 is stable across processes, unlike hash()
+    hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    indices, inverse = np.unique((hashes % VECTOR_DIM).astype(np.uint16), return_inverse=True)
+    values = np.bincount(inverse, weights=signs, minlength=len(indices)).astype(np.float32)
+    norm = np.linalg.norm(values)
+    return indices, (values / norm if norm else values)
+
+
+@dataclass
+class _CourseEntries:
+    version: int
+    keys: List[str] = field(default_factory=list)
+    answers: List[str] = field(default_factory=list)
+    created: List[float] = field(default_factory=list)
+    # Sparse vectors of all entries, appended to growable flat buffers; entry i
+    # occupies [starts[i], starts[i + 1]) of the first `used` slots
+    flat_indices: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.uint16))
+    flat_values: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float32))
+    starts: List[int] = field(default_factory=list)
+    used: int = 0
+
+    def append(self, key: str, answer: str, created: float, vector: Tuple[np.ndarray, np.ndarray]):
+        indices, values = vector
+        end = self.used + len(indices)
+        if end > len(self.flat_indices):
+            # Grow geometrically so appends stay amortized O(1)
+            capacity = max(end, 2 * len(self.flat_indices), 1024)
+            grown_indices = np.zeros(capacity, dtype=np.uint16)
+            grown_values = np.zeros(capacity, dtype=np.float32)
+            grown_indices[:self.used] = self.flat_indices[:self.used]
+            grown_values[:self.used] = self.flat_values[:self.used]
+            self.flat_indices, self.flat_values = grown_indices, grown_values
+        self.flat_indices[self.used:end] = indices
+        self.flat_values[self.used:end] = values
+        self.starts.append(self.used)
+        self.used = end
+        self.keys.append(key)
+        self.answers.append(answer)
+        self.created.append(created)
+
+    def compact(self, keep: List[int]):
+        """Keep only the given entries (ascending indices)"""
+        bounds = self.starts[1:] + [self.used]
+        vectors = [
+            (self.flat_indices[self.starts[i]:bounds[i]].copy(), self.flat_values[self.starts[i]:bounds[i]].copy())
+            for i in keep
+        ]
+        keys, answers, created = self.keys, self.answers, self.created
+        self.keys, self.answers, self.created, self.starts, self.used = [], [], [], [], 0
+        for i, vector in zip(keep, vectors):
+            self.append(keys[i], answers[i], created[i], vector)
+
+    def scores(self, query: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        """Cosine similarity of every entry with the query"""
+        dense = np.zeros(VECTOR_DIM, dtype=np.float32)
+        dense[query[0]] = query[1]
+        return np.add.reduceat(dense[self.flat_indices[:self.used]] * self.flat_values[:self.used], self.starts)
+
+
+class AnswerCache:
+    """Per-course exact + nearest-neighbour answer cache"""
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS,
+        max_per_course: int = ANSWER_CACHE_MAX_PER_COURSE,
+        max_courses: int = ANSWER_CACHE_MAX_COURSES
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_per_course = max_per_course
+        self._courses: LRUCache = LRUCache(maxsize=max_courses)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _entries(self, course_id: str, version: int) -> _CourseEntries:
+        entries = self._courses.get(course_id)
+        if entries is None or entries.version != version:
+            entries = _CourseEntries(version=version)
+            self._courses[course_id] = entries
+        return entries
+
+    def lookup(self, course_id: str, version: int, question: str) -> Optional[tuple]:
+        """Return (answer, "exact"|"semantic") for a cached match, or None"""
+        entries = self._entries(course_id, version)
+        normalized = normalize_question(question)
+        key = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        fresh_after = time.time() - self.ttl_seconds
+
+        for index in range(len(entries.keys) - 1, -1, -1):
+            if entries.keys[index] == key and entries.created[index] >= fresh_after:
+                self.hits += 1
+                return entries.answers[index], "exact"
+
+        if entries.keys:
+            scores = entries.scores(embed(normalized))
+            scores[np.asarray(entries.created) < fresh_after] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                self.hits += 1
+                return entries.answers[best], "semantic"
+
+        self.misses += 1
+        return None
+
+    def store(self, course_id: str, version: int, question: str, answer: str):
+        """Cache an answer; at the cap, expired and then oldest entries are evicted in a batch
+        so that compaction stays amortized O(1) per store"""
+        entries = self._entries(course_id, version)
+        normalized = normalize_question(question)
+        if len(entries.keys) >= self.max_per_course:
+            fresh_after = time.time() - self.ttl_seconds
+            keep = [i for i, created in enumerate(entries.created) if created >= fresh_after]
+            target = self.max_per_course - max(1, self.max_per_course // 10)
+            entries.compact(keep[-target:] if target > 0 else [])
+        entries.append(
+            hashlib.sha256(normalized.encode("utf-8")).hexdigest(), answer, time.time(), embed(normalized)
+        )
+
+    def invalidate(self, course_id: str):
+        self._courses.pop(course_id, None)
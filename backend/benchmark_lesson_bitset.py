@@ -0,0 +1,68 @@
+"""
+Lesson completion storage benchmark
+===================================
+Compares the legacy completed_lessons list of UUID strings against the
+completion bitset (see lesson_bitset.py) for:
+
+- BSON size stored per enrollment document
+- JSON bytes shipped per enrollment in the my-courses response
+- Python memory held per enrollment
+- the per-completion membership check
+"""
+
+import json
+import sys
+import timeit
+import uuid
+
+import bson
+
+import lesson_bitset
+
+COURSE_SIZES = [10, 50, 200, 1000]
+COMPLETION_RATIO = 0.8
+
+
+def deep_sizeof_list(values) -> int:
+    return sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+
+
+def run():
+    print("\n" + "=" * 88)
+    print(f"Lesson completion storage ({int(COMPLETION_RATIO * 100)}% of lessons completed)")
+    print("=" * 88)
+    print(f"{'lessons':>8} | {'BSON list':>10} {'BSON bits':>10} | {'JSON list':>10} {'JSON count':>10} | "
+          f"{'mem list':>9} {'mem bits':>9} | {'in list µs':>10} {'test_bit µs':>11}")
+    print("-" * 88)
+
+    for size in COURSE_SIZES:
+        lesson_ids = [str(uuid.uuid4()) for _ in range(size)]
+        completed_count = int(size * COMPLETION_RATIO)
+        completed_ids = lesson_ids[:completed_count]
+        bits = lesson_bitset.from_ordinals(range(completed_count))
+
+        bson_list = len(bson.encode({"completed_lessons": completed_ids}))
+        bson_bits = len(bson.encode({"completed_bits": bits, "completed_count": completed_count}))
+
+        json_list = len(json.dumps({"completed_lessons": completed_ids}))
+        json_count = len(json.dumps({"completed_count": completed_count}))
+
+        mem_list = deep_sizeof_list(completed_ids)
+        mem_bits = sys.getsizeof(bits)
+
+        # Worst case for the list: the lesson being checked is the last one
+        probe_id, probe_ordinal = lesson_ids[-1], size - 1
+        loops = 20000
+        t_list = timeit.timeit(lambda: probe_id in completed_ids, number=loops) / loops * 1e6
+        t_bits = timeit.timeit(lambda: lesson_bitset.test_bit(bits, probe_ordinal), number=loops) / loops * 1e6
+
+        print(f"{size:>8} | {bson_list:>10} {bson_bits:>10} | {json_list:>10} {json_count:>10} | "
+              f"{mem_list:>9} {mem_bits:>9} | {t_list:>10.3f} {t_bits:>11.3f}")
+
+    print("-" * 88)
+    print("Sizes in bytes. 'JSON count' is what my-courses now ships instead of the list;")
+    print("the decoded list is fetched only by the player via /lesson-progress.\n")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,225 @@
+"""
+Certificate rendering for BritSyncAI Academy
+reportlab rendering is CPU-bound, so PDFs are rendered in a bounded process
+pool instead of inside the API's event loop.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from reportlab.lib import colors
+from reportlab.graphics import renderPDF
+from reportlab.graphics.barcode.qr import QrCodeWidget
+from reportlab.graphics.shapes import Drawing
+from typing import Optional
+import multiprocessing
+import asyncio
+import logging
+import base64
+import hashlib
+import hmac
+import json
+import io
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class CertificateQueueFull(Exception):
+    """Raised when more renders are waiting than the service accepts"""
+
+
+# ==================== SIGNING ====================
+# A certificate token is base64url(payload JSON) + "." + base64url(HMAC-SHA256),
+# so anyone holding the token can be told whether it is genuine without a DB lookup.
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def sign_certificate(key: bytes, certificate_id: str, user_name: str, course_title: str, issued_date: str) -> str:
+    """Return a signed, URL-safe token carrying what is printed on the certificate"""
+    payload = json.dumps(
+        {"id": certificate_id, "name": user_name, "course": course_title, "issued": issued_date},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+    signature = hmac.new(key, payload, hashlib.sha256).digest()
+    return f"{_b64encode(payload)}.{_b64encode(signature)}"
+
+
+def verify_certificate_token(key: bytes, token: str) -> Optional[dict]:
+    """Return the certificate payload if the token's signature is valid, else None"""
+    try:
+        encoded_payload, encoded_signature = token.split(".")
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+    except ValueError:
+        return None
+    
+    expected = hmac.new(key, payload, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        return None
+    
+    try:
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+# ==================== RENDERING ====================
+
+def generate_certificate_pdf(
+    user_name: str,
+    course_title: str,
+    completion_date: str,
+    certificate_id: str,
+    verify_url: Optional[str] = None
+) -> bytes:
+    """Generate a professional certificate PDF"""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    
+    # Background border
+    c.setStrokeColor(colors.HexColor('#10b981'))
+    c.setLineWidth(10)
+    c.rect(30, 30, width - 60, height - 60)
+    
+    # Inner border
+    c.setStrokeColor(colors.HexColor('#059669'))
+    c.setLineWidth(2)
+    c.rect(50, 50, width - 100, height - 100)
+    
+    # Title
+    c.setFont("Helvetica-Bold", 48)
+    c.setFillColor(colors.HexColor('#10b981'))
+    c.drawCentredString(width / 2, height - 120, "Certificate")
+    
+    c.setFont("Helvetica", 28)
+    c.setFillColor(colors.HexColor('#374151'))
+    c.drawCentredString(width / 2, height - 160, "of Completion")
+    
+    # Divider line
+    c.setStrokeColor(colors.HexColor('#d1fae5'))
+    c.setLineWidth(2)
+    c.line(150, height - 190, width - 150, height - 190)
+    
+    # Presented to text
+    c.setFont("Helvetica", 18)
+    c.setFillColor(colors.HexColor('#6b7280'))
+    c.drawCentredString(width / 2, height - 240, "This certificate is presented to")
+    
+    # Student name
+    c.setFont("Helvetica-Bold", 36)
+    c.setFillColor(colors.HexColor('#1a1a1a'))
+    c.drawCentredString(width / 2, height - 300, user_name)
+    
+    # Achievement text
+    c.setFont("Helvetica", 16)
+    c.setFillColor(colors.HexColor('#6b7280'))
+    c.drawCentredString(width / 2, height - 350, "for successfully completing the course")
+    
+    # Course title
+    c.setFont("Helvetica-Bold", 24)
+    c.setFillColor(colors.HexColor('#10b981'))
+    c.drawCentredString(width / 2, height - 400, course_title)
+    
+    # Completion date
+    c.setFont("Helvetica", 14)
+    c.setFillColor(colors.HexColor('#6b7280'))
+    c.drawCentredString(width / 2, height - 470, f"Completed on {completion_date}")
+    
+    # Certificate ID
+    c.setFont("Helvetica", 10)
+    c.setFillColor(colors.HexColor('#9ca3af'))
+    c.drawCentredString(width / 2, 100, f"Certificate ID: {certificate_id}")
+    
+    # Platform name
+    c.setFont("Helvetica-Bold", 16)
+    c.setFillColor(colors.HexColor('#10b981'))
+    c.drawCentredString(width / 2, 140, "BritSyncAI Academy")
+    
+    # Verification QR code (links to the signed verify URL)
+    if verify_url:
+        qr_size = 90
+        qr = QrCodeWidget(verify_url)
+        x1, y1, x2, y2 = qr.getBounds()
+        drawing = Drawing(qr_size, qr_size, transform=[qr_size / (x2 - x1), 0, 0, qr_size / (y2 - y1), 0, 0])
+        drawing.add(qr)
+        renderPDF.draw(drawing, c, width - 60 - qr_size, 60)
+        
+        c.setFont("Helvetica", 8)
+        c.setFillColor(colors.HexColor('#9ca3af'))
+        c.drawCentredString(width - 60 - qr_size / 2, 55, "Scan to verify")
+    
+    c.save()
+    buffer.seek(0)
+    return buffer.getvalue()
+
+
+
+class CertificateRenderService:
+    """Bounded process-pool renderer for certificate PDFs"""
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.max_workers = max_workers or int(
+            os.environ.get("CERTIFICATE_RENDER_WORKERS", min(4, os.cpu_count() or 1))
+        )
+        self.max_queue = max_queue or int(os.environ.get("CERTIFICATE_RENDER_MAX_QUEUE", 256))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self._waiting = 0
+        self._running = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Renders waiting for a worker plus renders in progress"""
+        return self._waiting + self._running
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn keeps workers free of the parent's event loop and DB client threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def render(
+        self,
+        user_name: str,
+        course_title: str,
+        completion_date: str,
+        certificate_id: str,
+        verify_url: Optional[str] = None
+    ) -> bytes:
+        """Render one certificate in the pool; raises CertificateQueueFull under overload"""
+        if self._waiting >= self.max_queue:
+            raise CertificateQueueFull(f"{self._waiting} certificate renders already queued")
+
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(),
+                generate_certificate_pdf,
+                user_name, course_title, completion_date, certificate_id, verify_url
+            )
+        finally:
+            self._running -= 1
+            self._slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
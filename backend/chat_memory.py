@@ -0,0 +1,150 @@
+"""
+Conversation memory for AI tutor and course assistant sessions
+Recent turns are kept verbatim within a token budget; older turns are folded
+into a running summary. Sessions live in Mongo (chat_sessions), which is the
+source of truth: turns are appended atomically and every write bumps a
+version. An in-process LRU in front keeps the last version this process saw,
+so follow-up questions don't transfer the document again unless it changed.
+"""
+
+from cachetools import TTLCache
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+from typing import Awaitable, Callable, List, Optional
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens reserved for verbatim history (summary excluded)
+CHAT_MEMORY_TOKEN_BUDGET = int(os.environ.get("CHAT_MEMORY_TOKEN_BUDGET", 1500))
+# Most recent turns are never summarized, even when they exceed the budget
+CHAT_MEMORY_MIN_TURNS = 2
+# Idle sessions expire from Mongo after this many days (TTL index on expires_at)
+CHAT_SESSION_TTL_DAYS = int(os.environ.get("CHAT_SESSION_TTL_DAYS", 30))
+
+# LRU with a TTL so documents removed behind our back (TTL expiry) aren't served for long
+_sessions: TTLCache = TTLCache(maxsize=2048, ttl=3600)
+_SESSION_FIELDS = {"_id": 0, "summary": 1, "turns": 1, "version": 1}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting"""
+    return max(1, len(text) // 4)
+
+
+def _turn_tokens(turn: dict) -> int:
+    return estimate_tokens(turn['user']) + estimate_tokens(turn['assistant'])
+
+
+def _session_from(doc: Optional[dict]) -> dict:
+    doc = doc or {}
+    return {"summary": doc.get("summary", ""), "turns": doc.get("turns", []), "version": doc.get("version", 0)}
+
+
+async def load_session(db, session_id: str) -> dict:
+    """Return {"summary", "turns", "version"} for a session, empty if it doesn't exist yet"""
+    cached = _sessions.get(session_id)
+    query = {"session_id": session_id}
+    if cached is not None:
+        # Only transfer the document when another request or replica changed it
+        query["version"] = {"$ne": cached["version"]}
+    doc = await db.chat_sessions.find_one(query, _SESSION_FIELDS)
+    if doc is None:
+        return cached or _session_from(None)
+    session = _sessions[session_id] = _session_from(doc)
+    return session
+
+
+def history_messages(session: dict) -> List[dict]:
+    """Session turns as chat messages, oldest first"""
+    messages = []
+    for turn in session['turns']:
+        messages.append({"role": "user", "content": turn['user']})
+        messages.append({"role": "assistant", "content": turn['assistant']})
+    return messages
+
+
+def with_summary(system_message: str, session: dict) -> str:
+    """Append the running conversation summary to a system prompt"""
+    if not session['summary']:
+        return system_message
+    return f"{system_message}\n\nSummary of the earlier conversation with this user:\n{session['summary']}"
+
+
+async def record_turn(
+    db,
+    session_id: str,
+    user_id: str,
+    question: str,
+    answer: str,
+    summarize: Callable[[str, str], Awaitable[Optional[str]]]
+):
+    """Append a turn, folding the oldest turns into the summary once over budget.
+
+    summarize(previous_summary, transcript) returns the new summary, or None on failure,
+    in which case the overflowing turns are dropped rather than kept over budget.
+    The append is a single $push, so concurrent questions never drop each other's
+    turns; the fold only applies if no other turn was recorded in the meantime
+    (that writer folds instead).
+    """
+    now = datetime.now(timezone.utc)
+    doc = await db.chat_sessions.find_one_and_update(
+        {"session_id": session_id},
+        {
+            "$push": {"turns": {"user": question, "assistant": answer}},
+            "$inc": {"version": 1},
+            "$set": {
+                "user_id": user_id,
+                "updated_at": now.isoformat(),
+                "expires_at": now + timedelta(days=CHAT_SESSION_TTL_DAYS),
+            },
+            "$setOnInsert": {"created_at": now.isoformat(), "summary": ""},
+        },
+        projection=_SESSION_FIELDS,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    session = _sessions[session_id] = _session_from(doc)
+    turns = session['turns']
+
+    total = sum(_turn_tokens(turn) for turn in turns)
+    keep_from = 0
+    while total > CHAT_MEMORY_TOKEN_BUDGET and len(turns) - keep_from > CHAT_MEMORY_MIN_TURNS:
+        total -= _turn_tokens(turns[keep_from])
+        keep_from += 1
+    if not keep_from:
+        return
+
+    transcript = "\n".join(
+        f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in turns[:keep_from]
+    )
+    summary = session['summary']
+    try:
+        summary = await summarize(summary, transcript) or summary
+    except Exception as e:
+        logger.warning(f"Conversation summary failed for {session_id}: {e}")
+
+    doc = await db.chat_sessions.find_one_and_update(
+        {"session_id": session_id, "version": session['version']},
+        {
+            "$set": {"summary": summary},
+            # Keep only the newest turns
+            "$push": {"turns": {"$each": [], "$slice": -(len(turns) - keep_from)}},
+            "$inc": {"version": 1},
+        },
+        projection=_SESSION_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is not None:
+        _sessions[session_id] = _session_from(doc)
+
+
+async def clear_session(db, session_id: str):
+    """Forget a session's history"""
+    _sessions.pop(session_id, None)
+    # Reset rather than delete so the version bump reaches other processes' caches
+    await db.chat_sessions.update_one(
+        {"session_id": session_id},
+        {"$set": {"summary": "", "turns": []}, "$inc": {"version": 1}}
+    )
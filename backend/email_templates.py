@@ -0,0 +1,81 @@
+"""
+Email templates for BritSyncAI Academy
+Jinja2 templates under templates/emails are compiled once at import. Blog
+markdown is rendered to HTML once per post, and the newsletter document is
+rendered once per post with a placeholder where each recipient's
+unsubscribe URL goes.
+"""
+
+from cachetools import LRUCache
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+from markdown_it import MarkdownIt
+from markupsafe import Markup
+from pathlib import Path
+from typing import Tuple
+from urllib.parse import quote
+import hashlib
+
+TEMPLATE_DIR = Path(__file__).parent / "templates" / "emails"
+
+_env = Environment(
+    loader=FileSystemLoader(str(TEMPLATE_DIR)),
+    autoescape=select_autoescape(["html"]),
+    undefined=StrictUndefined,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False,
+)
+WELCOME_TEMPLATE = _env.get_template("welcome.html")
+PASSWORD_RESET_TEMPLATE = _env.get_template("password_reset.html")
+NEWSLETTER_TEMPLATE = _env.get_template("newsletter.html")
+
+# LLM-written markdown: raw HTML in it is escaped, not passed through
+_markdown = MarkdownIt("commonmark", {"html": False, "linkify": False, "typographer": True}).enable("table")
+
+_UNSUBSCRIBE_PLACEHOLDER = "__UNSUBSCRIBE_URL__"
+_newsletter_parts: LRUCache = LRUCache(maxsize=32)
+
+
+def render_welcome(name: str, frontend_url: str) -> str:
+    return WELCOME_TEMPLATE.render(name=name, frontend_url=frontend_url)
+
+
+def render_password_reset(reset_link: str, frontend_url: str) -> str:
+    return PASSWORD_RESET_TEMPLATE.render(reset_link=reset_link, frontend_url=frontend_url)
+
+
+def render_markdown(text: str) -> str:
+    return _markdown.render(text or "")
+
+
+def _post_key(blog_post: dict, frontend_url: str) -> str:
+    digest = hashlib.sha256()
+    for part in (blog_post.get('id'), blog_post.get('title'), blog_post.get('content'),
+                 blog_post.get('cover_image'), blog_post.get('course_id'), frontend_url):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def newsletter_parts(blog_post: dict, frontend_url: str) -> Tuple[str, str]:
+    """The rendered newsletter split around the unsubscribe URL, cached per post"""
+    key = _post_key(blog_post, frontend_url)
+    parts = _newsletter_parts.get(key)
+    if parts is None:
+        content_html = blog_post.get('content_html') or render_markdown(blog_post.get('content', ""))
+        course_url = f"{frontend_url}/courses/{blog_post['course_id']}" if blog_post.get('course_id') else frontend_url
+        html = NEWSLETTER_TEMPLATE.render(
+            blog_post=blog_post,
+            content_html=Markup(content_html),
+            course_url=course_url,
+            frontend_url=frontend_url,
+            unsubscribe_url=_UNSUBSCRIBE_PLACEHOLDER,
+        )
+        head, _, tail = html.partition(_UNSUBSCRIBE_PLACEHOLDER)
+        parts = _newsletter_parts[key] = (head, tail)
+    return parts
+
+
+def render_newsletter(blog_post: dict, frontend_url: str, unsubscribe_token: str) -> str:
+    head, tail = newsletter_parts(blog_post, frontend_url)
+    return f"{head}{frontend_url}/unsubscribe?token={quote(unsubscribe_token, safe='')}{tail}"
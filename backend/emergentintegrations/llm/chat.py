@@ -1,14 +1,257 @@
 """
-LLM Chat implementation using both OpenAI and Google Gemini.
+LLM Chat implementation using OpenAI, Groq and Google Gemini.
+Calls are routed across providers with per-provider deadlines, fallback,
+optional hedging and latency-aware ordering (see ROUTING below).
 """
 
-from dataclasses import dataclass
-from typing import Optional
-from dataclasses import dataclass
-from typing import Optional
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
 import os
+import time
+import httpx
 import openai
 
+logger = logging.getLogger(__name__)
+
+
+# ==================== CLIENT REGISTRY ====================
+# One pooled client per (provider, base_url, api_key) for the whole process, so
+# repeated calls reuse keep-alive connections instead of paying TLS setup each time.
+
+# Overridable so the router can be exercised against a local OpenAI-compatible stub
+PROVIDER_BASE_URLS = {
+    "openai": os.environ.get("LLM_OPENAI_BASE_URL") or None,
+    "groq": os.environ.get("LLM_GROQ_BASE_URL", "https://api.groq.com/openai/v1"),
+}
+
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 60))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("LLM_CONNECT_TIMEOUT_SECONDS", 10))
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("LLM_KEEPALIVE_EXPIRY_SECONDS", 30))
+
+# Calls in flight per provider across the process (LLM_MAX_CONCURRENCY_<PROVIDER>)
+LLM_DEFAULT_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 16))
+
+_clients: Dict[Tuple[str, Optional[str], str], openai.AsyncOpenAI] = {}
+_provider_slots: Dict[str, asyncio.Semaphore] = {}
+_genai_api_key: Optional[str] = None
+
+
+def get_openai_client(provider: str, api_key: str) -> openai.AsyncOpenAI:
+    """Return the shared OpenAI-compatible client for a provider, creating it on first use"""
+    base_url = PROVIDER_BASE_URLS.get(provider)
+    key = (provider, base_url, api_key)
+    client = _clients.get(key)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS
+            )
+        )
+        # The router owns retries: SDK retries would spend the provider deadline
+        # before fallback or hedging could act
+        client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        _clients[key] = client
+    return client
+
+
+def configure_genai(api_key: str):
+    """Configure the Gemini SDK once per API key (genai.configure is process-global)"""
+    global _genai_api_key
+    import google.generativeai as genai
+    if _genai_api_key != api_key:
+        genai.configure(api_key=api_key)
+        _genai_api_key = api_key
+    return genai
+
+
+def provider_slot(provider: str) -> asyncio.Semaphore:
+    """Process-wide concurrency limit for one provider"""
+    slot = _provider_slots.get(provider)
+    if slot is None:
+        limit = int(os.environ.get(f"LLM_MAX_CONCURRENCY_{provider.upper()}", LLM_DEFAULT_MAX_CONCURRENCY))
+        slot = _provider_slots[provider] = asyncio.Semaphore(limit)
+    return slot
+
+
+def _openai_usage(usage) -> Optional[dict]:
+    if usage is None:
+        return None
+    return {"prompt_tokens": usage.prompt_tokens or 0, "completion_tokens": usage.completion_tokens or 0}
+
+
+def _gemini_usage(response) -> Optional[dict]:
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return None
+    return {
+        "prompt_tokens": metadata.prompt_token_count or 0,
+        "completion_tokens": metadata.candidates_token_count or 0,
+    }
+
+
+async def aclose_clients():
+    """Close every pooled client; call on application shutdown"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+
+# ==================== ROUTING ====================
+
+class LlmUnavailableError(Exception):
+    """Raised when no provider produced an answer within its deadline"""
+
+
+PROVIDER_API_KEY_ENV = {
+    "groq": "GROQ_API_KEY",
+    "openai": "OPENAI_API_KEY",
+    "google": "GEMINI_API_KEY",
+}
+# Model used when a provider is reached as a fallback rather than requested
+PROVIDER_DEFAULT_MODELS = {
+    "groq": os.environ.get("LLM_GROQ_MODEL", "llama-3.3-70b-versatile"),
+    "openai": os.environ.get("LLM_OPENAI_MODEL", "gpt-4o-mini"),
+    "google": os.environ.get("LLM_GOOGLE_MODEL", "gemini-2.5-flash"),
+}
+PROVIDER_DEADLINE_SECONDS = {
+    provider: float(os.environ.get(f"LLM_{provider.upper()}_DEADLINE_SECONDS", default))
+    for provider, default in (("groq", 20), ("openai", 30), ("google", 30))
+}
+LLM_FALLBACK_ORDER = [
+    p.strip() for p in os.environ.get("LLM_FALLBACK_ORDER", "groq,openai,google").split(",") if p.strip()
+]
+# Start a second provider when the first hasn't answered within its recent p95
+LLM_HEDGE_REQUESTS = os.environ.get("LLM_HEDGE_REQUESTS", "false").lower() == "true"
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("LLM_HEDGE_MIN_DELAY_SECONDS", 1.0))
+# A fallback is tried first only when its latency EWMA beats the requested
+# provider's by this factor
+LLM_LATENCY_SWITCH_FACTOR = float(os.environ.get("LLM_LATENCY_SWITCH_FACTOR", 2.0))
+# Consecutive failures after which a provider is skipped for the cooldown
+LLM_CIRCUIT_FAILURES = 3
+LLM_CIRCUIT_COOLDOWN_SECONDS = 30.0
+LATENCY_EWMA_ALPHA = 0.2
+
+
+@dataclass
+class ProviderStats:
+    ewma: Optional[float] = None
+    recent: deque = field(default_factory=lambda: deque(maxlen=200))
+    consecutive_failures: int = 0
+    last_failure: float = 0.0
+
+    def record_success(self, latency: float):
+        self.ewma = latency if self.ewma is None else (
+            LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self.ewma
+        )
+        self.recent.append(latency)
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.last_failure = time.monotonic()
+
+    @property
+    def circuit_open(self) -> bool:
+        return (
+            self.consecutive_failures >= LLM_CIRCUIT_FAILURES
+            and time.monotonic() - self.last_failure < LLM_CIRCUIT_COOLDOWN_SECONDS
+        )
+
+    def p95(self) -> Optional[float]:
+        if len(self.recent) < 20:
+            return None
+        values = sorted(self.recent)
+        return values[int(0.95 * (len(values) - 1))]
+
+
+_provider_stats: Dict[str, ProviderStats] = {}
+
+
+def provider_stats(provider: str) -> ProviderStats:
+    stats = _provider_stats.get(provider)
+    if stats is None:
+        stats = _provider_stats[provider] = ProviderStats()
+    return stats
+
+
+@dataclass
+class Route:
+    provider: str
+    model: str
+    api_key: str
+
+    @property
+    def deadline(self) -> float:
+        return PROVIDER_DEADLINE_SECONDS.get(self.provider, LLM_TIMEOUT_SECONDS)
+
+
+# ==================== INSTRUMENTATION ====================
+# Every provider call is reported to the registered sinks as an LlmCall.
+
+# Estimated USD per 1M (prompt, completion) tokens; LLM_PRICES (JSON) adds or overrides models
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama3-8b-8192": (0.05, 0.08),
+    "mixtral-8x7b-32768": (0.24, 0.24),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+try:
+    MODEL_PRICES.update({model: tuple(price) for model, price in json.loads(os.environ.get("LLM_PRICES", "{}")).items()})
+except (ValueError, TypeError) as e:
+    logger.error(f"Ignoring invalid LLM_PRICES: {e}")
+
+
+@dataclass
+class LlmCall:
+    provider: str
+    model: str
+    tag: str
+    latency: float
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float
+    error: Optional[str] = None  # exception class name, "Cancelled" for abandoned calls
+    streamed: bool = False
+
+
+_call_sinks: List[Callable[[LlmCall], None]] = []
+
+
+def add_call_sink(sink: Callable[[LlmCall], None]):
+    """Register a callback that receives every LlmCall (must not block)"""
+    _call_sinks.append(sink)
+
+
+def estimate_cost(model: str, usage: Optional[dict]) -> float:
+    if not usage or model not in MODEL_PRICES:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[model]
+    return (usage['prompt_tokens'] * prompt_price + usage['completion_tokens'] * completion_price) / 1_000_000
+
+
+def _emit(call: LlmCall):
+    for sink in _call_sinks:
+        try:
+            sink(call)
+        except Exception as e:
+            logger.warning(f"LLM call sink failed: {e}")
+
 
 @dataclass
 class UserMessage:
@@ -17,7 +260,7 @@ class UserMessage:
 
 
 class LlmChat:
-    """LLM Chat implementation supporting OpenAI and Google Gemini"""
+    """LLM chat routed across OpenAI, Groq and Google Gemini"""
     
     def __init__(self, api_key: str, session_id: str, system_message: str = ""):
         self.api_key = api_key
@@ -25,9 +268,19 @@ class LlmChat:
         self.system_message = system_message
         self.model = "gemini-1.5-flash"  # Default model
         self.provider = "google"
+        self.fallback = True
+        self.tag = "untagged"
+        self.json_output = False
+        self.history: List[dict] = []
+        self.last_error: Optional[Exception] = None
+        # {"prompt_tokens", "completion_tokens"} reported by the provider for the last call
+        self.last_usage: Optional[dict] = None
+        # Provider and model that actually answered the last call
+        self.last_provider: Optional[str] = None
+        self.last_model: Optional[str] = None
     
     def with_model(self, provider: str, model: str) -> "LlmChat":
-        """Set the model to use"""
+        """Set the preferred provider and model"""
         self.provider = provider
         # Map model names if necessary
         model_mapping = {
@@ -41,57 +294,252 @@ class LlmChat:
         self.model = model_mapping.get(model, model)
         return self
     
-    async def send_message(self, message: UserMessage) -> str:
-        """Send a message and get response"""
-        try:
-            if self.provider == "openai":
-                client = openai.AsyncOpenAI(api_key=self.api_key)
-                
-                messages = []
-                if self.system_message:
-                    messages.append({"role": "system", "content": self.system_message})
-                messages.append({"role": "user", "content": message.text})
-                
-                response = await client.chat.completions.create(
-                    model=self.model,
-                    messages=messages
-                )
-                
-                return response.choices[0].message.content
-            
-            elif self.provider == "google":
-                import google.generativeai as genai
-                genai.configure(api_key=self.api_key)
-                # Note: For Gemini 2.5, using the generativeai SDK
-                model = genai.GenerativeModel(
-                    model_name=self.model,
-                    system_instruction=self.system_message if self.system_message else None
-                )
-                
-                response = await model.generate_content_async(message.text)
-                return response.text
-            
-            elif self.provider == "groq":
-                # Groq is OpenAI-compatible
-                client = openai.AsyncOpenAI(
-                    api_key=self.api_key,
-                    base_url="https://api.groq.com/openai/v1"
-                )
-                
-                messages = []
-                if self.system_message:
-                    messages.append({"role": "system", "content": self.system_message})
-                messages.append({"role": "user", "content": message.text})
-                
-                response = await client.chat.completions.create(
-                    model=self.model,
-                    messages=messages
-                )
-                
-                return response.choices[0].message.content
-                
+    def with_tag(self, tag: str) -> "LlmChat":
+        """Label calls for metrics and usage rollups (e.g. tutor, assistant, newsletter)"""
+        self.tag = tag
+        return self
+    
+    def with_json_output(self, enabled: bool = True) -> "LlmChat":
+        """Ask providers for a single JSON object as the answer (JSON mode)"""
+        self.json_output = enabled
+        return self
+    
+    def with_fallback(self, enabled: bool = True) -> "LlmChat":
+        """Allow (default) or forbid falling back to other providers"""
+        self.fallback = enabled
+        return self
+    
+    def with_history(self, messages: List[dict]) -> "LlmChat":
+        """Prepend earlier turns ({"role": "user"|"assistant", "content": ...}) to each request"""
+        self.history = list(messages)
+        return self
+    
+    def _routes(self) -> List[Route]:
+        """Providers to try, in order: healthy before tripped, then by latency"""
+        routes = []
+        if self.api_key:
+            routes.append(Route(self.provider, self.model, self.api_key))
+        if self.fallback:
+            for provider in LLM_FALLBACK_ORDER:
+                api_key = os.environ.get(PROVIDER_API_KEY_ENV.get(provider, ""))
+                if provider != self.provider and api_key and provider in PROVIDER_DEFAULT_MODELS:
+                    routes.append(Route(provider, PROVIDER_DEFAULT_MODELS[provider], api_key))
+        
+        def rank(indexed: Tuple[int, Route]):
+            index, route = indexed
+            stats = provider_stats(route.provider)
+            if route.provider == self.provider:
+                latency = (stats.ewma or 0.0) / LLM_LATENCY_SWITCH_FACTOR
             else:
-                return f"Unsupported provider: {self.provider}"
-                
+                latency = stats.ewma if stats.ewma is not None else route.deadline
+            return (stats.circuit_open, latency, index)
+        
+        return [route for _, route in sorted(enumerate(routes), key=rank)]
+    
+    def _messages(self, message: UserMessage) -> List[dict]:
+        messages = []
+        if self.system_message:
+            messages.append({"role": "system", "content": self.system_message})
+        messages.extend(self.history)
+        messages.append({"role": "user", "content": message.text})
+        return messages
+    
+    def _gemini_contents(self, message: UserMessage) -> List[dict]:
+        contents = [
+            {"role": "model" if turn["role"] == "assistant" else "user", "parts": [turn["content"]]}
+            for turn in self.history
+        ]
+        contents.append({"role": "user", "parts": [message.text]})
+        return contents
+    
+    def _gemini_model(self, route: Route):
+        genai = configure_genai(route.api_key)
+        return genai.GenerativeModel(
+            model_name=route.model,
+            system_instruction=self.system_message if self.system_message else None,
+            generation_config={"response_mime_type": "application/json"} if self.json_output else None
+        )
+    
+    async def _complete(self, route: Route, message: UserMessage) -> Tuple[str, Optional[dict]]:
+        """One provider call bounded by the provider's deadline; returns (text, usage)"""
+        async def call():
+            async with provider_slot(route.provider):
+                if route.provider in ("openai", "groq"):
+                    extra = {"response_format": {"type": "json_object"}} if self.json_output else {}
+                    response = await get_openai_client(route.provider, route.api_key).chat.completions.create(
+                        model=route.model,
+                        messages=self._messages(message),
+                        **extra
+                    )
+                    return response.choices[0].message.content, _openai_usage(response.usage)
+                if route.provider == "google":
+                    # Note: For Gemini 2.5, using the generativeai SDK
+                    response = await self._gemini_model(route).generate_content_async(self._gemini_contents(message))
+                    return response.text, _gemini_usage(response)
+                raise ValueError(f"Unsupported provider: {route.provider}")
+        
+        started = time.monotonic()
+        stats = provider_stats(route.provider)
+        try:
+            result = await asyncio.wait_for(call(), timeout=route.deadline)
+        except asyncio.CancelledError:
+            # Lost a hedge race or the caller went away
+            self._record(route, started, None, "Cancelled")
+            raise
         except Exception as e:
-            return f"AI service temporarily unavailable: {str(e)}"
+            stats.record_failure()
+            self._record(route, started, None, type(e).__name__)
+            raise
+        stats.record_success(time.monotonic() - started)
+        self._record(route, started, result[1], None)
+        return result
+    
+    def _record(self, route: Route, started: float, usage: Optional[dict], error: Optional[str], streamed: bool = False):
+        _emit(LlmCall(
+            provider=route.provider,
+            model=route.model,
+            tag=self.tag,
+            latency=time.monotonic() - started,
+            prompt_tokens=(usage or {}).get('prompt_tokens', 0),
+            completion_tokens=(usage or {}).get('completion_tokens', 0),
+            cost=estimate_cost(route.model, usage),
+            error=error,
+            streamed=streamed
+        ))
+    
+    def _hedge_delay(self, route: Route) -> Optional[float]:
+        if not LLM_HEDGE_REQUESTS:
+            return None
+        p95 = provider_stats(route.provider).p95()
+        return None if p95 is None else max(p95, LLM_HEDGE_MIN_DELAY_SECONDS)
+    
+    async def send_message(self, message: UserMessage) -> str:
+        """Send a message and return the first successful answer across providers.
+        Raises LlmUnavailableError when every provider failed or timed out."""
+        self.last_error = None
+        self.last_usage = None
+        routes = self._routes()
+        pending: Dict[asyncio.Task, Route] = {}
+        errors: List[str] = []
+        next_route = 0
+        
+        def launch():
+            nonlocal next_route
+            route = routes[next_route]
+            next_route += 1
+            pending[asyncio.ensure_future(self._complete(route, message))] = route
+        
+        try:
+            if routes:
+                launch()
+            while pending:
+                hedge_after = None
+                if next_route < len(routes):
+                    hedge_after = self._hedge_delay(routes[next_route - 1])
+                done, _ = await asyncio.wait(pending.keys(), timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Hedge: the latest route is slower than its p95, race the next one
+                    launch()
+                    continue
+                for task in done:
+                    route = pending.pop(task)
+                    try:
+                        text, usage = task.result()
+                    except Exception as e:
+                        errors.append(f"{route.provider}: {type(e).__name__}")
+                        logger.warning(f"LLM call to {route.provider}/{route.model} failed: {type(e).__name__}: {e}")
+                        continue
+                    self.last_usage = usage
+                    self.last_provider, self.last_model = route.provider, route.model
+                    return text
+                if not pending and next_route < len(routes):
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        error = LlmUnavailableError(
+            "AI service temporarily unavailable" + (f" ({', '.join(errors)})" if errors else " (no provider configured)")
+        )
+        self.last_error = error
+        raise error
+    
+    async def _stream_route(self, route: Route, message: UserMessage) -> AsyncIterator[str]:
+        if route.provider in ("openai", "groq"):
+            stream = await get_openai_client(route.provider, route.api_key).chat.completions.create(
+                model=route.model,
+                messages=self._messages(message),
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.usage:
+                        self.last_usage = _openai_usage(chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                # Stops generation upstream when the consumer goes away early
+                await stream.close()
+        
+        elif route.provider == "google":
+            response = await self._gemini_model(route).generate_content_async(self._gemini_contents(message), stream=True)
+            async for chunk in response:
+                self.last_usage = _gemini_usage(chunk) or self.last_usage
+                if chunk.parts:
+                    yield chunk.text
+        
+        else:
+            raise ValueError(f"Unsupported provider: {route.provider}")
+    
+    async def stream_message(self, message: UserMessage) -> AsyncIterator[str]:
+        """Yield the response text in chunks as the provider generates it.
+        Falls back to the next provider only while nothing has been yielded yet, with
+        the provider deadline applied to the first chunk. Raises LlmUnavailableError
+        when no provider could start a response."""
+        self.last_error = None
+        self.last_usage = None
+        errors: List[str] = []
+        
+        for route in self._routes():
+            stats = provider_stats(route.provider)
+            started = time.monotonic()
+            async with provider_slot(route.provider):
+                chunks = self._stream_route(route, message)
+                try:
+                    try:
+                        first = await asyncio.wait_for(chunks.__anext__(), timeout=route.deadline)
+                    except StopAsyncIteration:
+                        first = ""
+                    except Exception as e:
+                        stats.record_failure()
+                        self._record(route, started, None, type(e).__name__, streamed=True)
+                        errors.append(f"{route.provider}: {type(e).__name__}")
+                        logger.warning(f"LLM stream from {route.provider}/{route.model} failed: {type(e).__name__}: {e}")
+                        continue
+                    
+                    # Time to first chunk isn't comparable with full-completion latency,
+                    # so streams only clear the failure count
+                    stats.consecutive_failures = 0
+                    self.last_provider, self.last_model = route.provider, route.model
+                    outcome = "Cancelled"  # unless the stream runs to the end or raises
+                    try:
+                        if first:
+                            yield first
+                        async for chunk in chunks:
+                            yield chunk
+                        outcome = None
+                    except Exception as e:
+                        outcome = type(e).__name__
+                        raise
+                    finally:
+                        self._record(route, started, self.last_usage, outcome, streamed=True)
+                    return
+                finally:
+                    await chunks.aclose()
+        
+        error = LlmUnavailableError(
+            "AI service temporarily unavailable" + (f" ({', '.join(errors)})" if errors else " (no provider configured)")
+        )
+        self.last_error = error
+        raise error
@@ -0,0 +1,78 @@
+"""
+Compact bitset helpers for per-enrollment lesson completion.
+
+Every lesson gets a stable per-course ordinal (Lesson.ordinal). An enrollment
+stores the lessons it has completed as a little-endian bitset in which bit N
+is set once the lesson with ordinal N is completed. Bitsets are plain bytes,
+which pymongo stores as BSON binary and hands back as bytes.
+"""
+
+from typing import Iterable, List, Optional
+
+
+def normalize(bits: Optional[bytes]) -> bytes:
+    """Return a bitset as bytes, treating a missing value as empty"""
+    return bytes(bits) if bits else b""
+
+
+def set_bit(bits: Optional[bytes], ordinal: int) -> bytes:
+    """Return a copy of the bitset with the bit for `ordinal` set"""
+    if ordinal < 0:
+        raise ValueError("Lesson ordinal must be non-negative")
+    data = bytearray(normalize(bits))
+    index, offset = divmod(ordinal, 8)
+    if index >= len(data):
+        data.extend(b"\x00" * (index + 1 - len(data)))
+    data[index] |= 1 << offset
+    return bytes(data)
+
+
+def test_bit(bits: Optional[bytes], ordinal: int) -> bool:
+    """Return whether the bit for `ordinal` is set"""
+    data = normalize(bits)
+    index, offset = divmod(ordinal, 8)
+    return ordinal >= 0 and index < len(data) and bool(data[index] & (1 << offset))
+
+
+def popcount(bits: Optional[bytes]) -> int:
+    """Return the number of set bits, i.e. the number of completed lessons"""
+    return int.from_bytes(normalize(bits), "little").bit_count()
+
+
+def union(*bitsets: Optional[bytes]) -> bytes:
+    """Return the bitwise OR of several bitsets"""
+    value = 0
+    for bits in bitsets:
+        value |= int.from_bytes(normalize(bits), "little")
+    return _from_int(value)
+
+
+def intersect(bits: Optional[bytes], mask: Optional[bytes]) -> bytes:
+    """Return the bitwise AND of a bitset and a mask, trimmed of trailing zero bytes"""
+    value = int.from_bytes(normalize(bits), "little") & int.from_bytes(normalize(mask), "little")
+    return _from_int(value)
+
+
+def from_ordinals(ordinals: Iterable[int]) -> bytes:
+    """Build a bitset with the bits for all given ordinals set"""
+    value = 0
+    for ordinal in ordinals:
+        if ordinal < 0:
+            raise ValueError("Lesson ordinal must be non-negative")
+        value |= 1 << ordinal
+    return _from_int(value)
+
+
+def to_ordinals(bits: Optional[bytes]) -> List[int]:
+    """Return the ordinals of all set bits in ascending order"""
+    ordinals = []
+    for index, byte in enumerate(normalize(bits)):
+        while byte:
+            low = byte & -byte
+            ordinals.append(index * 8 + low.bit_length() - 1)
+            byte ^= low
+    return ordinals
+
+
+def _from_int(value: int) -> bytes:
+    return value.to_bytes((value.bit_length() + 7) // 8, "little")
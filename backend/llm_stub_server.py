@@ -0,0 +1,84 @@
+"""
+Local OpenAI-compatible stub for exercising the LLM router
+==========================================================
+Serves POST /v1/chat/completions (plain and stream=true) with configurable
+latency and failure rate, so fallback, deadlines and hedging can be tried
+without real provider keys:
+
+    python llm_stub_server.py --port 9101 --delay 0.2
+    python llm_stub_server.py --port 9102 --delay 5 --fail-rate 0.5
+
+    LLM_GROQ_BASE_URL=http://127.0.0.1:9101/v1 GROQ_API_KEY=stub \
+    LLM_OPENAI_BASE_URL=http://127.0.0.1:9102/v1 OPENAI_API_KEY=stub \
+    uvicorn server:app
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import time
+import uuid
+
+
+def make_handler(delay: float, fail_rate: float, name: str):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            time.sleep(delay)
+            if random.random() < fail_rate:
+                self.send_error(503, "Stub failure")
+                return
+
+            question = (body.get("messages") or [{}])[-1].get("content", "")
+            answer = f"[{name}] You asked: {question}"
+            usage = {"prompt_tokens": len(question) // 4 + 1, "completion_tokens": len(answer) // 4 + 1}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": body.get("model", "stub")}
+
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for word in answer.split(" "):
+                    chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                        {"index": 0, "delta": {"content": word + " "}, "finish_reason": None}
+                    ]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(0.02)
+                final = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+                return
+
+            payload = json.dumps({**base, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--delay", type=float, default=0.1, help="seconds before answering")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--name", default="stub")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.delay, args.fail_rate, args.name))
+    print(f"LLM stub '{args.name}' on http://127.0.0.1:{args.port}/v1 (delay {args.delay}s, fail rate {args.fail_rate})")
+    server.serve_forever()
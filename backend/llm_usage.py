@@ -0,0 +1,89 @@
+"""
+LLM usage accounting for BritSyncAI Academy
+Receives every LlmCall from emergentintegrations.llm.chat, feeds the in-process
+metrics registry, and rolls calls up per day/provider/model/tag into the
+llm_usage_daily collection.
+"""
+
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import Dict, Tuple
+import asyncio
+import logging
+
+from emergentintegrations.llm.chat import LlmCall
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds between rollup flushes to Mongo
+FLUSH_INTERVAL_SECONDS = 30
+
+
+class LlmUsageRecorder:
+    """Call sink that buffers daily rollups in memory and flushes them with $inc"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[str, str, str, str], Dict[str, float]] = {}
+
+    def record(self, call: LlmCall):
+        outcome = call.error or "ok"
+        metrics.inc("llm_calls", provider=call.provider, model=call.model, tag=call.tag, outcome=outcome)
+        if call.error is None:
+            metrics.observe("llm_latency_seconds", call.latency, provider=call.provider, tag=call.tag)
+        metrics.inc("llm_prompt_tokens", call.prompt_tokens, provider=call.provider, tag=call.tag)
+        metrics.inc("llm_completion_tokens", call.completion_tokens, provider=call.provider, tag=call.tag)
+        metrics.inc("llm_cost_usd", call.cost, tag=call.tag)
+
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        totals = self._pending.setdefault((day, call.provider, call.model, call.tag), {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "cost_usd": 0.0, "latency_seconds": 0.0,
+        })
+        totals["calls"] += 1
+        totals["errors"] += 1 if call.error else 0
+        totals["prompt_tokens"] += call.prompt_tokens
+        totals["completion_tokens"] += call.completion_tokens
+        totals["cost_usd"] += call.cost
+        totals["latency_seconds"] += call.latency
+
+    async def flush(self, db):
+        """Write buffered rollups; they are kept for the next flush if the write fails"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        operations = [
+            UpdateOne(
+                {"date": day, "provider": provider, "model": model, "tag": tag},
+                {"$inc": pending[(day, provider, model, tag)], "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+                upsert=True
+            )
+            for day, provider, model, tag in keys
+        ]
+        try:
+            await db.llm_usage_daily.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: everything but the reported operations was applied, so only those are retried
+            failed = [keys[error['index']] for error in e.details.get('writeErrors', [])]
+            logger.warning(f"LLM usage flush failed for {len(failed)} of {len(keys)} rollups, retrying later")
+            self._requeue({key: pending[key] for key in failed})
+        except Exception as e:
+            logger.warning(f"LLM usage flush failed, retrying later: {e}")
+            self._requeue(pending)
+
+    def _requeue(self, rollups: Dict[Tuple[str, str, str, str], Dict[str, float]]):
+        for key, totals in rollups.items():
+            merged = self._pending.setdefault(key, dict.fromkeys(totals, 0))
+            for field, value in totals.items():
+                merged[field] += value
+
+    async def run(self, db, interval: float = FLUSH_INTERVAL_SECONDS):
+        """Flush periodically until cancelled, then flush once more"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush(db)
+        finally:
+            await self.flush(db)
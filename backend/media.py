@@ -0,0 +1,413 @@
+"""
+Media processing for course thumbnails and lesson PDFs
+Uploaded thumbnails are resized in a process pool into WebP and JPEG
+variants at several widths, plus a tiny blurred JPEG (LQIP) that clients
+show inline while the real image loads. Lesson PDFs are validated, their
+pages counted and text extracted, and page 1 is rendered as a preview when
+pypdfium2 is installed. Results are recorded in the media_assets collection,
+keyed by the upload's SHA-256, and summarized onto the courses and lessons
+that use them.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = [int(w) for w in os.environ.get("THUMBNAIL_WIDTHS", "320,640,960,1280").split(",")]
+WEBP_QUALITY = 78
+JPEG_QUALITY = 82
+LQIP_WIDTH = 20
+# Refuse images that would take more than ~200 MB to decode
+MAX_IMAGE_PIXELS = 50_000_000
+
+_DIGEST_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+
+def build_image_variants(source_path: str, out_dir: str, stem: str, widths: List[int]) -> dict:
+    """Runs in a worker process: write <stem>-<w>.webp/.jpg for each width and return the metadata"""
+    from PIL import Image, ImageFilter, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        if has_alpha:
+            # JPEG has no alpha channel; flatten onto white like the catalog background
+            flat = Image.new("RGB", image.size, (255, 255, 255))
+            flat.paste(image, mask=image.getchannel("A"))
+        else:
+            flat = image
+
+        # Never upscale; an image narrower than the smallest width gets one variant at its own size
+        targets = sorted({w for w in widths if w < width} | {min(width, max(widths))})
+        variants = []
+        out = Path(out_dir)
+        for target in targets:
+            size = (target, max(1, round(height * target / width)))
+            resized = image if size == image.size else image.resize(size, Image.Resampling.LANCZOS)
+            resized_flat = flat if size == flat.size else flat.resize(size, Image.Resampling.LANCZOS)
+            webp_name = f"{stem}-{target}.webp"
+            jpeg_name = f"{stem}-{target}.jpg"
+            resized.save(out / webp_name, "WEBP", quality=WEBP_QUALITY, method=4)
+            resized_flat.save(out / jpeg_name, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            variants.append({
+                "width": size[0],
+                "height": size[1],
+                "webp": webp_name,
+                "jpeg": jpeg_name,
+                "webp_bytes": (out / webp_name).stat().st_size,
+                "jpeg_bytes": (out / jpeg_name).stat().st_size,
+            })
+
+        tiny = flat.resize((LQIP_WIDTH, max(1, round(height * LQIP_WIDTH / width))), Image.Resampling.BILINEAR)
+        buffer = io.BytesIO()
+        tiny.filter(ImageFilter.GaussianBlur(1)).save(buffer, "JPEG", quality=40)
+        lqip = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    return {"width": width, "height": height, "variants": variants, "lqip": lqip}
+
+
+def file_sha256(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def thumbnail_name_from_url(url: Optional[str]) -> Optional[str]:
+    """File name of an uploaded course thumbnail; course URLs may be relative or carry the backend origin"""
+    if not url:
+        return None
+    path = urlparse(url).path
+    if not path.startswith("/uploads/thumbnails/"):
+        return None
+    name = path[len("/uploads/thumbnails/"):]
+    # Generated variants live in a subdirectory and are never sources
+    return name if name and "/" not in name else None
+
+
+def srcset_for(asset: dict, url_prefix: str) -> Dict[str, str]:
+    """{"webp": "... 320w, ...", "jpeg": "..."} for an <img srcset> / <source srcset>"""
+    return {
+        fmt: ", ".join(f"{url_prefix}/{variant[fmt]} {variant['width']}w" for variant in asset['variants'])
+        for fmt in ("webp", "jpeg")
+    }
+
+
+def course_thumbnail_fields(asset: Optional[dict], url_prefix: str) -> dict:
+    """Fields copied onto a course for its thumbnail (cleared when no processed asset exists).
+    thumbnail_status is "ready", "failed", "missing" or None while processing is pending."""
+    if not asset or asset.get('status') != "ready" or not asset.get('variants'):
+        status = asset.get('status') if asset and asset.get('status') in ("failed", "missing") else None
+        return {"thumbnail_srcset": None, "thumbnail_lqip": None, "thumbnail_status": status}
+    return {"thumbnail_srcset": srcset_for(asset, url_prefix), "thumbnail_lqip": asset['lqip'], "thumbnail_status": "ready"}
+
+
+class MediaWorkers:
+    """Bounded process pool shared by the thumbnail and PDF pipelines"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.environ.get("MEDIA_WORKERS", min(2, os.cpu_count() or 1)))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.max_workers)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn keeps workers free of the parent's event loop and DB client threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def run(self, func, *args):
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class ThumbnailProcessor:
+    """Builds thumbnail variants on the media workers and records them in media_assets"""
+
+    def __init__(self, workers: MediaWorkers, thumbnail_dir: Path, url_prefix: str):
+        self.workers = workers
+        self.source_dir = thumbnail_dir
+        self.variant_dir = thumbnail_dir / "variants"
+        self.variant_dir.mkdir(parents=True, exist_ok=True)
+        # Public URL of variant_dir
+        self.url_prefix = url_prefix
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    def source_path(self, url: Optional[str]) -> Optional[Path]:
+        name = thumbnail_name_from_url(url)
+        if name is None:
+            return None
+        path = self.source_dir / name
+        return path if path.is_file() else None
+
+    async def asset_for_url(self, db, url: Optional[str]) -> Optional[dict]:
+        name = thumbnail_name_from_url(url)
+        if name is None:
+            return None
+        stem = Path(name).stem
+        query = {"id": stem} if _DIGEST_NAME.match(stem) else {"url": f"/uploads/thumbnails/{name}"}
+        return await db.media_assets.find_one(query, {"_id": 0})
+
+    async def process(self, db, url: str, sha256: Optional[str] = None) -> Optional[dict]:
+        """Build variants for an uploaded thumbnail once; concurrent calls share the work"""
+        path = self.source_path(url)
+        if path is None:
+            return None
+        if sha256 is None:
+            sha256 = path.stem if _DIGEST_NAME.match(path.stem) else await asyncio.to_thread(file_sha256, path)
+        task = self._in_flight.get(sha256)
+        if task is None:
+            task = asyncio.ensure_future(self._process(db, f"/uploads/thumbnails/{path.name}", path, sha256))
+            self._in_flight[sha256] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(sha256, None))
+        return await asyncio.shield(task)
+
+    async def _process(self, db, url: str, path: Path, sha256: str) -> Optional[dict]:
+        now = datetime.now(timezone.utc).isoformat()
+        existing = await db.media_assets.find_one_and_update(
+            {"id": sha256},
+            {"$setOnInsert": {
+                "id": sha256, "kind": "image", "url": url, "status": "processing",
+                "size": path.stat().st_size, "created_at": now,
+            }},
+            upsert=True,
+            projection={"_id": 0}
+        )
+        if existing and existing.get('status') == "ready":
+            await self._apply_to_courses(db, existing, url)
+            return existing
+
+        try:
+            result = await self.workers.run(
+                build_image_variants, str(path), str(self.variant_dir), sha256, THUMBNAIL_WIDTHS
+            )
+        except Exception as e:
+            logger.error(f"Thumbnail processing failed for {url}: {e}")
+            update = {"status": "failed", "error": str(e), "processed_at": datetime.now(timezone.utc).isoformat()}
+            await db.media_assets.update_one({"id": sha256}, {"$set": update})
+            # Flag the courses so the backfill doesn't retry this image every run
+            await self._apply_to_courses(db, {**(existing or {"id": sha256, "url": url}), **update}, url)
+            return None
+
+        asset = {**result, "status": "ready", "error": None, "processed_at": datetime.now(timezone.utc).isoformat()}
+        await db.media_assets.update_one({"id": sha256}, {"$set": asset})
+        asset = await db.media_assets.find_one({"id": sha256}, {"_id": 0})
+        await self._apply_to_courses(db, asset, url)
+        logger.info(
+            f"Thumbnail {url}: {len(asset['variants'])} variants, "
+            f"smallest WebP {asset['variants'][0]['webp_bytes']} of {asset.get('size')} bytes"
+        )
+        return asset
+
+    async def _apply_to_courses(self, db, asset: dict, url: str):
+        # Courses may already point at this thumbnail (a course is often saved before processing ends),
+        # with or without the backend origin
+        names = {thumbnail_name_from_url(url), thumbnail_name_from_url(asset.get('url'))} - {None}
+        pattern = "/uploads/thumbnails/(" + "|".join(re.escape(name) for name in names) + ")$"
+        await db.courses.update_many(
+            {"thumbnail": {"$regex": pattern}},
+            {"$set": course_thumbnail_fields(asset, self.url_prefix)}
+        )
+
+
+# ==================== LESSON PDFS ====================
+PDF_TEXT_MAX_CHARS = int(os.environ.get("PDF_TEXT_MAX_CHARS", 2_000_000))
+PDF_PREVIEW_WIDTH = 640
+
+
+def pdf_name_from_url(url: Optional[str]) -> Optional[str]:
+    """File name of an uploaded lesson PDF; lesson URLs may be relative or carry the backend origin"""
+    if not url:
+        return None
+    path = urlparse(url).path
+    if not path.startswith("/uploads/pdfs/"):
+        return None
+    name = Path(path).name
+    return name if name.endswith(".pdf") else None
+
+
+def inspect_pdf(source_path: str, preview_path: str, max_chars: int) -> dict:
+    """Runs in a worker process: validate the PDF, count pages, extract text, render page 1 if possible"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(source_path, strict=False)
+    if reader.is_encrypted and not reader.decrypt(""):
+        raise ValueError("PDF is password protected")
+    page_count = len(reader.pages)
+    if page_count == 0:
+        raise ValueError("PDF has no pages")
+
+    parts, chars = [], 0
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        parts.append(text)
+        chars += len(text)
+        if chars >= max_chars:
+            break
+    text = "\n".join(parts)[:max_chars]
+    try:
+        info = reader.metadata or {}
+    except Exception:
+        info = {}  # broken metadata doesn't make the document unreadable
+
+    preview = None
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        pdfium = None
+    if pdfium is not None:
+        document = pdfium.PdfDocument(source_path)
+        try:
+            page = document[0]
+            scale = PDF_PREVIEW_WIDTH / max(page.get_width(), 1)
+            image = page.render(scale=scale).to_pil().convert("RGB")
+            image.save(preview_path, "WEBP", quality=75, method=4)
+            preview = {"width": image.width, "height": image.height}
+        finally:
+            document.close()
+
+    return {
+        "page_count": page_count,
+        "text": text,
+        "text_chars": len(text),
+        "title": str(info.get("/Title") or "") or None,
+        "author": str(info.get("/Author") or "") or None,
+        "preview": preview,
+    }
+
+
+def lesson_pdf_fields(asset: Optional[dict]) -> Optional[dict]:
+    """Summary stored on a lesson for one of its PDFs"""
+    if not asset:
+        return None
+    return {
+        "status": asset.get('status'),
+        "page_count": asset.get('page_count'),
+        "preview_url": asset.get('preview_url'),
+        "text_chars": asset.get('text_chars'),
+        "error": asset.get('error'),
+    }
+
+
+class PdfProcessor:
+    """Validates lesson PDFs on the media workers and records page count, text and preview in media_assets"""
+
+    def __init__(self, workers: MediaWorkers, pdf_dir: Path, preview_url_prefix: str):
+        self.workers = workers
+        self.pdf_dir = pdf_dir
+        self.preview_dir = pdf_dir / "previews"
+        self.preview_dir.mkdir(parents=True, exist_ok=True)
+        self.preview_url_prefix = preview_url_prefix
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    def source_path(self, url: Optional[str]) -> Optional[Path]:
+        name = pdf_name_from_url(url)
+        if name is None:
+            return None
+        path = self.pdf_dir / name
+        return path if path.is_file() else None
+
+    async def asset_for_url(self, db, url: Optional[str], with_text: bool = False) -> Optional[dict]:
+        name = pdf_name_from_url(url)
+        if name is None:
+            return None
+        stem = Path(name).stem
+        query = {"id": stem} if _DIGEST_NAME.match(stem) else {"url": f"/uploads/pdfs/{name}"}
+        projection = {"_id": 0} if with_text else {"_id": 0, "text": 0}
+        return await db.media_assets.find_one(query, projection)
+
+    async def text_for_url(self, db, url: Optional[str]) -> Optional[str]:
+        """Extracted text of a processed PDF, or None if it hasn't been processed"""
+        asset = await self.asset_for_url(db, url, with_text=True)
+        if asset and asset.get('status') == "ready":
+            return asset.get('text') or ""
+        return None
+
+    async def process(self, db, url: str, sha256: Optional[str] = None) -> Optional[dict]:
+        """Inspect an uploaded PDF once; concurrent calls share the work"""
+        path = self.source_path(url)
+        if path is None:
+            return None
+        if sha256 is None:
+            sha256 = path.stem if _DIGEST_NAME.match(path.stem) else await asyncio.to_thread(file_sha256, path)
+        task = self._in_flight.get(sha256)
+        if task is None:
+            task = asyncio.ensure_future(self._process(db, f"/uploads/pdfs/{path.name}", path, sha256))
+            self._in_flight[sha256] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(sha256, None))
+        return await asyncio.shield(task)
+
+    async def _process(self, db, url: str, path: Path, sha256: str) -> Optional[dict]:
+        now = datetime.now(timezone.utc).isoformat()
+        existing = await db.media_assets.find_one_and_update(
+            {"id": sha256},
+            {"$setOnInsert": {
+                "id": sha256, "kind": "pdf", "url": url, "status": "processing",
+                "size": path.stat().st_size, "created_at": now,
+            }},
+            upsert=True,
+            projection={"_id": 0, "text": 0}
+        )
+        if existing and existing.get('status') in ("ready", "invalid"):
+            await self._apply_to_lessons(db, existing, url)
+            return existing
+
+        preview_path = self.preview_dir / f"{sha256}.webp"
+        try:
+            result = await self.workers.run(inspect_pdf, str(path), str(preview_path), PDF_TEXT_MAX_CHARS)
+        except Exception as e:
+            # A PDF the parser rejects is recorded as invalid so lessons can flag it
+            logger.warning(f"Lesson PDF {url} failed validation: {e}")
+            update = {"status": "invalid", "error": str(e), "processed_at": datetime.now(timezone.utc).isoformat()}
+            await db.media_assets.update_one({"id": sha256}, {"$set": update})
+            asset = {**(existing or {"id": sha256, "url": url}), **update}
+            await self._apply_to_lessons(db, asset, url)
+            return None
+
+        preview = result.pop('preview')
+        asset_update = {
+            **result,
+            "status": "ready",
+            "error": None,
+            "preview_url": f"{self.preview_url_prefix}/{preview_path.name}" if preview else None,
+            "preview_width": preview['width'] if preview else None,
+            "preview_height": preview['height'] if preview else None,
+            "processed_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await db.media_assets.update_one({"id": sha256}, {"$set": asset_update})
+        asset = await db.media_assets.find_one({"id": sha256}, {"_id": 0, "text": 0})
+        await self._apply_to_lessons(db, asset, url)
+        logger.info(f"Lesson PDF {url}: {asset['page_count']} pages, {asset['text_chars']} chars of text")
+        return asset
+
+    async def _apply_to_lessons(self, db, asset: dict, url: str):
+        # Lessons store the PDF URL with or without the backend origin
+        names = {pdf_name_from_url(url), pdf_name_from_url(asset.get('url'))} - {None}
+        pattern = "/uploads/pdfs/(" + "|".join(re.escape(name) for name in names) + ")$"
+        fields = lesson_pdf_fields(asset)
+        for url_field, summary_field in (("content_url", "content_pdf"), ("notes_url", "notes_pdf")):
+            await db.lessons.update_many({url_field: {"$regex": pattern}}, {"$set": {summary_field: fields}})
@@ -0,0 +1,86 @@
+"""
+In-process metrics registry for BritSyncAI Academy
+Counters, gauges and latency summaries exposed through /api/admin/metrics
+"""
+
+from collections import defaultdict, deque
+from typing import Callable, Dict, Tuple
+import threading
+
+# Number of recent observations kept per summary for percentile estimates
+SUMMARY_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, tuple], float] = defaultdict(float)
+_summaries: Dict[Tuple[str, tuple], dict] = {}
+_gauges: Dict[str, Callable[[], float]] = {}
+
+
+def _key(name: str, labels: dict) -> Tuple[str, tuple]:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Increment a counter"""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name: str, value: float, **labels):
+    """Record one observation (e.g. a latency in seconds) in a summary"""
+    with _lock:
+        summary = _summaries.get(_key(name, labels))
+        if summary is None:
+            summary = {"count": 0, "sum": 0.0, "max": 0.0, "recent": deque(maxlen=SUMMARY_WINDOW)}
+            _summaries[_key(name, labels)] = summary
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+        summary["recent"].append(value)
+
+
+def register_gauge(name: str, read: Callable[[], float]):
+    """Register a gauge whose current value is read at snapshot time"""
+    _gauges[name] = read
+
+
+def percentile(name: str, q: float, **labels) -> float:
+    """Return the q-th percentile (0-1) of recent observations, or 0.0 if none"""
+    with _lock:
+        summary = _summaries.get(_key(name, labels))
+        values = sorted(summary["recent"]) if summary else []
+    if not values:
+        return 0.0
+    return values[int(q * (len(values) - 1))]
+
+
+def _label_string(labels: tuple) -> str:
+    return ",".join(f"{k}={v}" for k, v in labels)
+
+
+def snapshot() -> dict:
+    """Return all metrics as a JSON-serializable dict"""
+    with _lock:
+        counters = {
+            f"{name}{{{_label_string(labels)}}}" if labels else name: value
+            for (name, labels), value in _counters.items()
+        }
+        summaries = {}
+        for (name, labels), summary in _summaries.items():
+            recent = sorted(summary["recent"])
+            summaries[f"{name}{{{_label_string(labels)}}}" if labels else name] = {
+                "count": summary["count"],
+                "avg": summary["sum"] / summary["count"],
+                "p50": recent[int(0.50 * (len(recent) - 1))],
+                "p95": recent[int(0.95 * (len(recent) - 1))],
+                "max": summary["max"],
+            }
+
+    gauges = {}
+    for name, read in _gauges.items():
+        try:
+            gauges[name] = read()
+        except Exception:
+            gauges[name] = None
+
+    return {"counters": counters, "gauges": gauges, "summaries": summaries}
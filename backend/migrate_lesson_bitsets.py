@@ -0,0 +1,97 @@
+"""
+Migrate enrollment progress from completed_lessons lists to completion bitsets
+==============================================================================
+1. Gives every lesson without one a stable per-course ordinal.
+2. Converts each enrollment's completed_lessons list into completed_bits /
+   completed_count and removes the list.
+
+Safe to re-run: lessons that already have an ordinal and enrollments that
+already have a bitset are left untouched.
+"""
+
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from dotenv import load_dotenv
+
+import lesson_bitset
+
+load_dotenv('.env')
+
+
+async def assign_ordinals(db, course_id: str) -> dict:
+    """Assign ordinals to lessons lacking one and return lesson_id -> ordinal"""
+    missing = await db.lessons.find(
+        {"course_id": course_id, "ordinal": None},
+        {"_id": 0, "id": 1}
+    ).sort([("created_at", 1), ("order", 1)]).to_list(None)
+
+    if missing:
+        course = await db.courses.find_one_and_update(
+            {"id": course_id},
+            {"$inc": {"next_lesson_ordinal": len(missing)}},
+            projection={"_id": 0, "next_lesson_ordinal": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if course:
+            start = course['next_lesson_ordinal'] - len(missing)
+            await db.lessons.bulk_write([
+                UpdateOne({"id": lesson['id'], "ordinal": None}, {"$set": {"ordinal": start + i}})
+                for i, lesson in enumerate(missing)
+            ], ordered=False)
+
+    lessons = await db.lessons.find(
+        {"course_id": course_id, "ordinal": {"$ne": None}},
+        {"_id": 0, "id": 1, "ordinal": 1}
+    ).to_list(None)
+    return {lesson['id']: lesson['ordinal'] for lesson in lessons}
+
+
+async def migrate():
+    print("Connecting to MongoDB...")
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    db_name = os.environ.get('DB_NAME', 'learnhub')
+
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    course_ids = await db.courses.distinct("id")
+    print(f"Found {len(course_ids)} courses")
+
+    migrated = 0
+    for course_id in course_ids:
+        ordinal_by_id = await assign_ordinals(db, course_id)
+
+        enrollments = await db.enrollments.find(
+            {"course_id": course_id, "completed_bits": {"$exists": False}},
+            {"_id": 0, "id": 1, "completed_lessons": 1}
+        ).to_list(None)
+        if not enrollments:
+            continue
+
+        operations = []
+        for enrollment in enrollments:
+            bits = lesson_bitset.from_ordinals(
+                ordinal_by_id[lesson_id]
+                for lesson_id in enrollment.get('completed_lessons') or []
+                if lesson_id in ordinal_by_id
+            )
+            operations.append(UpdateOne(
+                {"id": enrollment['id'], "completed_bits": {"$exists": False}},
+                {
+                    "$set": {"completed_bits": bits, "completed_count": lesson_bitset.popcount(bits)},
+                    "$unset": {"completed_lessons": ""}
+                }
+            ))
+
+        result = await db.enrollments.bulk_write(operations, ordered=False)
+        migrated += result.modified_count
+        print(f" -> Course {course_id}: {result.modified_count} enrollments converted")
+
+    print(f"\n✅ Migrated {migrated} enrollments to completion bitsets")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
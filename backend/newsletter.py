@@ -3,12 +3,16 @@ Newsletter system for BritSyncAI Academy
 Handles subscriptions, AI blog generation, and weekly email distribution
 """
 
-from pydantic import EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, ValidationError
+from pymongo import ReturnDocument
 from datetime import datetime, timezone
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
+import email_templates
+import asyncio
 import logging
+import uuid
 import re
 import os
 
@@ -24,6 +28,96 @@ def slugify(text: str) -> str:
     return text
 
 
+class BlogDraft(BaseModel):
+    """Structured output expected from the blog-writing LLM call"""
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+    title: str = Field(min_length=5, max_length=90)
+    excerpt: str = Field(min_length=20, max_length=300)
+    content: str = Field(min_length=200)
+
+
+BLOG_DRAFT_SYSTEM_MESSAGE = """You write blog posts for BritSyncAI Academy's weekly newsletter.
+Reply with a single JSON object and nothing else, with exactly these keys:
+- "title": a catchy, engaging title, at most 60 characters, no quotes
+- "excerpt": one or two plain-text sentences (max 250 characters) teasing the post
+- "content": the post body in Markdown with ## / ### headers, 400-500 words"""
+
+# Invalid JSON / schema violations get one corrective retry
+BLOG_DRAFT_ATTEMPTS = 2
+
+
+async def _instructor_name(db, course) -> str:
+    instructor = await db.instructors.find_one({"id": course.get('instructor_id')}, {"_id": 0, "user_id": 1})
+    if instructor:
+        user = await db.users.find_one({"id": instructor['user_id']}, {"_id": 0, "name": 1})
+        if user:
+            return user['name']
+    return "our expert instructor"
+
+
+async def draft_blog_post(db, course) -> BlogDraft:
+    """Write title, excerpt and body for a course in one structured LLM call"""
+    prompt = f"""Write a blog post about this online course in a friendly, motivational tone:
+
+Course Title: {course['title']}
+Description: {course.get('description', 'Learn essential skills')}
+Category: {course.get('category', 'General')}
+Instructor: {await _instructor_name(db, course)}
+
+The blog should:
+- Explain what students will learn and why it matters
+- Highlight the key benefits and outcomes
+- Include motivation for online learning
+- End with a subtle call-to-action to explore the course
+- Be SEO-friendly and engaging
+"""
+    chat = LlmChat(
+        api_key=os.environ.get('GROQ_API_KEY'),
+        session_id="newsletter-gen",
+        system_message=BLOG_DRAFT_SYSTEM_MESSAGE
+    ).with_model("groq", "llama-3.3-70b-versatile").with_tag("newsletter").with_json_output()
+    
+    for attempt in range(BLOG_DRAFT_ATTEMPTS):
+        raw = await chat.send_message(UserMessage(text=prompt))
+        try:
+            return BlogDraft.model_validate_json(_strip_code_fence(raw))
+        except ValidationError as e:
+            logger.warning(f"Blog draft for {course['id']} failed validation (attempt {attempt + 1}): {e}")
+            prompt += f"\n\nYour previous reply was rejected: {e.errors()[0]['msg']}. Reply with valid JSON only."
+    raise ValueError(f"No valid blog draft for course {course['id']}")
+
+
+def _strip_code_fence(text: str) -> str:
+    """Some models wrap JSON mode output in ```json fences anyway"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```[a-zA-Z]*\s*|\s*```$", "", text)
+    return text
+
+
+def _blog_doc(course, draft: BlogDraft, status: str, batch_id: str = None) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": str(uuid.uuid4()),
+        "title": draft.title.replace('"', ''),
+        "slug": slugify(draft.title),
+        "content": draft.content,
+        "content_html": email_templates.render_markdown(draft.content),
+        "excerpt": draft.excerpt,
+        "cover_image": course.get('thumbnail'),
+        "course_id": course['id'],
+        "author_id": course['instructor_id'],
+        "category": "Newsletter",
+        "status": status,
+        "draft_batch_id": batch_id,
+        "views": 0,
+        "sent_to_subscribers": False,
+        "email_sent_count": 0,
+        "published_at": now if status == "published" else None,
+        "created_at": now
+    }
+
+
 async def generate_weekly_blog(db):
     """Generate AI blog post about featured course"""
     try:
@@ -37,73 +131,14 @@ async def generate_weekly_blog(db):
             logger.info("No published courses found for blog generation")
             return None
         
-        # Get instructor name
-        instructor = await db.instructors.find_one({"id": popular_course.get('instructor_id')})
-        instructor_name = "our expert instructor"
-        if instructor:
-            user = await db.users.find_one({"id": instructor['user_id']})
-            instructor_name = user['name'] if user else instructor_name
-        
-        # Create AI prompt
-        prompt = f"""Write a 400-word blog post about this online course in a friendly, motivational tone:
-
-Course Title: {popular_course['title']}
-Description: {popular_course.get('description', 'Learn essential skills')}
-Category: {popular_course.get('category', 'General')}
-Instructor: {instructor_name}
-
-The blog should:
-- Explain what students will learn and why it matters
-- Highlight the key benefits and outcomes
-- Include motivation for online learning
-- End with a subtle call-to-action to explore the course
-- Be SEO-friendly and engaging
-- Use markdown formatting with headers (##, ###)
-
-Format: Markdown
-Length: 400-500 words
-"""
-        
-        # Call Groq AI
-        chat = LlmChat(
-            api_key=os.environ.get('GROQ_API_KEY'),
-            session_id="newsletter-gen"
-        ).with_model("groq", "llama-3.3-70b-versatile")
-        
-        content = await chat.send_message(UserMessage(text=prompt))
-        
-        # Generate title
-        title_prompt = f"Create a catchy, engaging blog post title (max 60 chars) about: {popular_course['title']}"
-        title_response = await chat.send_message(UserMessage(text=title_prompt))
-        title = title_response.strip().replace('"', '')
-        
-        # Create excerpt (first 150 chars)
-        excerpt = content[:150].strip() + "..."
-        
-        # Create blog post
-        blog_slug = slugify(title)
-        blog_doc = {
-            "id": str(__import__('uuid').uuid4()),
-            "title": title,
-            "slug": blog_slug,
-            "content": content,
-            "excerpt": excerpt,
-            "cover_image": popular_course.get('thumbnail'),
-            "course_id": popular_course['id'],
-            "author_id": popular_course['instructor_id'],
-            "category": "Newsletter",
-            "status": "published",
-            "views": 0,
-            "sent_to_subscribers": False,
-            "email_sent_count": 0,
-            "published_at": datetime.now(timezone.utc).isoformat(),
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
+        draft = await draft_blog_post(db, popular_course)
+        blog_doc = _blog_doc(popular_course, draft, "published")
         
         # Save to database
         await db.blog_posts.insert_one(blog_doc)
+        blog_doc.pop('_id', None)
         
-        logger.info(f"Generated blog post: {title}")
+        logger.info(f"Generated blog post: {blog_doc['title']}")
         return blog_doc
         
     except Exception as e:
@@ -111,86 +146,60 @@ Length: 400-500 words
         return None
 
 
+async def generate_blog_drafts(db, count: int = 3):
+    """Draft posts for several featured courses concurrently; an admin publishes one"""
+    courses = await db.courses.find(
+        {"status": "published", "is_featured": True},
+        {"_id": 0}
+    ).sort("created_at", -1).to_list(count)
+    if len(courses) < count:
+        # Top up with the latest published courses
+        others = await db.courses.find(
+            {"status": "published", "id": {"$nin": [c['id'] for c in courses]}},
+            {"_id": 0}
+        ).sort("created_at", -1).to_list(count - len(courses))
+        courses += others
+    if not courses:
+        logger.info("No published courses found for blog drafts")
+        return []
+    
+    results = await asyncio.gather(*(draft_blog_post(db, course) for course in courses), return_exceptions=True)
+    
+    batch_id = str(uuid.uuid4())
+    drafts = []
+    for course, result in zip(courses, results):
+        if isinstance(result, Exception):
+            logger.error(f"Blog draft for course {course['id']} failed: {result}")
+            continue
+        drafts.append(_blog_doc(course, result, "draft", batch_id))
+    
+    if drafts:
+        await db.blog_posts.insert_many(drafts)
+        for draft in drafts:
+            draft.pop('_id', None)
+    return drafts
+
+
+async def publish_blog_draft(db, draft_id: str):
+    """Publish one draft and discard the other drafts generated alongside it"""
+    now = datetime.now(timezone.utc).isoformat()
+    draft = await db.blog_posts.find_one_and_update(
+        {"id": draft_id, "status": "draft"},
+        {"$set": {"status": "published", "published_at": now}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if draft and draft.get('draft_batch_id'):
+        await db.blog_posts.delete_many({"draft_batch_id": draft['draft_batch_id'], "status": "draft"})
+    return draft
+
+
 async def send_newsletter_email(blog_post, subscriber_email, unsubscribe_token):
     """Send newsletter email to a single subscriber"""
     try:
         frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
-        course_url = f"{frontend_url}/courses/{blog_post['course_id']}" if blog_post.get('course_id') else frontend_url
-        unsubscribe_url = f"{frontend_url}/unsubscribe?token={unsubscribe_token}"
-        
-        # Create HTML email
-        html_content = f"""
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #1a202c; margin: 0; padding: 0; background-color: #f8fafc; }}
-        .wrapper {{ width: 100%; padding: 40px 0; background-color: #f8fafc; }}
-        .container {{ max-width: 600px; margin: 0 auto; background: #ffffff; border-radius: 24px; overflow: hidden; box-shadow: 0 10px 25px -5px rgba(0, 0, 0, 0.05); }}
-        .header {{ background: linear-gradient(135deg, #4f46e5 0%, #7c3aed 100%); padding: 50px 40px; text-align: center; color: white; }}
-        .header h1 {{ margin: 0; font-size: 32px; font-weight: 800; letter-spacing: -0.025em; }}
-        .header p {{ margin: 10px 0 0 0; opacity: 0.9; font-size: 16px; font-weight: 500; }}
-        .content {{ padding: 40px; }}
-        .content h2 {{ color: #1e293b; font-size: 24px; font-weight: 700; margin-top: 0; margin-bottom: 20px; line-height: 1.3; }}
-        .blog-image {{ width: 100%; border-radius: 16px; margin-bottom: 25px; box-shadow: 0 4px 12px rgba(0,0,0,0.08); }}
-        .text-content {{ color: #475569; font-size: 16px; line-height: 1.8; }}
-        .cta-container {{ text-align: center; margin-top: 40px; margin-bottom: 20px; }}
-        .cta-button {{ 
-            display: inline-block; 
-            background: linear-gradient(to r, #4f46e5, #7c3aed); 
-            color: #ffffff !important; 
-            padding: 16px 32px; 
-            text-decoration: none; 
-            border-radius: 14px; 
-            font-weight: 700; 
-            font-size: 16px;
-            box-shadow: 0 4px 15px rgba(79, 70, 229, 0.3);
-            transition: transform 0.2s ease;
-        }}
-        .footer {{ padding: 30px 40px; text-align: center; font-size: 13px; color: #94a3b8; background-color: #f8fafc; border-top: 1px solid #f1f5f9; }}
-        .footer a {{ color: #6366f1; text-decoration: none; font-weight: 600; }}
-        .badge {{ display: inline-block; padding: 6px 12px; border-radius: 99px; background: #eef2ff; color: #4f46e5; font-size: 12px; font-weight: 700; margin-bottom: 15px; text-transform: uppercase; letter-spacing: 0.05em; }}
-    </style>
-</head>
-<body>
-    <div class="wrapper">
-        <div class="container">
-            <div class="header">
-                <h1>BritSyncAI Academy</h1>
-                <p>Your Weekly Dose of Innovation</p>
-            </div>
-            
-            <div class="content">
-                <span class="badge">Weekly Newsletter</span>
-                <h2>{blog_post['title']}</h2>
-                
-                {f'<img src="{blog_post["cover_image"]}" alt="Course thumbnail" class="blog-image">' if blog_post.get('cover_image') else ''}
-                
-                <div class="text-content">
-                    {blog_post['content'].replace(chr(10), '<br>')}
-                </div>
-                
-                <div class="cta-container">
-                    <a href="{course_url}" class="cta-button">Access Today's Course →</a>
-                </div>
-            </div>
-            
-            <div class="footer">
-                <p>You are receiving this because you are part of the BritSyncAI Academy community.</p>
-                <p>
-                    <a href="{unsubscribe_url}">Unsubscribe</a> • 
-                    <a href="{frontend_url}">Visit Website</a> • 
-                    <a href="mailto:support@britsyncaiacademy.online">Support</a>
-                </p>
-                <p style="margin-top: 15px;">© 2026 BritSyncAI Academy. All rights reserved.</p>
-            </div>
-        </div>
-    </div>
-</body>
-</html>
-"""
+        # The document is rendered once per post; only the unsubscribe link differs per recipient
+        html_content = email_templates.render_newsletter(blog_post, frontend_url, unsubscribe_token)
         
         # Send via SendGrid
         api_key = os.environ.get('SENDGRID_API_KEY')
@@ -219,16 +228,6 @@ async def send_newsletter_email(blog_post, subscriber_email, unsubscribe_token):
 async def send_weekly_newsletter(db):
     """Send latest blog to all subscribers"""
     try:
-        # Get latest unsent blog post
-        blog = await db.blog_posts.find_one(
-            {"sent_to_subscribers": False, "category": "Newsletter"},
-            sort=[("published_at", -1)]
-        )
-        
-        if not blog:
-            logger.info("No new newsletter to send")
-            return {"message": "No newsletter to send", "sent": 0}
-        
         # Get all subscribed emails
         subscriptions = await db.email_subscriptions.find(
             {"subscribed": True}
@@ -238,6 +237,17 @@ async def send_weekly_newsletter(db):
             logger.info("No subscribers found")
             return {"message": "No subscribers", "sent": 0}
         
+        # Claim the latest unsent blog post up front, so a concurrent send can't pick it too
+        blog = await db.blog_posts.find_one_and_update(
+            {"sent_to_subscribers": False, "category": "Newsletter", "status": "published"},
+            {"$set": {"sent_to_subscribers": True, "send_started_at": datetime.now(timezone.utc).isoformat()}},
+            sort=[("published_at", -1)]
+        )
+        
+        if not blog:
+            logger.info("No new newsletter to send")
+            return {"message": "No newsletter to send", "sent": 0}
+        
         # Send to all subscribers
         sent_count = 0
         for subscription in subscriptions:
@@ -249,17 +259,13 @@ async def send_weekly_newsletter(db):
             if success:
                 sent_count += 1
         
-        # Mark as sent
         await db.blog_posts.update_one(
             {"id": blog['id']},
-            {"$set": {
-                "sent_to_subscribers": True,
-                "email_sent_count": sent_count
-            }}
+            {"$set": {"email_sent_count": sent_count}}
         )
         
         logger.info(f"Newsletter sent to {sent_count}/{len(subscriptions)} subscribers")
-        return {"message": f"Sent to {sent_count} subscribers", "sent": sent_count}
+        return {"message": f"Sent to {sent_count} subscribers", "sent": sent_count, "blog_id": blog['id']}
         
     except Exception as e:
         logger.error(f"Failed to send newsletter: {e}")
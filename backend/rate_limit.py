@@ -0,0 +1,112 @@
+"""
+Token-bucket rate limiting for the AI endpoints
+Each (user, endpoint) pair gets two buckets: one for requests and one for LLM
+tokens. The token bucket is charged after the call with the usage the
+provider reported, so a user who burns through their budget is throttled
+until it refills. Buckets are per process.
+"""
+
+from cachetools import TTLCache
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RoleLimits:
+    requests_per_minute: float
+    burst: int
+    tokens_per_hour: int
+
+
+DEFAULT_ROLE_LIMITS: Dict[str, RoleLimits] = {
+    "student": RoleLimits(requests_per_minute=6, burst=10, tokens_per_hour=40000),
+    "instructor": RoleLimits(requests_per_minute=12, burst=20, tokens_per_hour=120000),
+    "admin": RoleLimits(requests_per_minute=60, burst=60, tokens_per_hour=500000),
+}
+
+
+def load_role_limits() -> Dict[str, RoleLimits]:
+    """Defaults overridden per role by AI_RATE_LIMITS, e.g. '{"student": {"tokens_per_hour": 20000}}'"""
+    limits = {role: RoleLimits(**asdict(value)) for role, value in DEFAULT_ROLE_LIMITS.items()}
+    raw = os.environ.get("AI_RATE_LIMITS")
+    if not raw:
+        return limits
+    try:
+        for role, overrides in json.loads(raw).items():
+            base = asdict(limits.get(role, DEFAULT_ROLE_LIMITS["student"]))
+            base.update(overrides)
+            limits[role] = RoleLimits(**base)
+    except (ValueError, TypeError) as e:
+        logger.error(f"Ignoring invalid AI_RATE_LIMITS: {e}")
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate  # tokens per second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float) -> float:
+        """Seconds until `cost` tokens are available (0 if they are now)"""
+        self._refill()
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float):
+        self._refill()
+        self.tokens -= cost  # may go negative when charging actual usage
+
+
+class RateLimiter:
+    """Per-user, per-endpoint request and LLM-token budgets"""
+
+    def __init__(self, limits: Optional[Dict[str, RoleLimits]] = None):
+        self.limits = limits or load_role_limits()
+        # A bucket idle for an hour is full again anyway, so it can be forgotten
+        self._buckets: TTLCache = TTLCache(maxsize=100000, ttl=3600)
+
+    def _limits(self, role: str) -> RoleLimits:
+        return self.limits.get(role, self.limits["student"])
+
+    def _bucket(self, kind: str, user_id: str, role: str, endpoint: str) -> TokenBucket:
+        key = (kind, user_id, endpoint)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limits = self._limits(role)
+            if kind == "requests":
+                bucket = TokenBucket(limits.burst, limits.requests_per_minute / 60)
+            else:
+                bucket = TokenBucket(limits.tokens_per_hour, limits.tokens_per_hour / 3600)
+        # Re-inserting refreshes the TTL
+        self._buckets[key] = bucket
+        return bucket
+
+    def acquire(self, user_id: str, role: str, endpoint: str) -> float:
+        """Admit one request, or return the seconds to wait before retrying"""
+        requests = self._bucket("requests", user_id, role, endpoint)
+        tokens = self._bucket("tokens", user_id, role, endpoint)
+        # The token budget only has to be non-negative to start a call
+        wait = max(requests.wait_time(1), tokens.wait_time(0))
+        if wait > 0:
+            return wait
+        requests.take(1)
+        return 0.0
+
+    def charge_tokens(self, user_id: str, role: str, endpoint: str, used_tokens: int):
+        """Deduct the tokens a finished call actually used"""
+        if used_tokens > 0:
+            self._bucket("tokens", user_id, role, endpoint).take(used_tokens)
@@ -0,0 +1,297 @@
+"""
+In-process job scheduler for BritSyncAI Academy
+Jobs run on 5-field cron schedules (UTC). Every replica runs the scheduler,
+but a job only executes on the replica that wins its lease document in
+job_leases, and every execution is recorded in job_runs.
+
+A job's next slot is claimed together with the lease, so a replica that dies
+mid-run does not cause a re-run before the following slot (at-most-once per
+slot, which is what the newsletter send needs).
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_POLL_SECONDS = float(os.environ.get("SCHEDULER_POLL_SECONDS", 30))
+DEFAULT_LEASE_SECONDS = 300
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _parse_field(spec: str, low: int, high: int) -> frozenset:
+    values = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid step in '{spec}'")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"'{spec}' is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """Standard 5-field cron expression: minute hour day-of-month month day-of-week"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: '{expression}'")
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        # Cron weekdays run Sunday=0 (or 7) to Saturday=6
+        self.weekdays = frozenset(day % 7 for day in _parse_field(fields[4], 0, 7))
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        # Cron ORs the two day fields when both are restricted
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after `moment`"""
+        candidate = moment.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never fires: '{self.expression}'")
+
+
+@dataclass
+class Job:
+    name: str
+    schedule: str
+    func: Callable[[], Awaitable[Optional[dict]]]
+    description: str = ""
+    lease_seconds: int = DEFAULT_LEASE_SECONDS
+
+
+def load_job_schedules(jobs: List[Job]) -> Dict[str, CronSchedule]:
+    """Default schedules overridden by JOB_SCHEDULES, e.g. '{"newsletter-send": "0 10 * * 2"}'"""
+    expressions = {job.name: job.schedule for job in jobs}
+    raw = os.environ.get("JOB_SCHEDULES")
+    if raw:
+        try:
+            overrides = json.loads(raw)
+            expressions.update({name: expr for name, expr in overrides.items() if name in expressions})
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Ignoring invalid JOB_SCHEDULES: {e}")
+
+    schedules = {}
+    for name, expression in expressions.items():
+        try:
+            schedules[name] = CronSchedule(expression)
+        except ValueError as e:
+            default = next(job.schedule for job in jobs if job.name == name)
+            logger.error(f"Invalid schedule for job {name}, using '{default}': {e}")
+            schedules[name] = CronSchedule(default)
+    return schedules
+
+
+class JobScheduler:
+    """Runs jobs on their schedules, coordinating replicas through Mongo leases"""
+
+    def __init__(self, db, jobs: List[Job], poll_seconds: float = SCHEDULER_POLL_SECONDS):
+        self.db = db
+        self.jobs = {job.name: job for job in jobs}
+        self.schedules = load_job_schedules(jobs)
+        self.poll_seconds = poll_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._loop: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        now = datetime.now(timezone.utc)
+        for name, schedule in self.schedules.items():
+            # Only the first replica ever seeds the lease; the schedule may have changed since
+            await self.db.job_leases.update_one(
+                {"_id": name},
+                {"$setOnInsert": {"owner": None, "lease_until": _EPOCH, "next_run_at": schedule.next_after(now)}},
+                upsert=True
+            )
+            await self.db.job_leases.update_one(
+                {"_id": name, "schedule": {"$ne": schedule.expression}},
+                {"$set": {"schedule": schedule.expression, "next_run_at": schedule.next_after(now)}}
+            )
+        self._loop = asyncio.create_task(self._run_loop())
+        logger.info(f"Job scheduler started as {self.owner} with {len(self.jobs)} jobs")
+
+    async def stop(self):
+        tasks = [task for task in [self._loop, *self._running.values()] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_loop(self):
+        while True:
+            try:
+                await self._tick()
+            except Exception as e:
+                logger.error(f"Job scheduler tick failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _tick(self):
+        now = datetime.now(timezone.utc)
+        for name in self.jobs:
+            if name in self._running:
+                continue
+            lease = await self._acquire(name, now, due_only=True)
+            if lease:
+                await self._start_run(name, "schedule", lease['next_run_at'])
+
+    async def _acquire(self, name: str, now: datetime, due_only: bool) -> Optional[dict]:
+        """Take the job's lease if it is free; returns the lease as it was before"""
+        query = {"_id": name, "lease_until": {"$lte": now}}
+        update = {"owner": self.owner, "lease_until": now + timedelta(seconds=self.jobs[name].lease_seconds)}
+        if due_only:
+            query["next_run_at"] = {"$lte": now}
+            update["next_run_at"] = self.schedules[name].next_after(now)
+        return await self.db.job_leases.find_one_and_update(
+            query, {"$set": update}, return_document=ReturnDocument.BEFORE
+        )
+
+    async def _start_run(self, name: str, trigger: str, scheduled_for: Optional[datetime] = None) -> dict:
+        run = {
+            "id": str(uuid.uuid4()),
+            "job": name,
+            "trigger": trigger,
+            "owner": self.owner,
+            "status": "running",
+            "scheduled_for": scheduled_for,
+            "started_at": datetime.now(timezone.utc),
+            "finished_at": None,
+            "duration_seconds": None,
+            "result": None,
+            "error": None,
+        }
+        await self.db.job_runs.insert_one(run)
+        run.pop('_id', None)
+        task = asyncio.create_task(self._execute(name, run['id']))
+        self._running[name] = task
+        task.add_done_callback(lambda _: self._running.pop(name, None))
+        return run
+
+    async def _heartbeat(self, name: str):
+        lease_seconds = self.jobs[name].lease_seconds
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            await self.db.job_leases.update_one(
+                {"_id": name, "owner": self.owner},
+                {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)}}
+            )
+
+    async def _execute(self, name: str, run_id: str):
+        started = time.perf_counter()
+        heartbeat = asyncio.create_task(self._heartbeat(name))
+        status, result, error = "succeeded", None, None
+        try:
+            result = await self.jobs[name].func()
+        except asyncio.CancelledError:
+            status, error = "cancelled", "Scheduler stopped"
+            raise
+        except Exception as e:
+            logger.error(f"Job {name} failed: {e}")
+            status, error = "failed", str(e)
+        finally:
+            heartbeat.cancel()
+            duration = time.perf_counter() - started
+            metrics.inc("job_runs", job=name, status=status)
+            metrics.observe("job_duration_seconds", duration, job=name)
+            finished = datetime.now(timezone.utc)
+            await asyncio.shield(self._finish(name, run_id, {
+                "status": status,
+                "result": result,
+                "error": error,
+                "finished_at": finished,
+                "duration_seconds": round(duration, 3),
+            }))
+
+    async def _finish(self, name: str, run_id: str, outcome: dict):
+        try:
+            await self.db.job_runs.update_one({"id": run_id}, {"$set": outcome})
+            await self.db.job_leases.update_one(
+                {"_id": name, "owner": self.owner},
+                {"$set": {
+                    "owner": None,
+                    "lease_until": _EPOCH,
+                    "last_status": outcome['status'],
+                    "last_finished_at": outcome['finished_at'],
+                }}
+            )
+        except Exception as e:
+            logger.error(f"Could not record the end of job {name}: {e}")
+
+    async def trigger(self, name: str) -> Optional[dict]:
+        """Run a job now, outside its schedule; None when another run holds the lease"""
+        if name in self._running:
+            return None
+        lease = await self._acquire(name, datetime.now(timezone.utc), due_only=False)
+        if lease is None:
+            return None
+        return await self._start_run(name, "manual")
+
+    async def status(self) -> List[dict]:
+        leases = {
+            lease['_id']: lease
+            for lease in await self.db.job_leases.find({"_id": {"$in": list(self.jobs)}}).to_list(None)
+        }
+        now = datetime.now(timezone.utc)
+        jobs = []
+        for name, job in self.jobs.items():
+            lease = leases.get(name, {})
+            lease_until = lease.get('lease_until')
+            if lease_until is not None and lease_until.tzinfo is None:
+                lease_until = lease_until.replace(tzinfo=timezone.utc)
+            jobs.append({
+                "name": name,
+                "description": job.description,
+                "schedule": self.schedules[name].expression,
+                "next_run_at": lease.get('next_run_at'),
+                "running_on": lease.get('owner') if lease_until and lease_until > now else None,
+                "last_status": lease.get('last_status'),
+                "last_finished_at": lease.get('last_finished_at'),
+            })
+        return jobs
+
+    async def history(self, name: Optional[str] = None, limit: int = 50) -> List[dict]:
+        query = {"job": name} if name else {}
+        return await self.db.job_runs.find(query, {"_id": 0}).sort("started_at", -1).to_list(limit)
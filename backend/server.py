@@ -1,18 +1,26 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, BackgroundTasks, File, UploadFile
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse, RedirectResponse, Response
+from fastapi.responses import RedirectResponse, Response, StreamingResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from cachetools import TTLCache, LRUCache
 import os
 import json
+import contextlib
+import asyncio
+import hashlib
 import tempfile
-import shutil
 import traceback
 
 import logging
 import re
+import time
+import math
 from pathlib import Path
+from urllib.parse import quote
 from dotenv import load_dotenv
 import bcrypt
 import dns.resolver
@@ -32,25 +40,34 @@ except Exception as e:
 # Load environment variables IMMEDIATELY
 load_dotenv()
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Awaitable
 import uuid
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 from jose import jwt, JWTError
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from emergentintegrations.llm.chat import LlmChat, UserMessage, LlmUnavailableError, aclose_clients, add_call_sink
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail  
 import base64
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.units import inch
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import Paragraph
 import io
+import zipfile
 import stripe
 import newsletter  # Newsletter module for weekly emails
+import email_templates  # Precompiled Jinja2 email templates
+import uploads  # Chunked, content-addressed upload storage
+import chat_memory  # Token-bounded conversation memory for AI sessions
+from answer_cache import AnswerCache, is_standalone
+from tutor_retrieval import TutorRetrieval
+from rate_limit import RateLimiter
+from llm_usage import LlmUsageRecorder
+from scheduler import Job, JobScheduler
+from media import MediaWorkers, ThumbnailProcessor, PdfProcessor, course_thumbnail_fields, lesson_pdf_fields
+import lesson_bitset  # Compact per-enrollment lesson completion bitsets
+import metrics  # In-process metrics registry
+from certificates import (
+    CertificateRenderService, CertificateQueueFull, sign_certificate, verify_certificate_token
+)
 # Bcrypt compatibility patch for passlib
 import bcrypt
 if not hasattr(bcrypt, "__about__"):
@@ -104,6 +121,23 @@ PDF_DIR = UPLOAD_DIR / "pdfs"
 THUMBNAIL_DIR.mkdir(parents=True, exist_ok=True)
 PDF_DIR.mkdir(parents=True, exist_ok=True)
 
+# Partial resumable uploads live outside the public /uploads mount until finalized
+RESUMABLE_UPLOAD_DIR = Path(
+    os.environ.get("RESUMABLE_UPLOAD_DIR", Path(tempfile.gettempdir()) / "learnhub_resumable")
+)
+
+# Rendered certificate PDFs are cached outside the public /uploads mount
+CERTIFICATE_CACHE_DIR = Path(
+    os.environ.get("CERTIFICATE_CACHE_DIR", Path(tempfile.gettempdir()) / "learnhub_certificates")
+)
+CERTIFICATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Resized WebP/JPEG thumbnail variants and LQIP placeholders (see media.py)
+media_workers = MediaWorkers()
+thumbnail_processor = ThumbnailProcessor(media_workers, THUMBNAIL_DIR, "/uploads/thumbnails/variants")
+# Lesson PDF validation, page count, text and first-page previews
+pdf_processor = PdfProcessor(media_workers, PDF_DIR, "/uploads/pdfs/previews")
+
 # Create the main app
 app = FastAPI(title="BritSyncAI Academy API")
 
@@ -126,6 +160,51 @@ origin_regex = os.environ.get(
     r"^https://([a-z0-9-]+\.)?britsyncaiacademy\.online$"
 )
 
+class UploadSizeLimit:
+    """Bound request bodies of the multipart upload routes before Starlette parses and spools them.
+    A larger declared Content-Length is refused outright; a body without one is cut off
+    as soon as it passes the limit."""
+    
+    # Boundaries and part headers around the file
+    MULTIPART_OVERHEAD_BYTES = 64 * 1024
+    
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+    
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        detail = str(uploads.UploadTooLarge(limit))
+        limit += self.MULTIPART_OVERHEAD_BYTES
+        
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > limit:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+
+# Added before CORS so that its 413s still carry CORS headers
+app.add_middleware(UploadSizeLimit, limits={
+    "/api/upload/thumbnail": uploads.MAX_THUMBNAIL_BYTES,
+    "/api/upload/lesson-pdf": uploads.MAX_LESSON_PDF_BYTES,
+})
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -175,6 +254,12 @@ JWT_SECRET = os.environ.get("JWT_SECRET", "your-secret-key")
 JWT_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 1 week
 
+# Certificate signatures (falls back to the JWT secret when no dedicated key is set)
+CERTIFICATE_SIGNING_KEY = os.environ.get("CERTIFICATE_SIGNING_KEY", JWT_SECRET).encode("utf-8")
+CERTIFICATE_VERIFY_URL = os.environ.get(
+    "CERTIFICATE_VERIFY_URL", "https://britsyncaiacademy.online/api/certificates/verify"
+).rstrip("/")
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
@@ -250,6 +335,11 @@ class Course(BaseModel):
     meta_description: Optional[str] = None
     drip_content: bool = False
     is_featured: bool = False
+    lessons_count: int = 0  # Maintained by lesson/section writes
+    curriculum_version: int = 0  # Bumped on every curriculum change
+    thumbnail_srcset: Optional[Dict[str, str]] = None  # {"webp": ..., "jpeg": ...}, set by thumbnail processing
+    thumbnail_lqip: Optional[str] = None  # Tiny blurred data URI shown while the thumbnail loads
+    thumbnail_status: Optional[str] = None  # "ready", "failed" or "missing"; None until processed
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
@@ -274,8 +364,11 @@ class Lesson(BaseModel):
     content_text: Optional[str] = None
     description: Optional[str] = None  # Lesson description/details
     notes_url: Optional[str] = None # Added for supplementary reading materials
+    content_pdf: Optional[Dict[str, Any]] = None  # Page count / preview of the content PDF, set by processing
+    notes_pdf: Optional[Dict[str, Any]] = None  # Same for notes_url
     duration: Optional[int] = None  # in minutes
     order: int = 0
+    ordinal: Optional[int] = None  # Stable per-course index into completion bitsets
     is_preview: bool = False  # Can be previewed without enrollment
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -301,11 +394,17 @@ class Enrollment(BaseModel):
     user_id: str
     course_id: str
     progress: float = 0.0  # 0-100
-    completed_lessons: List[str] = []  # List of completed lesson IDs
+    completed_count: int = 0  # Completed lessons live in the completed_bits bitset
     status: str = "active"  # active, completed
     enrolled_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class ProgressSyncRequest(BaseModel):
+    """Batched progress from the player, e.g. replayed after reconnecting"""
+    completed_lessons: List[str] = []
+    watch_positions: Dict[str, float] = {}  # lesson_id -> seconds watched
+
+
 class Quiz(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -316,6 +415,22 @@ class Quiz(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class StudentCourseState(BaseModel):
+    """Materialized certificate-eligibility state, one per enrollment"""
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    course_id: str
+    enrollment_id: str
+    progress: float = 0.0
+    passed_quiz_ids: List[str] = []
+    quizzes_passed: int = 0
+    quizzes_required: int = 0
+    eligible: bool = False
+    certificate_id: Optional[str] = None
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
 class QuizResult(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -430,6 +545,16 @@ class ResetPasswordRequest(BaseModel):
     new_password: str
 
 
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
+    sha256: Optional[str] = Field(default=None, pattern=r"^[0-9a-fA-F]{64}$")
+
+
+class ResumableUploadFinalize(BaseModel):
+    sha256: Optional[str] = Field(default=None, pattern=r"^[0-9a-fA-F]{64}$")
+
+
 # ==================== UTILITIES ====================
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -456,67 +581,7 @@ async def send_welcome_email(email: str, name: str):
             logger.warning("SendGrid configuration missing. Skipping welcome email.")
             return
 
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #1a202c; margin: 0; padding: 0; background-color: #f8fafc; }}
-                .wrapper {{ width: 100%; padding: 40px 0; background-color: #f8fafc; }}
-                .container {{ max-width: 600px; margin: 0 auto; background: #ffffff; border-radius: 20px; overflow: hidden; box-shadow: 0 10px 25px -5px rgba(0, 0, 0, 0.05); }}
-                .header {{ background: linear-gradient(135deg, #4f46e5 0%, #7c3aed 100%); padding: 50px 20px; text-align: center; color: white; }}
-                .header h1 {{ margin: 0; font-size: 32px; font-weight: 800; letter-spacing: -0.025em; }}
-                .content {{ padding: 40px; text-align: center; }}
-                .content h2 {{ color: #1e293b; font-size: 24px; margin-bottom: 20px; }}
-                .content p {{ font-size: 16px; color: #475569; margin-bottom: 30px; line-height: 1.8; }}
-                .features {{ display: flex; flex-wrap: wrap; justify-content: center; gap: 15px; margin-bottom: 35px; }}
-                .feature-tag {{ background: #f1f5f9; color: #4f46e5; padding: 8px 16px; border-radius: 99px; font-size: 14px; font-weight: 600; }}
-                .button-container {{ margin: 35px 0; }}
-                .button {{ 
-                    background: linear-gradient(to r, #4f46e5, #7c3aed); 
-                    color: #ffffff !important; 
-                    padding: 16px 36px; 
-                    text-decoration: none; 
-                    border-radius: 14px; 
-                    font-weight: 700; 
-                    font-size: 16px;
-                    display: inline-block;
-                    box-shadow: 0 4px 15px rgba(79, 70, 229, 0.3);
-                }}
-                .footer {{ padding: 30px; text-align: center; font-size: 13px; color: #94a3b8; background-color: #f8fafc; border-top: 1px solid #f1f5f9; }}
-                .footer a {{ color: #6366f1; text-decoration: none; font-weight: 600; }}
-            </style>
-        </head>
-        <body>
-            <div class="wrapper">
-                <div class="container">
-                    <div class="header">
-                        <h1>BritSyncAI Academy</h1>
-                    </div>
-                    <div class="content">
-                        <h2>Welcome to the Future of Learning, {name}! 🚀</h2>
-                        <p>We're thrilled to have you join our global community of innovators and lifelong learners. Get ready to master industry-leading skills with our AI-powered courses.</p>
-                        
-                        <div class="features">
-                            <span class="feature-tag">AI Tutors</span>
-                            <span class="feature-tag">Verified Certificates</span>
-                            <span class="feature-tag">Expert Mentors</span>
-                        </div>
-
-                        <div class="button-container">
-                            <a href="{frontend_url}/courses" class="button">Explore Courses</a>
-                        </div>
-                        <p style="font-size: 14px; color: #94a3b8;">Need help getting started? Our support team is always here for you.</p>
-                    </div>
-                    <div class="footer">
-                        <p>© 2026 BritSyncAI Academy. All rights reserved.</p>
-                        <p><a href="{frontend_url}">Visit Platform</a> • <a href="mailto:support@britsyncaiacademy.online">Contact Support</a></p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        html_content = email_templates.render_welcome(name, frontend_url)
 
         message = Mail(
             from_email=sender,
@@ -548,60 +613,7 @@ async def send_reset_email(email: str, token: str):
             logger.info(f"DEVELOPMENT RESET LINK: {reset_link}")
             return
 
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #1a202c; margin: 0; padding: 0; background-color: #f7fafc; }}
-                .wrapper {{ width: 100%; padding: 40px 0; background-color: #f7fafc; }}
-                .container {{ max-width: 600px; margin: 0 auto; background: #ffffff; border-radius: 16px; overflow: hidden; shadow: 0 4px 6px rgba(0,0,0,0.05); }}
-                .header {{ background: linear-gradient(135deg, #4f46e5 0%, #7c3aed 100%); padding: 40px 20px; text-align: center; color: white; }}
-                .header h1 {{ margin: 0; font-size: 28px; font-weight: 800; letter-spacing: -0.025em; }}
-                .content {{ padding: 40px; text-align: center; }}
-                .content p {{ font-size: 16px; color: #4a5568; margin-bottom: 30px; }}
-                .button-container {{ margin: 35px 0; }}
-                .button {{ 
-                    background-color: #4f46e5; 
-                    color: #ffffff !important; 
-                    padding: 16px 32px; 
-                    text-decoration: none; 
-                    border-radius: 12px; 
-                    font-weight: 700; 
-                    font-size: 16px;
-                    display: inline-block;
-                    transition: all 0.2s ease;
-                    box-shadow: 0 4px 12px rgba(79, 70, 229, 0.3);
-                }}
-                .footer {{ padding: 30px; text-align: center; font-size: 13px; color: #a0aec0; background-color: #f8fafc; }}
-                .footer a {{ color: #4f46e5; text-decoration: none; font-weight: 600; }}
-                .divider {{ height: 1px; background-color: #edf2f7; margin: 0 40px; }}
-            </style>
-        </head>
-        <body>
-            <div class="wrapper">
-                <div class="container">
-                    <div class="header">
-                        <h1>BritSyncAI Academy</h1>
-                    </div>
-                    <div class="content">
-                        <h2 style="color: #2d3748; font-size: 22px; margin-bottom: 20px;">Reset Your Password</h2>
-                        <p>We received a request to reset your password. Click the button below to set a new one. This link will expire in 1 hour.</p>
-                        <div class="button-container">
-                            <a href="{reset_link}" class="button">Reset Password</a>
-                        </div>
-                        <p style="font-size: 14px; color: #718096;">If you didn't request this, you can safely ignore this email.</p>
-                    </div>
-                    <div class="divider"></div>
-                    <div class="footer">
-                        <p>© 2026 BritSyncAI Academy. All rights reserved.</p>
-                        <p><a href="{frontend_url}">Visit our website</a> | <a href="mailto:support@britsyncaiacademy.online">Contact Support</a></p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        html_content = email_templates.render_password_reset(reset_link, frontend_url)
 
         message = Mail(
             from_email=sender,
@@ -667,6 +679,280 @@ async def check_enrollment_status(user_id: str, course_id: str) -> bool:
     return enrollment is not None
 
 
+# Lesson totals change only when the curriculum is edited, so progress math reads
+# them from a short-lived cache instead of counting lessons on every completion.
+# Entries are dropped locally on edits; the TTL bounds staleness across replicas.
+_lessons_count_cache: TTLCache = TTLCache(maxsize=4096, ttl=60)
+# Lesson ordinals are immutable, so lesson_id -> (course_id, ordinal) is cached indefinitely.
+_lesson_ordinal_cache: LRUCache = LRUCache(maxsize=50000)
+# Upper bound on lessons + watch positions accepted by one progress sync
+PROGRESS_SYNC_MAX_ITEMS = 500
+# AI tutor system-prompt context per course, stored with the curriculum_version it was
+# built from. Dropped locally on course/lesson edits; the TTL bounds staleness across replicas.
+_tutor_context_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
+
+async def resolve_lessons_count(course: dict) -> int:
+    """Return the cached lesson counter of a course document, seeding it for legacy courses."""
+    if 'lessons_count' in course:
+        return course['lessons_count']
+    total = await db.lessons.count_documents({"course_id": course['id']})
+    await db.courses.update_one(
+        {"id": course['id'], "lessons_count": {"$exists": False}},
+        {"$set": {"lessons_count": total, "curriculum_version": course.get('curriculum_version', 0)}}
+    )
+    return total
+
+
+async def get_course_lessons_count(course_id: str) -> int:
+    """Return the number of lessons in a course, served from the per-course cache."""
+    cached = _lessons_count_cache.get(course_id)
+    if cached is not None:
+        return cached
+    course = await db.courses.find_one(
+        {"id": course_id},
+        {"_id": 0, "id": 1, "lessons_count": 1, "curriculum_version": 1}
+    )
+    total = await resolve_lessons_count(course) if course else 0
+    _lessons_count_cache[course_id] = total
+    return total
+
+
+async def bump_curriculum(course_id: str, lessons_delta: int = 0) -> int:
+    """Apply a lesson-count delta to a course, bump its curriculum version and return the new version"""
+    course = await db.courses.find_one_and_update(
+        {"id": course_id, "lessons_count": {"$exists": True}},
+        {"$inc": {"lessons_count": lessons_delta, "curriculum_version": 1}},
+        projection={"_id": 0, "curriculum_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if course is None:
+        # Legacy course without counters: seed them from the lessons collection
+        total = await db.lessons.count_documents({"course_id": course_id})
+        course = await db.courses.find_one_and_update(
+            {"id": course_id},
+            {"$set": {"lessons_count": total}, "$inc": {"curriculum_version": 1}},
+            projection={"_id": 0, "curriculum_version": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    invalidate_lessons_count(course_id)
+    invalidate_tutor_context(course_id)
+    return course['curriculum_version'] if course else 0
+
+
+def invalidate_lessons_count(course_id: str):
+    _lessons_count_cache.pop(course_id, None)
+
+
+def invalidate_tutor_context(course_id: str):
+    _tutor_context_cache.pop(course_id, None)
+    tutor_answer_cache.invalidate(course_id)
+
+
+async def allocate_lesson_ordinal(course_id: str) -> int:
+    """Reserve the next stable lesson ordinal of a course"""
+    course = await db.courses.find_one_and_update(
+        {"id": course_id},
+        {"$inc": {"next_lesson_ordinal": 1}},
+        projection={"_id": 0, "next_lesson_ordinal": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return course['next_lesson_ordinal'] - 1
+
+
+async def assign_lesson_ordinals(course_id: str):
+    """Give lessons created before ordinals existed a stable ordinal"""
+    missing = await db.lessons.find(
+        {"course_id": course_id, "ordinal": None},
+        {"_id": 0, "id": 1}
+    ).sort([("created_at", 1), ("order", 1)]).to_list(None)
+    if not missing:
+        return
+    
+    course = await db.courses.find_one_and_update(
+        {"id": course_id},
+        {"$inc": {"next_lesson_ordinal": len(missing)}},
+        projection={"_id": 0, "next_lesson_ordinal": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not course:
+        return
+    start = course['next_lesson_ordinal'] - len(missing)
+    # Guard on a missing ordinal so a concurrent run never renumbers a lesson
+    await db.lessons.bulk_write([
+        UpdateOne({"id": lesson['id'], "ordinal": None}, {"$set": {"ordinal": start + i}})
+        for i, lesson in enumerate(missing)
+    ], ordered=False)
+
+
+async def get_lesson_ordinal(lesson_id: str) -> Optional[tuple]:
+    """Return (course_id, ordinal) for a lesson, or None if it does not exist"""
+    cached = _lesson_ordinal_cache.get(lesson_id)
+    if cached is not None:
+        return cached
+    
+    projection = {"_id": 0, "course_id": 1, "ordinal": 1}
+    lesson = await db.lessons.find_one({"id": lesson_id}, projection)
+    if not lesson:
+        return None
+    if lesson.get('ordinal') is None:
+        await assign_lesson_ordinals(lesson['course_id'])
+        lesson = await db.lessons.find_one({"id": lesson_id}, projection)
+    
+    entry = (lesson['course_id'], lesson['ordinal'])
+    _lesson_ordinal_cache[lesson_id] = entry
+    return entry
+
+
+async def lesson_ids_to_bits(course_id: str, lesson_ids: List[str]) -> bytes:
+    """Encode a list of lesson IDs of a course as a completion bitset"""
+    if not lesson_ids:
+        return b""
+    query = {"course_id": course_id, "id": {"$in": list(lesson_ids)}}
+    lessons = await db.lessons.find(query, {"_id": 0, "ordinal": 1}).to_list(None)
+    if any(lesson.get('ordinal') is None for lesson in lessons):
+        await assign_lesson_ordinals(course_id)
+        lessons = await db.lessons.find(query, {"_id": 0, "ordinal": 1}).to_list(None)
+    return lesson_bitset.from_ordinals(lesson['ordinal'] for lesson in lessons)
+
+
+async def bits_to_lesson_ids(course_id: str, bits: Optional[bytes]) -> List[str]:
+    """Decode a completion bitset back into lesson IDs"""
+    ordinals = lesson_bitset.to_ordinals(bits)
+    if not ordinals:
+        return []
+    lessons = await db.lessons.find(
+        {"course_id": course_id, "ordinal": {"$in": ordinals}},
+        {"_id": 0, "id": 1}
+    ).sort("ordinal", 1).to_list(None)
+    return [lesson['id'] for lesson in lessons]
+
+
+async def load_completion_bits(enrollment: dict) -> bytes:
+    """Return an enrollment's completion bitset, converting a legacy completed_lessons list"""
+    if 'completed_bits' in enrollment:
+        return lesson_bitset.normalize(enrollment['completed_bits'])
+    return await lesson_ids_to_bits(enrollment['course_id'], enrollment.get('completed_lessons') or [])
+
+
+async def reconcile_course_progress(course_id: str) -> int:
+    """
+    Recompute stored progress for every enrollment of a course.
+    All completion bitsets of the course are read in one query, masked to the
+    lessons that still exist, and drifted enrollments are fixed with one
+    bulk_write, so curriculum edits never turn dashboard reads into writes.
+    """
+    try:
+        await assign_lesson_ordinals(course_id)
+        lessons = await db.lessons.find(
+            {"course_id": course_id},
+            {"_id": 0, "id": 1, "ordinal": 1}
+        ).to_list(None)
+        total = len(lessons)
+        live_mask = lesson_bitset.from_ordinals(lesson['ordinal'] for lesson in lessons)
+        ordinal_by_id = {lesson['id']: lesson['ordinal'] for lesson in lessons}
+        
+        fields = {"_id": 0, "id": 1, "user_id": 1, "progress": 1, "status": 1, "completed_bits": 1, "completed_lessons": 1}
+        pending = await db.enrollments.find({"course_id": course_id}, fields).to_list(None)
+        
+        landed = []
+        while pending:
+            operations = []
+            planned = []
+            for enrollment in pending:
+                if 'completed_bits' in enrollment:
+                    stored_bits = lesson_bitset.normalize(enrollment['completed_bits'])
+                else:
+                    stored_bits = lesson_bitset.from_ordinals(
+                        ordinal_by_id[lesson_id]
+                        for lesson_id in enrollment.get('completed_lessons') or []
+                        if lesson_id in ordinal_by_id
+                    )
+                # Bits of deleted lessons are dropped so they no longer count
+                bits = lesson_bitset.intersect(stored_bits, live_mask)
+                completed_count = lesson_bitset.popcount(bits)
+                actual = min(100, (completed_count / total) * 100) if total > 0 else 0
+                expected_status = 'completed' if actual >= 100 else 'active'
+                
+                if (
+                    'completed_bits' not in enrollment
+                    or bits != stored_bits
+                    or abs(actual - enrollment.get('progress', 0)) > 1
+                    or enrollment.get('status') != expected_status
+                ):
+                    # Same guard as complete_lesson: a completion committed since the read
+                    # makes this write miss instead of being overwritten
+                    if 'completed_bits' in enrollment:
+                        guard = {"completed_bits": enrollment['completed_bits']}
+                    else:
+                        guard = {"completed_bits": {"$exists": False}}
+                    operations.append(UpdateOne(
+                        {"id": enrollment['id'], **guard},
+                        {
+                            "$set": {
+                                "completed_bits": bits,
+                                "completed_count": completed_count,
+                                "progress": actual,
+                                "status": expected_status
+                            },
+                            "$unset": {"completed_lessons": ""}
+                        }
+                    ))
+                    planned.append((enrollment, bits, actual))
+            
+            if not operations:
+                break
+            result = await db.enrollments.bulk_write(operations, ordered=False)
+            if result.matched_count == len(operations):
+                landed.extend(planned)
+                break
+            
+            # Some guards missed: keep the writes that landed, recompute the rest from fresh state
+            current = {
+                enrollment['id']: enrollment
+                for enrollment in await db.enrollments.find(
+                    {"id": {"$in": [enrollment['id'] for enrollment, _, _ in planned]}}, fields
+                ).to_list(None)
+            }
+            pending = []
+            for enrollment, bits, actual in planned:
+                fresh = current.get(enrollment['id'])
+                if fresh is None:
+                    continue
+                if (
+                    'completed_lessons' not in fresh
+                    and lesson_bitset.normalize(fresh.get('completed_bits')) == bits
+                    and fresh.get('progress') == actual
+                ):
+                    landed.append((enrollment, bits, actual))
+                else:
+                    pending.append(fresh)
+        
+        if not landed:
+            return 0
+        
+        await db.student_course_state.bulk_write([
+            UpdateOne(
+                {"user_id": enrollment['user_id'], "course_id": course_id},
+                [{"$set": {"progress": actual}}, {"$set": COURSE_STATE_ELIGIBILITY}]
+            )
+            for enrollment, _, actual in landed
+        ], ordered=False)
+        logger.info(f"Reconciled progress for {len(landed)} enrollments in course {course_id}")
+        return len(landed)
+    except Exception as e:
+        logger.error(f"Progress reconciliation failed for course {course_id}: {e}")
+        return 0
+
+
+def content_disposition(filename: str) -> str:
+    """Attachment header for a download, RFC 5987-encoded when the name is not plain ASCII"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
 async def send_email(to: str, subject: str, content: str):
     try:
         message = Mail(
@@ -929,6 +1215,16 @@ async def create_course(course_data: dict, current_user: User = Depends(get_curr
         course = Course(instructor_id=instructor_id, **course_data)
         # Force status to pending for moderation
         course.status = "pending"
+        # Curriculum counters are server-maintained
+        course.lessons_count = 0
+        course.curriculum_version = 0
+        # So are thumbnail variants; the upload has usually been processed by now
+        thumbnail_fields = course_thumbnail_fields(
+            await thumbnail_processor.asset_for_url(db, course.thumbnail), thumbnail_processor.url_prefix
+        )
+        course.thumbnail_srcset = thumbnail_fields['thumbnail_srcset']
+        course.thumbnail_lqip = thumbnail_fields['thumbnail_lqip']
+        course.thumbnail_status = thumbnail_fields['thumbnail_status']
         
         doc = course.model_dump()
         doc['created_at'] = doc['created_at'].isoformat()
@@ -1065,9 +1361,8 @@ async def get_course(course_id: str):
         user = await db.users.find_one({"id": instructor['user_id']}, {"_id": 0, "password": 0})
         course['instructor'] = user
     
-    # Get lessons count
-    lessons_count = await db.lessons.count_documents({"course_id": course_id})
-    course['lessons_count'] = lessons_count
+    # Lessons count is maintained on the course document
+    course['lessons_count'] = await resolve_lessons_count(course)
     
     return course
 
@@ -1088,9 +1383,14 @@ async def update_course(course_id: str, updates: dict, current_user: User = Depe
         if not is_owner:
             raise HTTPException(status_code=403, detail="Not authorized to update this course")
     
-    # Remove immutable fields from updates
+    # Remove immutable and server-maintained fields from updates
     updates.pop('id', None)
     updates.pop('instructor_id', None)
+    updates.pop('lessons_count', None)
+    updates.pop('curriculum_version', None)
+    updates.pop('thumbnail_srcset', None)
+    updates.pop('thumbnail_lqip', None)
+    updates.pop('thumbnail_status', None)
     
     # Thumbnail persistence guardrail: 
     # Don't overwrite an existing thumbnail with an empty string unless explicitly requested via a flag
@@ -1104,8 +1404,20 @@ async def update_course(course_id: str, updates: dict, current_user: User = Depe
     
     if 'thumbnail' in updates:
         logging.info(f"Course {course_id}: Updating thumbnail to {updates['thumbnail']}")
+        updates.update(course_thumbnail_fields(
+            await thumbnail_processor.asset_for_url(db, updates['thumbnail']), thumbnail_processor.url_prefix
+        ))
 
-    await db.courses.update_one({"id": course_id}, {"$set": updates})
+    updated = await db.courses.find_one_and_update(
+        {"id": course_id},
+        {"$set": updates, "$inc": {"curriculum_version": 1}},
+        projection={"_id": 0, "curriculum_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    invalidate_tutor_context(course_id)
+    # Course fields aren't in the retrieval index; keep it current for the new version
+    if updated:
+        tutor_retrieval.advance(course_id, updated['curriculum_version'])
     return {"message": "Course updated", "status": "published"}
 
 @api_router.delete("/courses/{course_id}")
@@ -1132,13 +1444,26 @@ async def delete_course(course_id: str, current_user: User = Depends(get_current
     await db.lessons.delete_many({"course_id": course_id})
     await db.quizzes.delete_many({"course_id": course_id})
     await db.live_classes.delete_many({"course_id": course_id})
+    await db.student_course_state.delete_many({"course_id": course_id})
+    # The counters went away with the course document; drop cached copies
+    invalidate_lessons_count(course_id)
+    invalidate_tutor_context(course_id)
+    tutor_retrieval.drop(course_id)
     # Note: Enrollments are usually kept for audit but could be archived
     
     return {"message": "Course and all related content deleted successfully"}
 
 
+async def lesson_pdf_summaries(lesson: dict) -> dict:
+    """content_pdf / notes_pdf for a lesson's uploaded PDFs (None until processed)"""
+    return {
+        "content_pdf": lesson_pdf_fields(await pdf_processor.asset_for_url(db, lesson.get('content_url'))),
+        "notes_pdf": lesson_pdf_fields(await pdf_processor.asset_for_url(db, lesson.get('notes_url'))),
+    }
+
+
 @api_router.post("/courses/{course_id}/lessons")
-async def add_lesson(course_id: str, lesson_data: dict, current_user: User = Depends(get_current_user)):
+async def add_lesson(course_id: str, lesson_data: dict, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
     course = await db.courses.find_one({"id": course_id})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -1156,16 +1481,19 @@ async def add_lesson(course_id: str, lesson_data: dict, current_user: User = Dep
         raise HTTPException(status_code=403, detail="Not authorized")
     
     lesson = Lesson(course_id=course_id, **lesson_data)
+    lesson.ordinal = await allocate_lesson_ordinal(course_id)
+    pdf_summaries = await lesson_pdf_summaries(lesson_data)
+    lesson.content_pdf = pdf_summaries['content_pdf']
+    lesson.notes_pdf = pdf_summaries['notes_pdf']
     doc = lesson.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.lessons.insert_one(doc)    
+    version = await bump_curriculum(course_id, 1)
     
-    # NEW: Reset completion status for all enrolled students
-    # When a new lesson is added, completed courses should become "active" again
-    await db.enrollments.update_many(
-        {"course_id": course_id, "status": "completed"},
-        {"$set": {"status": "active"}}
-    )
+    # Completed enrollments drop below 100% and become "active" again;
+    # progress is reconciled in bulk after the response is sent
+    background_tasks.add_task(reconcile_course_progress, course_id)
+    background_tasks.add_task(tutor_retrieval.upsert_lesson, course_id, doc, version)
     
     return lesson
 
@@ -1200,7 +1528,7 @@ async def get_lessons(course_id: str, request: Request):
 
 
 @api_router.patch("/lessons/{lesson_id}")
-async def update_lesson(lesson_id: str, updates: dict, current_user: User = Depends(get_current_user)):
+async def update_lesson(lesson_id: str, updates: dict, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
     lesson = await db.lessons.find_one({"id": lesson_id})
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
@@ -1223,18 +1551,27 @@ async def update_lesson(lesson_id: str, updates: dict, current_user: User = Depe
     updates.pop('id', None)
     updates.pop('course_id', None)
     updates.pop('created_at', None)
+    updates.pop('ordinal', None)
+    updates.pop('content_pdf', None)
+    updates.pop('notes_pdf', None)
     
     if not updates:
         return lesson
+    
+    for url_field, summary_field in (("content_url", "content_pdf"), ("notes_url", "notes_pdf")):
+        if url_field in updates:
+            updates[summary_field] = lesson_pdf_fields(await pdf_processor.asset_for_url(db, updates[url_field]))
         
     await db.lessons.update_one({"id": lesson_id}, {"$set": updates})
+    version = await bump_curriculum(lesson['course_id'])
     
     updated_lesson = await db.lessons.find_one({"id": lesson_id}, {"_id": 0})
+    background_tasks.add_task(tutor_retrieval.upsert_lesson, lesson['course_id'], updated_lesson, version)
     return updated_lesson
 
 
 @api_router.delete("/lessons/{lesson_id}")
-async def delete_lesson(lesson_id: str, current_user: User = Depends(get_current_user)):
+async def delete_lesson(lesson_id: str, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
     lesson = await db.lessons.find_one({"id": lesson_id})
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
@@ -1252,7 +1589,11 @@ async def delete_lesson(lesson_id: str, current_user: User = Depends(get_current
     if not is_authorized:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.lessons.delete_one({"id": lesson_id})
+    result = await db.lessons.delete_one({"id": lesson_id})
+    if result.deleted_count:
+        version = await bump_curriculum(lesson['course_id'], -result.deleted_count)
+        tutor_retrieval.remove_lesson(lesson['course_id'], lesson_id, version)
+        background_tasks.add_task(reconcile_course_progress, lesson['course_id'])
     return {"message": "Lesson deleted"}
 
 
@@ -1390,7 +1731,7 @@ async def get_sections(course_id: str, request: Request):
 
 
 @api_router.delete("/sections/{section_id}")
-async def delete_section(section_id: str, current_user: User = Depends(get_current_user)):
+async def delete_section(section_id: str, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
     section = await db.sections.find_one({"id": section_id})
     if not section:
         raise HTTPException(status_code=404, detail="Section not found")
@@ -1410,7 +1751,12 @@ async def delete_section(section_id: str, current_user: User = Depends(get_curre
     
     # Delete section and its lessons
     await db.sections.delete_one({"id": section_id})
-    await db.lessons.delete_many({"section_id": section_id})
+    result = await db.lessons.delete_many({"section_id": section_id})
+    await bump_curriculum(section['course_id'], -result.deleted_count)
+    # Rebuilt on the next tutor question rather than tracking each removed lesson
+    tutor_retrieval.drop(section['course_id'])
+    if result.deleted_count:
+        background_tasks.add_task(reconcile_course_progress, section['course_id'])
     
     return {"message": "Section deleted"}
 
@@ -1555,36 +1901,28 @@ async def create_enrollment(course_id: str, current_user: User = Depends(get_cur
 
 @api_router.get("/enrollments/my-courses")
 async def get_my_courses(current_user: User = Depends(get_current_user)):
-    enrollments = await db.enrollments.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
+    """
+    Pure read: stored progress is kept in sync by reconcile_course_progress
+    whenever the curriculum changes, so nothing is recomputed or written here.
+    Completion bitsets are left out; the player fetches them per enrollment
+    from /enrollments/{id}/lesson-progress.
+    """
+    enrollments = await db.enrollments.find(
+        {"user_id": current_user.id},
+        {"_id": 0, "completed_bits": 0, "completed_lessons": 0}
+    ).to_list(1000)
+    if not enrollments:
+        return []
     
-    result = []
-    for enrollment in enrollments:
-        course = await db.courses.find_one({"id": enrollment['course_id']}, {"_id": 0})
-        if course:
-            # Recalculate progress based on actual completed lessons
-            completed_lessons = enrollment.get('completed_lessons', [])
-            total_lessons = await db.lessons.count_documents({"course_id": enrollment['course_id']})
-            
-            if total_lessons > 0:
-                actual_progress = (len(completed_lessons) / total_lessons) * 100
-            else:
-                actual_progress = 0
-            
-            # Update if progress doesn't match
-            stored_progress = enrollment.get('progress', 0)
-            if abs(actual_progress - stored_progress) > 1:
-                new_status = 'completed' if actual_progress >= 100 else 'active'
-                await db.enrollments.update_one(
-                    {"id": enrollment['id']},
-                    {"$set": {"progress": actual_progress, "status": new_status}}
-                )
-                enrollment['progress'] = actual_progress
-                enrollment['status'] = new_status
-            
-            result.append({**enrollment, "course": course})
+    course_ids = list({e['course_id'] for e in enrollments})
+    courses = await db.courses.find({"id": {"$in": course_ids}}, {"_id": 0}).to_list(len(course_ids))
+    courses_by_id = {c['id']: c for c in courses}
     
-    return result
-
+    return [
+        {**enrollment, "course": courses_by_id[enrollment['course_id']]}
+        for enrollment in enrollments
+        if enrollment['course_id'] in courses_by_id
+    ]
 
 
 @api_router.patch("/enrollments/{enrollment_id}/progress")
@@ -1594,31 +1932,44 @@ async def update_progress(enrollment_id: str, progress: float, completed_lessons
         raise HTTPException(status_code=404, detail="Enrollment not found")
     
     updates = {"progress": progress}
+    unset = {}
     
     # If completed_lessons is provided (as JSON string), parse and update it
     parsed_lessons = None
     if completed_lessons is not None:
         try:
             parsed_lessons = json.loads(completed_lessons)
-            updates["completed_lessons"] = parsed_lessons
-        except json.JSONDecodeError:
-            pass  # Ignore invalid JSON
+            bits = await lesson_ids_to_bits(enrollment['course_id'], parsed_lessons)
+            updates["completed_bits"] = bits
+            updates["completed_count"] = lesson_bitset.popcount(bits)
+            unset["completed_lessons"] = ""
+        except (json.JSONDecodeError, TypeError):
+            parsed_lessons = None  # Ignore invalid JSON
     
     cert_id = None
     
     if progress >= 100:
         updates['status'] = 'completed'
-        # Try to generate certificate (will check quiz requirements)
-        cert_id = await generate_certificate_if_eligible(current_user.id, enrollment['course_id'])
     else:
         updates['status'] = 'active'
     
-    await db.enrollments.update_one({"id": enrollment_id}, {"$set": updates})
+    update_doc = {"$set": updates}
+    if unset:
+        update_doc["$unset"] = unset
+    await db.enrollments.update_one({"id": enrollment_id}, update_doc)
+    state = await update_course_state(current_user.id, enrollment['course_id'], progress=progress)
+    
+    if progress >= 100:
+        # Try to generate certificate (will check quiz requirements)
+        cert_id = await generate_certificate_if_eligible(current_user.id, enrollment['course_id'], state)
+    
+    if parsed_lessons is None:
+        parsed_lessons = await bits_to_lesson_ids(enrollment['course_id'], await load_completion_bits(enrollment))
     
     return {
         "message": "Progress updated",
         "progress": progress,
-        "completed_lessons": parsed_lessons or enrollment.get('completed_lessons', []),
+        "completed_lessons": parsed_lessons,
         "certificate_earned": cert_id is not None,
         "certificate_id": cert_id
     }
@@ -1628,46 +1979,163 @@ async def update_progress(enrollment_id: str, progress: float, completed_lessons
 @api_router.post("/enrollments/{enrollment_id}/complete-lesson")
 async def complete_lesson(enrollment_id: str, lesson_id: str, current_user: User = Depends(get_current_user)):
     """Mark a lesson as complete and recalculate progress"""
-    enrollment = await db.enrollments.find_one({"id": enrollment_id, "user_id": current_user.id})
-    if not enrollment:
-        raise HTTPException(status_code=404, detail="Enrollment not found")
-    
-    # Get current completed lessons
-    completed_lessons = enrollment.get('completed_lessons', [])
-    
-    # Add lesson if not already completed
-    if lesson_id not in completed_lessons:
-        completed_lessons.append(lesson_id)
-    
-    # Get total lessons for this course
-    total_lessons = await db.lessons.count_documents({"course_id": enrollment['course_id']})
-    
-    # Calculate progress
-    if total_lessons > 0:
-        progress = (len(completed_lessons) / total_lessons) * 100
-    else:
-        progress = 0
-    
-    progress = min(100, progress)  # Cap at 100%
+    lesson_ref = await get_lesson_ordinal(lesson_id)
+    if not lesson_ref:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    lesson_course_id, ordinal = lesson_ref
+    
+    # Update pipelines cannot OR into BSON binary, so each write is a single update
+    # guarded on the bitset that was read. A guard miss means another completion
+    # landed in between; the loop re-reads and merges, so it always makes progress
+    # and concurrent clicks are never surfaced as errors.
+    while True:
+        enrollment = await db.enrollments.find_one(
+            {"id": enrollment_id, "user_id": current_user.id},
+            {"_id": 0, "course_id": 1, "progress": 1, "completed_bits": 1, "completed_lessons": 1}
+        )
+        if not enrollment:
+            raise HTTPException(status_code=404, detail="Enrollment not found")
+        course_id = enrollment['course_id']
+        if lesson_course_id != course_id:
+            raise HTTPException(status_code=404, detail="Lesson not found in this course")
+        
+        bits = await load_completion_bits(enrollment)
+        new_bits = lesson_bitset.set_bit(bits, ordinal)
+        completed_count = lesson_bitset.popcount(new_bits)
+        
+        if 'completed_bits' in enrollment and new_bits == bits:
+            # Already completed: nothing to write
+            progress = enrollment.get('progress', 0)
+            break
+        
+        total_lessons = await get_course_lessons_count(course_id)
+        progress = min(100, (completed_count / total_lessons) * 100) if total_lessons > 0 else 0
+        
+        updates = {
+            "completed_bits": new_bits,
+            "completed_count": completed_count,
+            "progress": progress
+        }
+        if progress >= 100:
+            updates['status'] = 'completed'
+        
+        if 'completed_bits' in enrollment:
+            guard = {"completed_bits": enrollment['completed_bits']}
+        else:
+            guard = {"completed_bits": {"$exists": False}}
+        result = await db.enrollments.update_one(
+            {"id": enrollment_id, **guard},
+            {"$set": updates, "$unset": {"completed_lessons": ""}}
+        )
+        if result.matched_count:
+            break
+        metrics.inc("lesson_completion_retries")
     
-    updates = {
-        "completed_lessons": completed_lessons,
-        "progress": progress
-    }
+    state = await update_course_state(current_user.id, course_id, progress=progress)
     
     cert_id = None
-    
     if progress >= 100:
-        updates['status'] = 'completed'
-        cert_id = await generate_certificate_if_eligible(current_user.id, enrollment['course_id'])
-    
-    await db.enrollments.update_one({"id": enrollment_id}, {"$set": updates})
+        cert_id = await generate_certificate_if_eligible(current_user.id, course_id, state)
     
     return {
         "message": "Lesson completed",
         "lesson_id": lesson_id,
         "progress": progress,
-        "completed_lessons": completed_lessons,
+        "completed_lessons": await bits_to_lesson_ids(course_id, new_bits),
+        "completed_count": completed_count,
+        "certificate_earned": cert_id is not None,
+        "certificate_id": cert_id
+    }
+
+
+@api_router.post("/enrollments/{enrollment_id}/sync")
+async def sync_progress(enrollment_id: str, payload: ProgressSyncRequest, current_user: User = Depends(get_current_user)):
+    """
+    Apply many lesson completions and watch positions in one atomic update.
+    Completions are merged into the bitset and positions only ever move
+    forward, so replaying the same batch is harmless.
+    """
+    lesson_ids = set(payload.completed_lessons) | set(payload.watch_positions)
+    if len(payload.completed_lessons) + len(payload.watch_positions) > PROGRESS_SYNC_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {PROGRESS_SYNC_MAX_ITEMS} items per sync")
+    
+    synced_bits = positions = None
+    while True:
+        enrollment = await db.enrollments.find_one(
+            {"id": enrollment_id, "user_id": current_user.id},
+            {"_id": 0, "course_id": 1, "progress": 1, "status": 1, "watch_positions": 1,
+             "completed_bits": 1, "completed_lessons": 1}
+        )
+        if not enrollment:
+            raise HTTPException(status_code=404, detail="Enrollment not found")
+        course_id = enrollment['course_id']
+        
+        if synced_bits is None:
+            # Only lessons of this course are accepted; unknown IDs are ignored
+            known_ids = set(await db.lessons.distinct(
+                "id", {"course_id": course_id, "id": {"$in": list(lesson_ids)}}
+            )) if lesson_ids else set()
+            synced_bits = await lesson_ids_to_bits(
+                course_id, [lesson_id for lesson_id in payload.completed_lessons if lesson_id in known_ids]
+            )
+            positions = {
+                f"watch_positions.{lesson_id}": max(0.0, position)
+                for lesson_id, position in payload.watch_positions.items()
+                if lesson_id in known_ids
+            }
+        
+        bits = await load_completion_bits(enrollment)
+        new_bits = lesson_bitset.union(bits, synced_bits)
+        completed_count = lesson_bitset.popcount(new_bits)
+        progress = enrollment.get('progress', 0)
+        enrollment_status = enrollment.get('status', 'active')
+        
+        update = {}
+        if positions:
+            update["$max"] = positions
+        if new_bits != bits or 'completed_bits' not in enrollment:
+            total_lessons = await get_course_lessons_count(course_id)
+            progress = min(100, (completed_count / total_lessons) * 100) if total_lessons > 0 else 0
+            updates = {"completed_bits": new_bits, "completed_count": completed_count, "progress": progress}
+            if progress >= 100:
+                updates['status'] = enrollment_status = 'completed'
+            update["$set"] = updates
+            update["$unset"] = {"completed_lessons": ""}
+        
+        if not update:
+            break
+        
+        query = {"id": enrollment_id}
+        if "$set" in update:
+            # Same compare-and-swap as complete_lesson; positions ride along atomically
+            if 'completed_bits' in enrollment:
+                query["completed_bits"] = enrollment['completed_bits']
+            else:
+                query["completed_bits"] = {"$exists": False}
+        result = await db.enrollments.update_one(query, update)
+        if result.matched_count:
+            break
+        metrics.inc("lesson_completion_retries")
+    
+    watch_positions = dict(enrollment.get('watch_positions') or {})
+    for key, position in positions.items():
+        lesson_id = key.split(".", 1)[1]
+        watch_positions[lesson_id] = max(watch_positions.get(lesson_id, 0), position)
+    
+    # Eligibility is evaluated once for the whole batch
+    cert_id = None
+    if "$set" in update:
+        state = await update_course_state(current_user.id, course_id, progress=progress)
+        if progress >= 100:
+            cert_id = await generate_certificate_if_eligible(current_user.id, course_id, state)
+    
+    return {
+        "enrollment_id": enrollment_id,
+        "progress": progress,
+        "status": enrollment_status,
+        "completed_lessons": await bits_to_lesson_ids(course_id, new_bits),
+        "completed_count": completed_count,
+        "watch_positions": watch_positions,
         "certificate_earned": cert_id is not None,
         "certificate_id": cert_id
     }
@@ -1680,10 +2148,13 @@ async def get_lesson_progress(enrollment_id: str, current_user: User = Depends(g
     if not enrollment:
         raise HTTPException(status_code=404, detail="Enrollment not found")
     
+    bits = await load_completion_bits(enrollment)
+    
     return {
         "enrollment_id": enrollment_id,
         "progress": enrollment.get('progress', 0),
-        "completed_lessons": enrollment.get('completed_lessons', []),
+        "completed_lessons": await bits_to_lesson_ids(enrollment['course_id'], bits),
+        "completed_count": lesson_bitset.popcount(bits),
         "status": enrollment.get('status', 'active')
     }
 
@@ -2300,127 +2771,446 @@ async def test_payment_split():
 
 
 # ==================== AI ROUTES ====================
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def stream_ai_response(
+    chat: LlmChat,
+    message: UserMessage,
+    request: Request,
+    endpoint: str,
+    on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+    on_finish: Optional[Callable[[str], None]] = None
+) -> StreamingResponse:
+    """Forward an LLM response as SSE token events, stopping when the client disconnects.
+    on_complete receives the full answer once the stream finished normally; it runs as a
+    background task after the response is closed. on_finish receives whatever part of the
+    answer was streamed, on every path: finished, failed, disconnected or cancelled."""
+    completed: List[str] = []
+    
+    async def events():
+        started = time.perf_counter()
+        first_token = True
+        answer = []
+        try:
+            try:
+                async with contextlib.aclosing(chat.stream_message(message)) as tokens:
+                    async for token in tokens:
+                        if await request.is_disconnected():
+                            metrics.inc("ai_stream_cancelled", endpoint=endpoint)
+                            return
+                        if first_token:
+                            metrics.observe("ai_time_to_first_token_seconds", time.perf_counter() - started, endpoint=endpoint)
+                            first_token = False
+                        answer.append(token)
+                        yield sse_event({"token": token})
+            except Exception as e:
+                logger.error(f"AI stream failed on {endpoint}: {e}")
+                metrics.inc("ai_stream_errors", endpoint=endpoint)
+                yield sse_event({"detail": "AI service temporarily unavailable"}, event="error")
+                return
+            metrics.observe("ai_stream_seconds", time.perf_counter() - started, endpoint=endpoint)
+            completed.append("".join(answer))
+            yield sse_event({}, event="done")
+        finally:
+            if on_finish:
+                try:
+                    on_finish("".join(answer))
+                except Exception as e:
+                    logger.warning(f"AI stream finish hook failed on {endpoint}: {e}")
+    
+    async def after_stream():
+        if not completed:
+            return
+        try:
+            await on_complete(completed[0])
+        except Exception as e:
+            logger.warning(f"AI stream completion hook failed on {endpoint}: {e}")
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(after_stream) if on_complete else None
+    )
+
+
+# Per-user request and LLM-token budgets for the AI endpoints (see rate_limit.py)
+ai_rate_limiter = RateLimiter()
+
+
+def enforce_ai_rate_limit(user: User, endpoint: str):
+    """Raise 429 with Retry-After when the user is over their budget for an endpoint"""
+    retry_after = ai_rate_limiter.acquire(user.id, user.role, endpoint)
+    if retry_after > 0:
+        metrics.inc("ai_rate_limited", endpoint=endpoint, role=user.role)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many AI requests, please try again shortly",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+
+def charge_ai_usage(user: User, endpoint: str, chat: LlmChat, message: Optional[UserMessage] = None, answer: Optional[str] = None):
+    """Deduct the tokens the provider reported for the chat's last call.
+    Streams cut short never receive the usage report; given the message and the part of
+    the answer that was generated, they are charged an estimate instead."""
+    if chat.last_usage:
+        used = chat.last_usage['prompt_tokens'] + chat.last_usage['completion_tokens']
+    elif message is not None and answer:
+        prompt = [chat.system_message, message.text] + [turn['content'] for turn in chat.history]
+        used = sum(chat_memory.estimate_tokens(text) for text in prompt if text) + chat_memory.estimate_tokens(answer)
+        metrics.inc("ai_tokens_estimated", used, endpoint=endpoint)
+    else:
+        return
+    ai_rate_limiter.charge_tokens(user.id, user.role, endpoint, used)
+    metrics.inc("ai_tokens", used, endpoint=endpoint)
+
+
+async def summarize_conversation(previous_summary: str, transcript: str) -> Optional[str]:
+    """Fold older conversation turns into a short running summary"""
+    chat = LlmChat(
+        api_key=os.environ.get('GROQ_API_KEY'),
+        session_id="chat-memory-summary",
+        system_message="You maintain short running summaries of tutoring conversations. Keep facts, goals and open questions; drop pleasantries. Reply with the summary only, at most 150 words."
+    ).with_model("groq", "llama-8b").with_tag("chat-memory")
+    
+    try:
+        response = await chat.send_message(UserMessage(
+            text=f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns to fold in:\n{transcript}"
+        ))
+    except LlmUnavailableError:
+        return None
+    return response.strip()
+
+
+async def answer_with_memory(
+    chat: LlmChat,
+    question: str,
+    session_id: str,
+    user: User,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    stream: bool,
+    endpoint: str,
+    answer_cache_scope: Optional[tuple[str, int]] = None
+):
+    """Send a question with the session's history and record the turn afterwards.
+    With answer_cache_scope=(course_id, curriculum_version), questions that stand on their
+    own are served from the answer cache; on a miss they are answered without the session's
+    history, so the stored answer carries nothing from this student's conversation."""
+    session = await chat_memory.load_session(db, session_id)
+    has_history = bool(session['turns'] or session['summary'])
+    use_cache = answer_cache_scope is not None and (not has_history or is_standalone(question))
+    if not use_cache:
+        chat.system_message = chat_memory.with_summary(chat.system_message, session)
+        chat.with_history(chat_memory.history_messages(session))
+    message = UserMessage(text=question)
+    
+    if use_cache:
+        cached = tutor_answer_cache.lookup(*answer_cache_scope, question)
+        metrics.inc("ai_answer_cache", endpoint=endpoint, result=cached[1] if cached else "miss")
+        if cached:
+            background_tasks.add_task(
+                chat_memory.record_turn, db, session_id, user.id, question, cached[0], summarize_conversation
+            )
+            if stream:
+                return StreamingResponse(
+                    iter([sse_event({"token": cached[0], "cached": True}), sse_event({}, event="done")]),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache"},
+                    background=background_tasks
+                )
+            return {"response": cached[0], "cached": True}
+    
+    async def remember(answer: str):
+        if use_cache:
+            tutor_answer_cache.store(*answer_cache_scope, question, answer)
+        await chat_memory.record_turn(db, session_id, user.id, question, answer, summarize_conversation)
+    
+    if stream:
+        # Charged on every path, so disconnecting before "done" isn't free
+        return stream_ai_response(
+            chat, message, request, endpoint,
+            on_complete=remember,
+            on_finish=lambda answer: charge_ai_usage(user, endpoint, chat, message, answer)
+        )
+    
+    try:
+        response = await chat.send_message(message)
+    except LlmUnavailableError as e:
+        logger.error(f"AI request failed on {endpoint}: {e}")
+        metrics.inc("ai_unavailable", endpoint=endpoint)
+        raise HTTPException(
+            status_code=503,
+            detail="AI service temporarily unavailable",
+            headers={"Retry-After": "10"}
+        )
+    charge_ai_usage(user, endpoint, chat)
+    background_tasks.add_task(remember, response)
+    return {"response": response}
+
+
 @api_router.post("/ai/course-assistant")
-async def ai_course_assistant(prompt: str, current_user: User = Depends(get_current_user)):
+async def ai_course_assistant(
+    prompt: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    stream: bool = False,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role not in ["instructor", "admin"]:
         raise HTTPException(status_code=403, detail="Instructor only")
+    enforce_ai_rate_limit(current_user, "course-assistant")
     
+    session_id = f"assistant-{current_user.id}"
     chat = LlmChat(
         api_key=os.environ.get('GROQ_API_KEY'),
-        session_id=f"assistant-{current_user.id}",
+        session_id=session_id,
         system_message="You are an AI assistant helping instructors create course content. Provide helpful suggestions for course descriptions, lesson titles, and quiz questions."
-    ).with_model("groq", "llama-70b")
+    ).with_model("groq", "llama-70b").with_tag("assistant")
     
-    message = UserMessage(text=prompt)
-    response = await chat.send_message(message)
-    return {"response": response}
+    return await answer_with_memory(
+        chat, prompt, session_id, current_user, request, background_tasks, stream, "course-assistant"
+    )
+
+
+async def store_uploaded_file(file: UploadFile, directory: Path, max_bytes: int, kind: str) -> uploads.StoredFile:
+    """Stream an upload into content-addressed storage, mapping failures to HTTP errors.
+    UploadSizeLimit has already bounded the request body; max_bytes bounds the file itself."""
+    try:
+        stored = await uploads.store_upload(file, directory, max_bytes, kind)
+    except uploads.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except uploads.UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        logger.error(f"File IO Error during {kind} upload: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"File system error: {str(e)}")
+    finally:
+        await file.close()
+    
+    metrics.inc("uploads", kind=kind, deduplicated=str(stored.deduplicated).lower())
+    metrics.inc("upload_bytes", stored.size, kind=kind)
+    logger.info(
+        f"{kind.capitalize()} upload stored as {stored.name} ({stored.size} bytes"
+        f"{', duplicate' if stored.deduplicated else ''})"
+    )
+    return stored
 
 
 @api_router.post("/upload/thumbnail")
-async def upload_thumbnail(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+async def upload_thumbnail(background_tasks: BackgroundTasks, file: UploadFile = File(...),
+                           current_user: User = Depends(get_current_user)):
     if current_user.role not in ["instructor", "admin"]:
         raise HTTPException(status_code=403, detail="Instructor only")
     
-    # No file type or size restrictions - accept any image
-    try:
-        file_extension = Path(file.filename).suffix
-        if not file_extension:
-            file_extension = ".png" # Default
-            
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        
-        # Ensure directory exists at runtime
-        THUMBNAIL_DIR.mkdir(parents=True, exist_ok=True)
-        file_path = THUMBNAIL_DIR / unique_filename
-        
-        logging.info(f"Uploading thumbnail to: {file_path}")
-        
-        try:
-            with open(file_path, "wb") as buffer:
-                # Use shutil.copyfileobj to handle large files efficiently
-                shutil.copyfileobj(file.file, buffer)
-            
-            # Reset file pointer just in case it's needed elsewhere
-            await file.seek(0)
-            
-            logger.info(f"Thumbnail uploaded successfully: {unique_filename}")
-            return {"url": f"/uploads/thumbnails/{unique_filename}"}
-        except Exception as file_io_err:
-            logger.error(f"File IO Error during thumbnail upload: {str(file_io_err)}")
-            logger.error(traceback.format_exc())
-            raise HTTPException(status_code=500, detail=f"File system error: {str(file_io_err)}")
-            
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Thumbnail upload failed with unexpected error: {str(e)}")
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Failed to upload thumbnail: {str(e)}")
+    # Any image type is accepted; the stored extension comes from the file's magic bytes
+    stored = await store_uploaded_file(file, THUMBNAIL_DIR, uploads.MAX_THUMBNAIL_BYTES, "image")
+    url = f"/uploads/thumbnails/{stored.name}"
+    # Responsive variants are built after the response; courses pick them up when ready
+    background_tasks.add_task(thumbnail_processor.process, db, url, stored.sha256)
+    return {"url": url, "asset_id": stored.sha256}
 
 
 @api_router.post("/upload/lesson-pdf")
-async def upload_lesson_pdf(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+async def upload_lesson_pdf(background_tasks: BackgroundTasks, file: UploadFile = File(...),
+                            current_user: User = Depends(get_current_user)):
     if current_user.role not in ["instructor", "admin"]:
         raise HTTPException(status_code=403, detail="Instructor only")
     
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
+    stored = await store_uploaded_file(file, PDF_DIR, uploads.MAX_LESSON_PDF_BYTES, "pdf")
+    url = f"/uploads/pdfs/{stored.name}"
+    # Validation, page count, text and preview run after the response; lessons pick them up when ready
+    background_tasks.add_task(pdf_processor.process, db, url, stored.sha256)
+    return {"url": url, "asset_id": stored.sha256}
+
+
+resumable_uploads = uploads.ResumableUploads(RESUMABLE_UPLOAD_DIR)
+
+
+def get_upload_session(upload_id: str, current_user: User) -> dict:
     try:
-        unique_filename = f"{uuid.uuid4()}.pdf"
-        
-        # Ensure directory exists at runtime
-        PDF_DIR.mkdir(parents=True, exist_ok=True)
-        file_path = PDF_DIR / unique_filename
-        
-        logging.info(f"Uploading PDF to: {file_path}")
-        
-        try:
-            with open(file_path, "wb") as buffer:
-                # Use shutil.copyfileobj to handle large files efficiently
-                shutil.copyfileobj(file.file, buffer)
-            
-            # Reset file pointer just in case it's needed elsewhere
-            await file.seek(0)
-            
-            logger.info(f"PDF uploaded successfully: {unique_filename}")
-            return {"url": f"/uploads/pdfs/{unique_filename}"}
-        except Exception as file_io_err:
-            logger.error(f"File IO Error during PDF upload: {str(file_io_err)}")
-            logger.error(traceback.format_exc())
-            raise HTTPException(status_code=500, detail=f"File system error: {str(file_io_err)}")
-            
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"PDF upload failed with unexpected error: {str(e)}")
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Failed to upload PDF: {str(e)}")
+        session = resumable_uploads.get(upload_id)
+    except uploads.UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    if session['user_id'] != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    return session
+
+
+def upload_session_status(session: dict) -> dict:
+    return {
+        "upload_id": session['upload_id'],
+        "size": session['size'],
+        "chunk_size": session['chunk_size'],
+        "chunk_count": session['chunk_count'],
+        "received_chunks": session.get('received_chunks', []),
+        "received_bytes": session.get('received_bytes', 0),
+        "expires_at": datetime.fromtimestamp(session['expires_at'], timezone.utc).isoformat(),
+    }
+
+
+@api_router.post("/upload/lesson-pdf/resumable")
+async def create_resumable_pdf_upload(data: ResumableUploadCreate, current_user: User = Depends(get_current_user)):
+    """Start a resumable lesson PDF upload; chunks are then sent with PATCH"""
+    if current_user.role not in ["instructor", "admin"]:
+        raise HTTPException(status_code=403, detail="Instructor only")
+    if data.size > uploads.MAX_LESSON_PDF_BYTES:
+        raise HTTPException(status_code=413, detail=str(uploads.UploadTooLarge(uploads.MAX_LESSON_PDF_BYTES)))
+    
+    session = await asyncio.to_thread(
+        resumable_uploads.create, current_user.id, "pdf", data.filename, data.size, data.sha256
+    )
+    return upload_session_status(session)
+
+
+@api_router.get("/upload/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str, current_user: User = Depends(get_current_user)):
+    """Chunks received so far, so an interrupted client knows what to resend"""
+    session = await asyncio.to_thread(get_upload_session, upload_id, current_user)
+    return upload_session_status(session)
+
+
+@api_router.patch("/upload/resumable/{upload_id}")
+async def upload_resumable_chunk(upload_id: str, offset: int, request: Request,
+                                 current_user: User = Depends(get_current_user)):
+    """Write one chunk (raw request body) at `offset`; chunks may be sent in parallel.
+    An X-Chunk-SHA256 header is checked against the received bytes."""
+    session = await asyncio.to_thread(get_upload_session, upload_id, current_user)
+    if offset < 0 or offset >= session['size']:
+        raise HTTPException(status_code=400, detail="Offset is outside the file")
+    limit = min(session['chunk_size'], session['size'] - offset)
+    
+    body = bytearray()
+    async for piece in request.stream():
+        body += piece
+        if len(body) > limit:
+            raise HTTPException(status_code=413, detail=f"Chunk at offset {offset} is larger than {limit} bytes")
+    
+    try:
+        index = resumable_uploads.chunk_index(session, offset, len(body))
+        await asyncio.to_thread(
+            resumable_uploads.write_chunk, session, index, bytes(body), request.headers.get("X-Chunk-SHA256")
+        )
+    except uploads.UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except uploads.UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    metrics.inc("upload_bytes", len(body), kind=f"{session['kind']}-resumable")
+    return {"upload_id": upload_id, "chunk": index, "offset": offset, "length": len(body)}
+
+
+@api_router.post("/upload/resumable/{upload_id}/finalize")
+async def finalize_resumable_upload(upload_id: str, background_tasks: BackgroundTasks,
+                                    data: Optional[ResumableUploadFinalize] = None,
+                                    current_user: User = Depends(get_current_user)):
+    """Verify the assembled file (whole-file SHA-256, or per-chunk checksums) and publish it"""
+    session = await asyncio.to_thread(get_upload_session, upload_id, current_user)
+    try:
+        stored = await asyncio.to_thread(
+            resumable_uploads.finalize, session, PDF_DIR, data.sha256 if data else None
+        )
+    except uploads.UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except uploads.UploadSessionNotFound:
+        raise HTTPException(status_code=409, detail="Upload is already being finalized or was cancelled")
+    
+    metrics.inc("uploads", kind="pdf-resumable", deduplicated=str(stored.deduplicated).lower())
+    logger.info(f"Resumable PDF upload {upload_id} stored as {stored.name} ({stored.size} bytes)")
+    url = f"/uploads/pdfs/{stored.name}"
+    background_tasks.add_task(pdf_processor.process, db, url, stored.sha256)
+    return {"url": url, "asset_id": stored.sha256, "sha256": stored.sha256, "size": stored.size}
+
+
+@api_router.delete("/upload/resumable/{upload_id}")
+async def cancel_resumable_upload(upload_id: str, current_user: User = Depends(get_current_user)):
+    await asyncio.to_thread(get_upload_session, upload_id, current_user)
+    await asyncio.to_thread(resumable_uploads.delete, upload_id)
+    return {"message": "Upload cancelled"}
+
+
+# BM25 over lesson text and PDFs, injected into tutor prompts (see tutor_retrieval.py)
+tutor_retrieval = TutorRetrieval(PDF_DIR, stored_text=lambda url: pdf_processor.text_for_url(db, url))
+
+# Reuses answers to repeated standalone questions within a course (see answer_cache.py)
+tutor_answer_cache = AnswerCache()
+metrics.register_gauge("ai_tutor_answer_cache_hit_rate", lambda: tutor_answer_cache.hit_rate)
+
+
+async def get_tutor_context(course_id: str) -> Optional[tuple[int, str]]:
+    """(curriculum_version, prompt context) for a course, built once per curriculum version"""
+    cached = _tutor_context_cache.get(course_id)
+    if cached is not None:
+        return cached
+    
+    course = await db.courses.find_one(
+        {"id": course_id},
+        {"_id": 0, "title": 1, "description": 1, "curriculum_version": 1}
+    )
+    if not course:
+        return None
+    lessons = await db.lessons.find({"course_id": course_id}, {"_id": 0, "title": 1}).to_list(100)
+    
+    context = f"Course: {course['title']}\nDescription: {course['description']}\n\n"
+    context += "Lessons:\n" + "\n".join([f"- {l['title']}" for l in lessons])
+    
+    _tutor_context_cache[course_id] = (course.get('curriculum_version', 0), context)
+    return _tutor_context_cache[course_id]
 
 
 @api_router.post("/ai/tutor")
-async def ai_tutor(course_id: str, question: str, current_user: User = Depends(get_current_user)):
+async def ai_tutor(
+    course_id: str,
+    question: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    stream: bool = False,
+    current_user: User = Depends(get_current_user)
+):
     # Check enrollment
-    enrollment = await db.enrollments.find_one({"user_id": current_user.id, "course_id": course_id})
+    enrollment = await db.enrollments.find_one(
+        {"user_id": current_user.id, "course_id": course_id},
+        {"_id": 1}
+    )
     if not enrollment:
         raise HTTPException(status_code=403, detail="Not enrolled in this course")
+    enforce_ai_rate_limit(current_user, "tutor")
     
-    # Get course context
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
-    lessons = await db.lessons.find({"course_id": course_id}, {"_id": 0}).to_list(100)
+    tutor_context = await get_tutor_context(course_id)
+    if tutor_context is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    curriculum_version, context = tutor_context
     
-    context = f"Course: {course['title']}\nDescription: {course['description']}\n\n"
-    context += "Lessons:\n" + "\n".join([f"- {l['title']}" for l in lessons])
+    material = await tutor_retrieval.context_for(db, course_id, curriculum_version, question)
+    if material:
+        context += f"\n\nRelevant course material:\n{material}"
     
+    session_id = f"tutor-{current_user.id}-{course_id}"
     chat = LlmChat(
         api_key=os.environ.get('GROQ_API_KEY'),
-        session_id=f"tutor-{current_user.id}-{course_id}",
+        session_id=session_id,
         system_message=f"You are an AI tutor for this course. Help students understand the material.\n\n{context}"
-    ).with_model("groq", "llama-70b")
+    ).with_model("groq", "llama-70b").with_tag("tutor")
     
-    message = UserMessage(text=question)
-    response = await chat.send_message(message)
-    return {"response": response}
+    return await answer_with_memory(
+        chat, question, session_id, current_user, request, background_tasks, stream, "tutor",
+        answer_cache_scope=(course_id, curriculum_version)
+    )
+
+
+@api_router.delete("/ai/tutor/session")
+async def reset_tutor_session(course_id: str, current_user: User = Depends(get_current_user)):
+    """Start a fresh tutor conversation for a course"""
+    await chat_memory.clear_session(db, f"tutor-{current_user.id}-{course_id}")
+    return {"message": "Tutor conversation cleared"}
 
 
 @api_router.get("/ai/recommendations")
@@ -2470,6 +3260,48 @@ async def get_analytics(current_user: User = Depends(get_current_user)):
     }
 
 
+@api_router.post("/admin/progress/reconcile")
+async def reconcile_all_progress(background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
+    """Schedule progress reconciliation for every course (Admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    course_ids = await db.enrollments.distinct("course_id")
+    for course_id in course_ids:
+        background_tasks.add_task(reconcile_course_progress, course_id)
+    
+    return {"message": f"Reconciliation scheduled for {len(course_ids)} courses"}
+
+
+@api_router.get("/admin/llm-usage")
+async def get_llm_usage(days: int = 7, current_user: User = Depends(get_current_user)):
+    """Daily LLM calls, tokens, latency and estimated cost per provider/model/tag (Admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    since = (datetime.now(timezone.utc) - timedelta(days=max(1, min(days, 366)) - 1)).strftime("%Y-%m-%d")
+    rows = await db.llm_usage_daily.find({"date": {"$gte": since}}, {"_id": 0}).sort("date", -1).to_list(None)
+    
+    totals = {}
+    for row in rows:
+        tag = totals.setdefault(row['tag'], {"calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+        for field in tag:
+            tag[field] += row.get(field, 0)
+    for row in rows:
+        row['avg_latency_seconds'] = row.get('latency_seconds', 0) / row['calls'] if row.get('calls') else 0
+    
+    return {"since": since, "by_tag": totals, "daily": rows}
+
+
+@api_router.get("/admin/metrics")
+async def get_metrics(current_user: User = Depends(get_current_user)):
+    """In-process counters, gauges and latency summaries (Admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    return metrics.snapshot()
+
+
 @api_router.get("/admin/users")
 async def get_all_users(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
@@ -2588,6 +3420,8 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
     # Clean up related data
     await db.instructors.delete_many({"user_id": user_id})
     await db.enrollments.delete_many({"user_id": user_id})
+    await db.student_course_state.delete_many({"user_id": user_id})
+    await db.chat_sessions.delete_many({"user_id": user_id})
     
     return {"message": "User deleted successfully"}
 
@@ -2620,6 +3454,7 @@ async def create_quiz(quiz_data: dict, current_user: User = Depends(get_current_
     if 'created_at' in doc and isinstance(doc['created_at'], datetime):
         doc['created_at'] = doc['created_at'].isoformat()
     await db.quizzes.insert_one(doc)
+    await refresh_course_quiz_requirements(quiz.course_id)
     return quiz
 
 
@@ -2668,6 +3503,7 @@ async def delete_quiz(quiz_id: str, current_user: User = Depends(get_current_use
         raise HTTPException(status_code=403, detail="Not authorized")
     
     await db.quizzes.delete_one({"id": quiz_id})
+    await refresh_course_quiz_requirements(quiz['course_id'], removed_quiz_id=quiz_id)
     return {"message": "Quiz deleted"}
 
 
@@ -2739,15 +3575,20 @@ async def submit_quiz(quiz_id: str, answers: List[int], current_user: User = Dep
     )
 
     # If enrollment progress is already >= 95, mark it as completed so cert check passes
-    enrollment = await db.enrollments.find_one({"user_id": current_user.id, "course_id": quiz['course_id']})
-    if enrollment and enrollment.get('progress', 0) >= 95:
-        await db.enrollments.update_one(
-            {"user_id": current_user.id, "course_id": quiz['course_id']},
-            {"$set": {"status": "completed", "progress": 100}}
-        )
+    rounded = await db.enrollments.update_one(
+        {"user_id": current_user.id, "course_id": quiz['course_id'], "progress": {"$gte": CERTIFICATE_MIN_PROGRESS}},
+        {"$set": {"status": "completed", "progress": 100}}
+    )
 
-    # Check if user is eligible for certificate after quiz submission
-    cert_id = await generate_certificate_if_eligible(current_user.id, quiz['course_id'])
+    # Fold the result into the materialized state, then issue the certificate if it became eligible
+    state = await update_course_state(
+        current_user.id,
+        quiz['course_id'],
+        progress=100 if rounded.matched_count else None,
+        quiz_id=quiz_id,
+        quiz_passed=score >= QUIZ_PASS_SCORE
+    )
+    cert_id = await generate_certificate_if_eligible(current_user.id, quiz['course_id'], state)
     certificate_earned = cert_id is not None
 
     return {
@@ -2762,113 +3603,258 @@ async def submit_quiz(quiz_id: str, answers: List[int], current_user: User = Dep
 
 
 # ==================== HELPER FUNCTIONS ====================
-def generate_certificate_pdf(user_name: str, course_title: str, completion_date: str, certificate_id: str) -> bytes:
-    """Generate a professional certificate PDF"""
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # Background border
-    c.setStrokeColor(colors.HexColor('#10b981'))
-    c.setLineWidth(10)
-    c.rect(30, 30, width - 60, height - 60)
-    
-    # Inner border
-    c.setStrokeColor(colors.HexColor('#059669'))
-    c.setLineWidth(2)
-    c.rect(50, 50, width - 100, height - 100)
-    
-    # Title
-    c.setFont("Helvetica-Bold", 48)
-    c.setFillColor(colors.HexColor('#10b981'))
-    c.drawCentredString(width / 2, height - 120, "Certificate")
-    
-    c.setFont("Helvetica", 28)
-    c.setFillColor(colors.HexColor('#374151'))
-    c.drawCentredString(width / 2, height - 160, "of Completion")
-    
-    # Divider line
-    c.setStrokeColor(colors.HexColor('#d1fae5'))
-    c.setLineWidth(2)
-    c.line(150, height - 190, width - 150, height - 190)
-    
-    # Presented to text
-    c.setFont("Helvetica", 18)
-    c.setFillColor(colors.HexColor('#6b7280'))
-    c.drawCentredString(width / 2, height - 240, "This certificate is presented to")
-    
-    # Student name
-    c.setFont("Helvetica-Bold", 36)
-    c.setFillColor(colors.HexColor('#1a1a1a'))
-    c.drawCentredString(width / 2, height - 300, user_name)
-    
-    # Achievement text
-    c.setFont("Helvetica", 16)
-    c.setFillColor(colors.HexColor('#6b7280'))
-    c.drawCentredString(width / 2, height - 350, "for successfully completing the course")
-    
-    # Course title
-    c.setFont("Helvetica-Bold", 24)
-    c.setFillColor(colors.HexColor('#10b981'))
-    c.drawCentredString(width / 2, height - 400, course_title)
-    
-    # Completion date
-    c.setFont("Helvetica", 14)
-    c.setFillColor(colors.HexColor('#6b7280'))
-    c.drawCentredString(width / 2, height - 470, f"Completed on {completion_date}")
-    
-    # Certificate ID
-    c.setFont("Helvetica", 10)
-    c.setFillColor(colors.HexColor('#9ca3af'))
-    c.drawCentredString(width / 2, 100, f"Certificate ID: {certificate_id}")
-    
-    # Platform name
-    c.setFont("Helvetica-Bold", 16)
-    c.setFillColor(colors.HexColor('#10b981'))
-    c.drawCentredString(width / 2, 140, "BritSyncAI Academy")
-    
-    c.save()
-    buffer.seek(0)
-    return buffer.getvalue()
 
+# Certificate requirements: course (almost) completed and every quiz passed.
+# >= 95 rather than 100 absorbs floating point rounding of progress.
+CERTIFICATE_MIN_PROGRESS = 95
+QUIZ_PASS_SCORE = 70
+
+# Recomputed after every state change; runs inside update pipelines
+COURSE_STATE_ELIGIBILITY = {
+    "eligible": {"$and": [
+        {"$gte": [{"$ifNull": ["$progress", 0]}, CERTIFICATE_MIN_PROGRESS]},
+        {"$gte": [
+            {"$size": {"$ifNull": ["$passed_quiz_ids", []]}},
+            {"$ifNull": ["$quizzes_required", 0]}
+        ]}
+    ]},
+    "quizzes_passed": {"$size": {"$ifNull": ["$passed_quiz_ids", []]}},
+    "updated_at": {"$dateToString": {"date": "$$NOW", "format": "%Y-%m-%dT%H:%M:%S.%L+00:00"}},
+}
+
+
+async def rebuild_course_state(user_id: str, course_id: str) -> Optional[dict]:
+    """Build a student's course state from enrollments, quizzes and quiz results"""
+    enrollment = await db.enrollments.find_one(
+        {"user_id": user_id, "course_id": course_id},
+        {"_id": 0, "id": 1, "progress": 1}
+    )
+    if not enrollment:
+        return None
+    
+    quiz_ids = await db.quizzes.distinct("id", {"course_id": course_id})
+    # Only the latest attempt counts, as in update_course_state (older data may hold several per quiz)
+    latest_results = await db.quiz_results.aggregate([
+        {"$match": {"user_id": user_id, "quiz_id": {"$in": quiz_ids}}},
+        {"$sort": {"submitted_at": -1}},
+        {"$group": {"_id": "$quiz_id", "score": {"$first": "$score"}}},
+        {"$match": {"score": {"$gte": QUIZ_PASS_SCORE}}}
+    ]).to_list(None) if quiz_ids else []
+    passed_quiz_ids = [result['_id'] for result in latest_results]
+    certificate = await db.certificates.find_one(
+        {"user_id": user_id, "course_id": course_id},
+        {"_id": 0, "id": 1}
+    )
+    
+    progress = enrollment.get('progress', 0)
+    state = StudentCourseState(
+        user_id=user_id,
+        course_id=course_id,
+        enrollment_id=enrollment['id'],
+        progress=progress,
+        passed_quiz_ids=passed_quiz_ids,
+        quizzes_passed=len(passed_quiz_ids),
+        quizzes_required=len(quiz_ids),
+        eligible=progress >= CERTIFICATE_MIN_PROGRESS and len(passed_quiz_ids) >= len(quiz_ids),
+        certificate_id=certificate['id'] if certificate else None
+    )
+    doc = state.model_dump()
+    doc['updated_at'] = doc['updated_at'].isoformat()
+    state_id = doc.pop('id')
+    await db.student_course_state.update_one(
+        {"user_id": user_id, "course_id": course_id},
+        {"$set": doc, "$setOnInsert": {"id": state_id}},
+        upsert=True
+    )
+    return {**doc, "id": state_id}
 
-async def check_certificate_eligibility(user_id: str, course_id: str) -> tuple[bool, str]:
-    """Check if user is eligible for certificate (100% completion + all quizzes passed)"""
-    # Check enrollment and progress — use >= 95 to handle floating point rounding
-    enrollment = await db.enrollments.find_one({"user_id": user_id, "course_id": course_id})
-    if not enrollment or enrollment.get('progress', 0) < 95:
-        return False, f"Course not completed (progress: {enrollment.get('progress', 0) if enrollment else 0}%)"
 
-    # Get all quizzes for the course
-    quizzes = await db.quizzes.find({"course_id": course_id}, {"_id": 0}).to_list(1000)
+async def get_course_state(user_id: str, course_id: str) -> Optional[dict]:
+    """Single indexed read of a student's course state, built on first access"""
+    state = await db.student_course_state.find_one(
+        {"user_id": user_id, "course_id": course_id},
+        {"_id": 0}
+    )
+    if state is None:
+        state = await rebuild_course_state(user_id, course_id)
+    return state
+
+
+async def update_course_state(
+    user_id: str,
+    course_id: str,
+    progress: Optional[float] = None,
+    quiz_id: Optional[str] = None,
+    quiz_passed: bool = False
+) -> Optional[dict]:
+    """Apply a lesson-progress or quiz-result event to a student's course state"""
+    stages = []
+    if progress is not None:
+        stages.append({"$set": {"progress": progress}})
+    if quiz_id is not None:
+        passed_ids = {"$ifNull": ["$passed_quiz_ids", []]}
+        stages.append({"$set": {"passed_quiz_ids": (
+            {"$setUnion": [passed_ids, [quiz_id]]} if quiz_passed
+            else {"$setDifference": [passed_ids, [quiz_id]]}
+        )}})
+    stages.append({"$set": COURSE_STATE_ELIGIBILITY})
+    
+    state = await db.student_course_state.find_one_and_update(
+        {"user_id": user_id, "course_id": course_id},
+        stages,
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if state is None:
+        # No state yet: build it from the data the event has already written
+        state = await rebuild_course_state(user_id, course_id)
+    return state
 
-    if quizzes:
-        # Check if all quizzes are passed (score >= 70) — use latest result per quiz
-        for quiz in quizzes:
-            quiz_result = await db.quiz_results.find_one(
-                {"user_id": user_id, "quiz_id": quiz['id']},
-                sort=[("submitted_at", -1)]  # Latest attempt
-            )
-            if not quiz_result or quiz_result['score'] < 70:
-                return False, f"Quiz '{quiz['title']}' not passed (minimum 70% required)"
 
-    return True, "Eligible"
+async def refresh_course_quiz_requirements(course_id: str, removed_quiz_id: Optional[str] = None):
+    """Re-evaluate every student's state of a course after its quiz set changed"""
+    quizzes_required = await db.quizzes.count_documents({"course_id": course_id})
+    stages = [{"$set": {"quizzes_required": quizzes_required}}]
+    if removed_quiz_id:
+        stages.append({"$set": {"passed_quiz_ids": {
+            "$setDifference": [{"$ifNull": ["$passed_quiz_ids", []]}, [removed_quiz_id]]
+        }}})
+    stages.append({"$set": COURSE_STATE_ELIGIBILITY})
+    await db.student_course_state.update_many({"course_id": course_id}, stages)
 
 
-async def generate_certificate_if_eligible(user_id: str, course_id: str):
-    """Auto-generate certificate if user is eligible"""
-    # Check if certificate already exists
-    existing = await db.certificates.find_one({"user_id": user_id, "course_id": course_id})
-    if existing:
-        return existing['id']
+# reportlab is CPU-bound: renders run in a bounded process pool, not on the event loop
+certificate_renderer = CertificateRenderService()
+metrics.register_gauge("certificate_render_queue_depth", lambda: certificate_renderer.queue_depth)
+
+# Recently served certificates are kept in memory; the disk cache holds the rest
+_certificate_pdf_cache: LRUCache = LRUCache(maxsize=256)
+# In-flight renders, so concurrent misses for one certificate render it once
+_certificate_renders: Dict[str, asyncio.Future] = {}
+
+
+class _CertificateRenderAbandoned(Exception):
+    """The request that started a shared render was cancelled before it finished"""
+
+
+def certificate_verify_token(certificate_id: str, user_name: str, course_title: str, issued_date: str) -> str:
+    """Signed token for the certificate's QR code and public verify URL"""
+    return sign_certificate(CERTIFICATE_SIGNING_KEY, certificate_id, user_name, course_title, issued_date[:10])
+
+
+def certificate_cache_key(certificate_id: str, verify_token: str) -> str:
+    """Cache key that changes whenever anything printed on the certificate changes.
+    The token covers name, title and date, and changes if the signing key rotates."""
+    digest = hashlib.sha256(verify_token.encode("utf-8")).hexdigest()[:16]
+    return f"{certificate_id}-{digest}"
+
+
+async def get_certificate_pdf(
+    certificate_id: str,
+    user_name: str,
+    course_title: str,
+    issued_date: str,
+    keep_in_memory: bool = True
+) -> tuple[str, bytes]:
+    """Return (cache_key, pdf_bytes), rendering in the process pool only on a cache miss.
+    Bulk exports pass keep_in_memory=False so they don't evict hot certificates."""
+    verify_token = certificate_verify_token(certificate_id, user_name, course_title, issued_date)
+    key = certificate_cache_key(certificate_id, verify_token)
+    
+    pdf_bytes = _certificate_pdf_cache.get(key)
+    if pdf_bytes is not None:
+        return key, pdf_bytes
+    
+    while (pending := _certificate_renders.get(key)) is not None:
+        try:
+            return key, await asyncio.shield(pending)
+        except _CertificateRenderAbandoned:
+            # Its owner went away (client disconnect, cancelled export); take the render over
+            continue
+    
+    future = asyncio.get_running_loop().create_future()
+    _certificate_renders[key] = future
+    try:
+        cache_path = CERTIFICATE_CACHE_DIR / f"{key}.pdf"
+        try:
+            pdf_bytes = await asyncio.to_thread(cache_path.read_bytes)
+        except FileNotFoundError:
+            started = time.perf_counter()
+            try:
+                pdf_bytes = await certificate_renderer.render(
+                    user_name,
+                    course_title,
+                    datetime.fromisoformat(issued_date).strftime("%B %d, %Y"),
+                    certificate_id,
+                    verify_url=f"{CERTIFICATE_VERIFY_URL}/{verify_token}"
+                )
+            except CertificateQueueFull:
+                metrics.inc("certificate_render_rejected")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Certificate service is busy, please retry shortly",
+                    headers={"Retry-After": "5"}
+                )
+            metrics.observe("certificate_render_seconds", time.perf_counter() - started)
+            try:
+                await asyncio.to_thread(cache_path.write_bytes, pdf_bytes)
+            except OSError as e:
+                logger.warning(f"Could not write certificate cache {cache_path}: {e}")
+        
+        if keep_in_memory:
+            _certificate_pdf_cache[key] = pdf_bytes
+        future.set_result(pdf_bytes)
+        return key, pdf_bytes
+    except BaseException as e:
+        # Cancellation is not an Exception, but waiters must still be released
+        future.set_exception(e if isinstance(e, Exception) else _CertificateRenderAbandoned())
+        # Mark the exception as retrieved when nobody else was waiting on it
+        future.exception()
+        raise
+    finally:
+        _certificate_renders.pop(key, None)
+
+
+async def check_certificate_eligibility(user_id: str, course_id: str) -> tuple[bool, str]:
+    """Check if user is eligible for certificate (100% completion + all quizzes passed)"""
+    state = await get_course_state(user_id, course_id)
+    if not state or state.get('progress', 0) < CERTIFICATE_MIN_PROGRESS:
+        return False, f"Course not completed (progress: {state.get('progress', 0) if state else 0}%)"
+    
+    if not state['eligible']:
+        return False, (
+            f"{state['quizzes_passed']} of {state['quizzes_required']} quizzes passed "
+            f"(minimum {QUIZ_PASS_SCORE}% required on each)"
+        )
     
-    # Check eligibility
-    eligible, message = await check_certificate_eligibility(user_id, course_id)
-    if not eligible:
+    return True, "Eligible"
+
+
+async def generate_certificate_if_eligible(user_id: str, course_id: str, state: Optional[dict] = None):
+    """Issue a certificate once the student's course state becomes eligible"""
+    if state is None:
+        state = await get_course_state(user_id, course_id)
+    if not state:
+        return None
+    if state.get('certificate_id'):
+        return state['certificate_id']
+    if not state.get('eligible'):
         return None
     
-    # Create certificate
+    # Claim the certificate slot on the state document so concurrent events
+    # for the same student cannot issue two certificates
     certificate = Certificate(user_id=user_id, course_id=course_id)
+    claimed = await db.student_course_state.update_one(
+        {"user_id": user_id, "course_id": course_id, "eligible": True, "certificate_id": None},
+        {"$set": {"certificate_id": certificate.id}}
+    )
+    if not claimed.modified_count:
+        current = await db.student_course_state.find_one(
+            {"user_id": user_id, "course_id": course_id},
+            {"_id": 0, "certificate_id": 1}
+        )
+        return current.get('certificate_id') if current else None
+    
     doc = certificate.model_dump()
     doc['issued_date'] = doc['issued_date'].isoformat()
     await db.certificates.insert_one(doc)
@@ -2894,6 +3880,30 @@ async def get_my_certificates(current_user: User = Depends(get_current_user)):
     return result
 
 
+# Declared before /certificates/{certificate_id} so "verify" is never taken for an ID
+@api_router.get("/certificates/verify/{token}")
+async def verify_certificate(token: str):
+    """Check a certificate's signed token; no database access, so responses are cacheable"""
+    payload = verify_certificate_token(CERTIFICATE_SIGNING_KEY, token)
+    if payload is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid or tampered certificate token",
+            headers={"Cache-Control": "public, max-age=300"}
+        )
+    
+    return JSONResponse(
+        content={
+            "valid": True,
+            "certificate_id": payload['id'],
+            "user_name": payload['name'],
+            "course_title": payload['course'],
+            "issued_date": payload['issued'],
+        },
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
+
+
 @api_router.get("/certificates/{certificate_id}")
 async def get_certificate(certificate_id: str):
     cert = await db.certificates.find_one({"id": certificate_id}, {"_id": 0})
@@ -2903,40 +3913,159 @@ async def get_certificate(certificate_id: str):
     user = await db.users.find_one({"id": cert['user_id']}, {"_id": 0, "password": 0})
     course = await db.courses.find_one({"id": cert['course_id']}, {"_id": 0})
     
-    return {**cert, "user": user, "course": course}
+    verify_url = None
+    if user and course:
+        verify_token = certificate_verify_token(certificate_id, user['name'], course['title'], cert['issued_date'])
+        verify_url = f"{CERTIFICATE_VERIFY_URL}/{verify_token}"
+    
+    return {**cert, "user": user, "course": course, "verify_url": verify_url}
 
 
 @api_router.get("/certificates/{certificate_id}/download")
-async def download_certificate(certificate_id: str):
+async def download_certificate(certificate_id: str, request: Request):
     cert = await db.certificates.find_one({"id": certificate_id}, {"_id": 0})
     if not cert:
         raise HTTPException(status_code=404, detail="Certificate not found")
     
-    user = await db.users.find_one({"id": cert['user_id']}, {"_id": 0, "password": 0})
-    course = await db.courses.find_one({"id": cert['course_id']}, {"_id": 0})
+    user = await db.users.find_one({"id": cert['user_id']}, {"_id": 0, "name": 1})
+    course = await db.courses.find_one({"id": cert['course_id']}, {"_id": 0, "title": 1})
     
     if not user or not course:
         raise HTTPException(status_code=404, detail="User or course not found")
     
-    # Generate PDF
-    completion_date = datetime.fromisoformat(cert['issued_date']).strftime("%B %d, %Y")
-    pdf_bytes = generate_certificate_pdf(
+    # Answer revalidation before touching the renderer or the cache
+    verify_token = certificate_verify_token(certificate_id, user['name'], course['title'], cert['issued_date'])
+    etag = f'"{certificate_cache_key(certificate_id, verify_token)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    _, pdf_bytes = await get_certificate_pdf(
+        certificate_id=certificate_id,
         user_name=user['name'],
         course_title=course['title'],
-        completion_date=completion_date,
-        certificate_id=certificate_id
+        issued_date=cert['issued_date']
     )
     
-    # Save to temp file and return (cross-platform)
-    temp_dir = tempfile.gettempdir()
-    temp_path = os.path.join(temp_dir, f"certificate_{certificate_id}.pdf")
-    with open(temp_path, "wb") as f:
-        f.write(pdf_bytes)
+    headers["Content-Disposition"] = content_disposition(f"Certificate_{course['title'].replace(' ', '_')}.pdf")
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable write target for zipfile; drained after each entry so only one
+    certificate at a time is held in memory while the archive streams out"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        return chunk
+
+
+# Renders in flight per export request, so one export can't take the whole pool
+CERTIFICATE_EXPORT_CONCURRENCY = 8
+
+
+@api_router.get("/courses/{course_id}/certificates/export")
+async def export_course_certificates(course_id: str, current_user: User = Depends(get_current_user)):
+    """Stream a ZIP of every certificate issued for a course (admin or course owner)"""
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "id": 1, "title": 1, "instructor_id": 1})
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
     
-    return FileResponse(
-        temp_path,
-        media_type="application/pdf",
-        filename=f"Certificate_{course['title'].replace(' ', '_')}.pdf"
+    if current_user.role != "admin":
+        instructor = await db.instructors.find_one({"user_id": current_user.id}, {"_id": 0, "id": 1})
+        if not instructor or instructor['id'] != course['instructor_id']:
+            raise HTTPException(status_code=403, detail="Not authorized to export certificates for this course")
+    
+    certs = await db.certificates.find(
+        {"course_id": course_id},
+        {"_id": 0, "id": 1, "user_id": 1, "issued_date": 1}
+    ).to_list(None)
+    if not certs:
+        raise HTTPException(status_code=404, detail="No certificates issued for this course")
+    
+    users = await db.users.find(
+        {"id": {"$in": list({cert['user_id'] for cert in certs})}},
+        {"_id": 0, "id": 1, "name": 1}
+    ).to_list(None)
+    names = {user['id']: user['name'] for user in users}
+    certs = [cert for cert in certs if cert['user_id'] in names]
+    
+    async def render(cert: dict) -> tuple[dict, Optional[bytes], Optional[str]]:
+        """(cert, pdf_bytes, None), or (cert, None, reason) when the certificate couldn't be rendered.
+        Headers are already sent once the archive streams, so failures must not escape."""
+        try:
+            _, pdf_bytes = await get_certificate_pdf(
+                certificate_id=cert['id'],
+                user_name=names[cert['user_id']],
+                course_title=course['title'],
+                issued_date=cert['issued_date'],
+                keep_in_memory=False
+            )
+            return cert, pdf_bytes, None
+        except HTTPException as e:
+            return cert, None, e.detail
+        except Exception as e:
+            logger.error(f"Certificate {cert['id']} failed to render for export: {e}")
+            return cert, None, "Rendering failed"
+    
+    async def archive():
+        # At most CERTIFICATE_EXPORT_CONCURRENCY renders are in flight or waiting to be
+        # written; the next one starts only after an entry has been handed to the client
+        queued = iter(certs)
+        in_flight = set()
+        sink = _ZipSink()
+        errors = []
+        
+        def top_up():
+            for cert in queued:
+                in_flight.add(asyncio.ensure_future(render(cert)))
+                if len(in_flight) >= CERTIFICATE_EXPORT_CONCURRENCY:
+                    break
+        
+        try:
+            top_up()
+            # PDFs are already compressed, so entries are stored rather than deflated
+            with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as bundle:
+                while in_flight:
+                    done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for finished in done:
+                        in_flight.discard(finished)
+                        cert, pdf_bytes, error = finished.result()
+                        safe_name = re.sub(r"[^A-Za-z0-9_-]+", "_", names[cert['user_id']]).strip("_") or "student"
+                        entry = f"{safe_name}_{cert['id'][:8]}.pdf"
+                        if error:
+                            errors.append(f"{entry}: {error}")
+                            continue
+                        bundle.writestr(entry, pdf_bytes)
+                        yield sink.drain()
+                    top_up()
+                if errors:
+                    metrics.inc("certificate_export_errors", len(errors))
+                    bundle.writestr(
+                        "errors.txt",
+                        "These certificates could not be included; export again to retry them.\n\n" + "\n".join(errors) + "\n"
+                    )
+            yield sink.drain()
+        finally:
+            for task in in_flight:
+                task.cancel()
+    
+    filename = f"Certificates_{course['title'].replace(' ', '_')}.zip"
+    return StreamingResponse(
+        archive(),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(filename)}
     )
 
 
@@ -3229,24 +4358,55 @@ async def get_blog_posts(limit: int = 3):
 
 @api_router.post("/admin/newsletter/generate")
 async def generate_newsletter(current_user: User = Depends(get_current_user)):
-    """Generate weekly blog (Admin only)"""
+    """Start the weekly blog generation job now (Admin only)"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     
-    blog = await newsletter.generate_weekly_blog(db)
-    if blog:
-        return {"message": "Blog generated", "title": blog.get("title")}
-    return {"message": "Failed to generate blog"}
+    run = await start_job("newsletter-generate")
+    return {"message": "Blog generation started", "run_id": run['id']}
+
+
+@api_router.post("/admin/newsletter/drafts")
+async def generate_newsletter_drafts(count: int = 3, current_user: User = Depends(get_current_user)):
+    """Draft posts for several featured courses in parallel (Admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    drafts = await newsletter.generate_blog_drafts(db, count=max(1, min(count, 5)))
+    if not drafts:
+        raise HTTPException(status_code=502, detail="Failed to generate drafts")
+    return drafts
+
+
+@api_router.get("/admin/newsletter/drafts")
+async def list_newsletter_drafts(current_user: User = Depends(get_current_user)):
+    """Unpublished newsletter drafts (Admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    return await db.blog_posts.find({"status": "draft"}, {"_id": 0}).sort("created_at", -1).to_list(50)
+
+
+@api_router.post("/admin/newsletter/drafts/{draft_id}/publish")
+async def publish_newsletter_draft(draft_id: str, current_user: User = Depends(get_current_user)):
+    """Publish the chosen draft and discard the rest of its batch (Admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    blog = await newsletter.publish_blog_draft(db, draft_id)
+    if not blog:
+        raise HTTPException(status_code=404, detail="Draft not found")
+    return {"message": "Blog published", "title": blog["title"], "id": blog["id"]}
 
 
 @api_router.post("/admin/newsletter/send")
 async def send_newsletter_now(current_user: User = Depends(get_current_user)):
-    """Send newsletter to subscribers (Admin only)"""
+    """Start the newsletter send job now (Admin only)"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     
-    result = await newsletter.send_weekly_newsletter(db)
-    return result
+    run = await start_job("newsletter-send")
+    return {"message": "Newsletter send started", "run_id": run['id']}
 
 
 @api_router.get("/stats")
@@ -3281,10 +4441,266 @@ async def get_platform_stats():
         }
 
 
+# ==================== SCHEDULED JOBS ====================
+def _as_utc(value) -> Optional[datetime]:
+    """Stored timestamps are ISO strings or datetimes, sometimes naive; naive means UTC"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def run_newsletter_generation():
+    blog = await newsletter.generate_weekly_blog(db)
+    if not blog:
+        raise RuntimeError("Blog generation failed or no published course")
+    return {"blog_id": blog['id'], "title": blog['title']}
+
+
+async def run_newsletter_send():
+    result = await newsletter.send_weekly_newsletter(db)
+    if "error" in result:
+        raise RuntimeError(result['error'])
+    return result
+
+
+async def update_live_class_statuses():
+    """Move live classes to live when they start and to completed when they end"""
+    now = datetime.now(timezone.utc)
+    live_classes = await db.live_classes.find(
+        {"status": {"$in": ["scheduled", "live"]}},
+        {"_id": 0, "id": 1, "status": 1, "scheduled_at": 1, "duration": 1}
+    ).to_list(None)
+    
+    to_live, to_completed = [], []
+    for live_class in live_classes:
+        try:
+            starts = _as_utc(live_class['scheduled_at'])
+        except (KeyError, ValueError, TypeError):
+            continue
+        ends = starts + timedelta(minutes=int(live_class.get('duration') or 0))
+        if now >= ends:
+            to_completed.append(live_class['id'])
+        elif now >= starts and live_class['status'] == "scheduled":
+            to_live.append(live_class['id'])
+    
+    if to_live:
+        await db.live_classes.update_many({"id": {"$in": to_live}, "status": "scheduled"}, {"$set": {"status": "live"}})
+    if to_completed:
+        await db.live_classes.update_many(
+            {"id": {"$in": to_completed}, "status": {"$in": ["scheduled", "live"]}},
+            {"$set": {"status": "completed"}}
+        )
+    return {"live": len(to_live), "completed": len(to_completed)}
+
+
+async def build_missing_thumbnail_variants():
+    """Process course thumbnails uploaded before the variant pipeline.
+    Failed and missing images are flagged on the course and not retried."""
+    courses = await db.courses.find(
+        # Thumbnails are stored with or without the backend origin
+        {"thumbnail": {"$regex": "/uploads/thumbnails/[^/]+$"}, "thumbnail_srcset": None, "thumbnail_status": None},
+        {"_id": 0, "thumbnail": 1}
+    ).to_list(200)
+    processed = failed = missing = 0
+    for url in {course['thumbnail'] for course in courses}:
+        if thumbnail_processor.source_path(url) is None:
+            # Not on this server's disk; flag it so it isn't picked up again every run
+            await db.courses.update_many(
+                {"thumbnail": url, "thumbnail_status": None},
+                {"$set": {"thumbnail_status": "missing"}}
+            )
+            missing += 1
+        elif await thumbnail_processor.process(db, url):
+            processed += 1
+        else:
+            failed += 1
+    return {"processed": processed, "failed": failed, "missing": missing}
+
+
+async def process_missing_lesson_pdfs():
+    """Inspect lesson PDFs uploaded before the PDF pipeline"""
+    pdf_url = {"$regex": "/uploads/pdfs/[^/]+\\.pdf$"}
+    lessons = await db.lessons.find(
+        {"$or": [
+            {"content_url": pdf_url, "content_pdf": None},
+            {"notes_url": pdf_url, "notes_pdf": None},
+        ]},
+        {"_id": 0, "content_url": 1, "notes_url": 1, "content_pdf": 1, "notes_pdf": 1}
+    ).to_list(200)
+    urls = set()
+    for lesson in lessons:
+        if lesson.get('content_url') and not lesson.get('content_pdf'):
+            urls.add(lesson['content_url'])
+        if lesson.get('notes_url') and not lesson.get('notes_pdf'):
+            urls.add(lesson['notes_url'])
+    
+    processed = invalid = missing = 0
+    for url in urls:
+        if pdf_processor.source_path(url) is None:
+            # Not on this server's disk; flag it so it isn't picked up again every run
+            for url_field, summary_field in (("content_url", "content_pdf"), ("notes_url", "notes_pdf")):
+                await db.lessons.update_many(
+                    {url_field: url, summary_field: None},
+                    {"$set": {summary_field: {"status": "missing"}}}
+                )
+            missing += 1
+        elif await pdf_processor.process(db, url):
+            processed += 1
+        else:
+            invalid += 1
+    return {"processed": processed, "invalid": invalid, "missing": missing}
+
+
+async def cleanup_stale_records():
+    """Drop abandoned newsletter drafts, expire stale checkouts and prune job history"""
+    now = datetime.now(timezone.utc)
+    drafts = await db.blog_posts.delete_many({
+        "status": "draft",
+        "created_at": {"$lt": (now - timedelta(days=7)).isoformat()}
+    })
+    # Stripe checkout sessions expire after 24 hours
+    payments = await db.payments.update_many(
+        {"payment_status": "pending", "created_at": {"$lt": (now - timedelta(hours=24)).isoformat()}},
+        {"$set": {"payment_status": "failed"}}
+    )
+    runs = await db.job_runs.delete_many({"started_at": {"$lt": now - timedelta(days=30)}})
+    partials = 0
+    for directory in (THUMBNAIL_DIR, PDF_DIR):
+        partials += await asyncio.to_thread(uploads.cleanup_partials, directory, 3600)
+    partials += await asyncio.to_thread(resumable_uploads.cleanup_expired)
+    return {
+        "drafts_deleted": drafts.deleted_count,
+        "payments_expired": payments.modified_count,
+        "job_runs_pruned": runs.deleted_count,
+        "partial_uploads_removed": partials,
+    }
+
+
+job_scheduler = JobScheduler(db, [
+    Job("newsletter-generate", "0 8 * * 1", run_newsletter_generation,
+        description="Write and publish the weekly blog post", lease_seconds=600),
+    Job("newsletter-send", "0 9 * * 1", run_newsletter_send,
+        description="Email the latest unsent blog post to subscribers", lease_seconds=600),
+    Job("live-class-status", "*/5 * * * *", update_live_class_statuses,
+        description="Mark live classes as live or completed", lease_seconds=120),
+    Job("thumbnail-variants", "20 * * * *", build_missing_thumbnail_variants,
+        description="Build responsive variants for course thumbnails that lack them", lease_seconds=900),
+    Job("lesson-pdfs", "40 * * * *", process_missing_lesson_pdfs,
+        description="Extract page count, text and previews for lesson PDFs that lack them", lease_seconds=900),
+    Job("cleanup", "30 3 * * *", cleanup_stale_records,
+        description="Remove stale drafts, pending payments, old job runs and abandoned uploads"),
+])
+
+
+async def start_job(name: str) -> dict:
+    if name not in job_scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    run = await job_scheduler.trigger(name)
+    if run is None:
+        raise HTTPException(status_code=409, detail="Job is already running")
+    return run
+
+
+@api_router.get("/admin/jobs")
+async def list_jobs(current_user: User = Depends(get_current_user)):
+    """Scheduled jobs with their next run and last outcome (Admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    return await job_scheduler.status()
+
+
+@api_router.get("/admin/jobs/runs")
+async def list_job_runs(job: Optional[str] = None, limit: int = 50, current_user: User = Depends(get_current_user)):
+    """Recent job runs, newest first (Admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    return await job_scheduler.history(job, max(1, min(limit, 200)))
+
+
+@api_router.post("/admin/jobs/{name}/run")
+async def run_job_now(name: str, current_user: User = Depends(get_current_user)):
+    """Run a job immediately on this replica (Admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    return await start_job(name)
+
+
+# ==================== STARTUP ====================
+@app.on_event("startup")
+async def ensure_indexes():
+    """Create the indexes the hot read paths rely on (no-op when they exist)"""
+    try:
+        await db.lessons.create_index([("course_id", 1), ("ordinal", 1)])
+        await db.lessons.create_index("id")
+        await db.enrollments.create_index("id")
+        await db.enrollments.create_index([("user_id", 1), ("course_id", 1)])
+        await db.enrollments.create_index("course_id")
+        await db.student_course_state.create_index([("user_id", 1), ("course_id", 1)], unique=True)
+        await db.student_course_state.create_index("course_id")
+        await db.chat_sessions.create_index("session_id", unique=True)
+        await db.chat_sessions.create_index("expires_at", expireAfterSeconds=0)
+        await db.llm_usage_daily.create_index([("date", 1), ("provider", 1), ("model", 1), ("tag", 1)], unique=True)
+        await db.job_runs.create_index([("job", 1), ("started_at", -1)])
+        await db.job_runs.create_index("started_at")
+        await db.media_assets.create_index("id", unique=True)
+        await db.media_assets.create_index("url")
+    except Exception as e:
+        logger.warning(f"Index creation skipped: {e}")
+
+
 # Include router AFTER all routes are defined
 app.include_router(api_router)
 
 
+@app.on_event("shutdown")
+async def shutdown_certificate_renderer():
+    certificate_renderer.shutdown()
+
+
+@app.on_event("shutdown")
+async def shutdown_media_workers():
+    media_workers.shutdown()
+
+
+# Every LLM call feeds /admin/metrics and the llm_usage_daily rollup
+llm_usage_recorder = LlmUsageRecorder()
+add_call_sink(llm_usage_recorder.record)
+_llm_usage_flusher: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_llm_usage_flusher():
+    global _llm_usage_flusher
+    _llm_usage_flusher = asyncio.create_task(llm_usage_recorder.run(db))
+
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    if _llm_usage_flusher:
+        _llm_usage_flusher.cancel()
+        try:
+            await _llm_usage_flusher
+        except asyncio.CancelledError:
+            pass
+    await aclose_clients()
+
+
+@app.on_event("startup")
+async def start_job_scheduler():
+    if os.environ.get("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes"):
+        await job_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_scheduler():
+    await job_scheduler.stop()
+
+
 # @app.on_event("shutdown")
 # async def shutdown_db_client():
 #     client.close()
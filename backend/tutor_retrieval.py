@@ -0,0 +1,229 @@
+"""
+Retrieval for the AI tutor
+Lesson text, descriptions and lesson PDFs are split into chunks and indexed
+per course with BM25. The tutor injects the best-matching chunks into its
+prompt under a fixed token budget instead of sending whole lessons.
+"""
+
+from cachetools import LRUCache
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import math
+import os
+import re
+
+from media import pdf_name_from_url
+
+logger = logging.getLogger(__name__)
+
+CHUNK_WORDS = 180
+CHUNK_OVERLAP_WORDS = 30
+RETRIEVAL_TOP_K = int(os.environ.get("TUTOR_RETRIEVAL_TOP_K", 5))
+RETRIEVAL_TOKEN_BUDGET = int(os.environ.get("TUTOR_RETRIEVAL_TOKEN_BUDGET", 1200))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_STOP_WORDS = frozenset(
+    "a an and are as at be but by can do does for from how i if in into is it its of on or "
+    "so that the their then there these this to was what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1 and t not in _STOP_WORDS]
+
+
+def chunk_text(text: str) -> List[str]:
+    """Split text into overlapping windows of about CHUNK_WORDS words"""
+    words = text.split()
+    if not words:
+        return []
+    step = CHUNK_WORDS - CHUNK_OVERLAP_WORDS
+    return [" ".join(words[i:i + CHUNK_WORDS]) for i in range(0, max(len(words) - CHUNK_OVERLAP_WORDS, 1), step)]
+
+
+def extract_pdf_text(path: Path) -> str:
+    """Plain text of a PDF, or "" when pypdf is missing or the file can't be read"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        logger.warning("pypdf is not installed; PDF lessons are not indexed for the tutor")
+        return ""
+    try:
+        reader = PdfReader(str(path))
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    except Exception as e:
+        logger.warning(f"Could not extract text from {path}: {e}")
+        return ""
+
+
+@dataclass
+class Chunk:
+    lesson_id: str
+    lesson_title: str
+    text: str
+    term_freqs: Counter
+    length: int
+
+
+class CourseIndex:
+    """Incrementally maintained BM25 index over one course's lesson chunks"""
+
+    def __init__(self, version: int):
+        self.version = version
+        self._chunks: Dict[str, List[Chunk]] = {}
+        self._doc_freqs: Counter = Counter()
+        self._total_length = 0
+        self._count = 0
+
+    def upsert_lesson(self, lesson_id: str, lesson_title: str, texts: List[str]):
+        self.remove_lesson(lesson_id)
+        chunks = []
+        for text in texts:
+            for piece in chunk_text(text):
+                terms = tokenize(piece)
+                if terms:
+                    chunks.append(Chunk(lesson_id, lesson_title, piece, Counter(terms), len(terms)))
+        for chunk in chunks:
+            self._doc_freqs.update(chunk.term_freqs.keys())
+            self._total_length += chunk.length
+        self._count += len(chunks)
+        self._chunks[lesson_id] = chunks
+
+    def remove_lesson(self, lesson_id: str):
+        for chunk in self._chunks.pop(lesson_id, []):
+            for term in chunk.term_freqs:
+                self._doc_freqs[term] -= 1
+                if self._doc_freqs[term] <= 0:
+                    del self._doc_freqs[term]
+            self._total_length -= chunk.length
+            self._count -= 1
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> List[Tuple[float, Chunk]]:
+        terms = set(tokenize(query))
+        if not terms or not self._count:
+            return []
+        avg_length = self._total_length / self._count
+        idf = {
+            term: math.log(1 + (self._count - self._doc_freqs[term] + 0.5) / (self._doc_freqs[term] + 0.5))
+            for term in terms if self._doc_freqs[term]
+        }
+        if not idf:
+            return []
+
+        scored = []
+        for chunks in self._chunks.values():
+            for chunk in chunks:
+                score = 0.0
+                for term, weight in idf.items():
+                    tf = chunk.term_freqs.get(term)
+                    if tf:
+                        score += weight * tf * (BM25_K1 + 1) / (
+                            tf + BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / avg_length)
+                        )
+                if score > 0:
+                    scored.append((score, chunk))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:k]
+
+
+class TutorRetrieval:
+    """Per-course indexes, built lazily and kept current by lesson edits"""
+
+    def __init__(
+        self,
+        pdf_dir: Path,
+        max_courses: int = 256,
+        stored_text: Optional[Callable[[str], Awaitable[Optional[str]]]] = None
+    ):
+        self.pdf_dir = pdf_dir
+        # Text already extracted by the upload pipeline; None means "not processed yet"
+        self.stored_text = stored_text
+        self._indexes: LRUCache = LRUCache(maxsize=max_courses)
+        self._pdf_text: LRUCache = LRUCache(maxsize=1024)  # uploads are named by SHA-256, so a name always means the same bytes
+        self._builds: Dict[str, asyncio.Task] = {}
+
+    def _pdf_path(self, url: Optional[str]) -> Optional[Path]:
+        name = pdf_name_from_url(url)
+        if name is None:
+            return None
+        path = self.pdf_dir / name
+        return path if path.is_file() else None
+
+    async def _lesson_texts(self, lesson: dict) -> List[str]:
+        texts = [lesson.get('description') or "", lesson.get('content_text') or ""]
+        for url in {lesson.get('content_url'), lesson.get('notes_url')}:
+            path = self._pdf_path(url)
+            if path is None:
+                continue
+            text = self._pdf_text.get(path.name)
+            if text is None and self.stored_text is not None:
+                text = await self.stored_text(url)
+            if text is None:
+                text = await asyncio.to_thread(extract_pdf_text, path)
+            self._pdf_text[path.name] = text
+            texts.append(text)
+        return [text for text in texts if text.strip()]
+
+    async def _build(self, db, course_id: str, version: int) -> CourseIndex:
+        index = CourseIndex(version)
+        lessons = await db.lessons.find(
+            {"course_id": course_id},
+            {"_id": 0, "id": 1, "title": 1, "description": 1, "content_text": 1, "content_url": 1, "notes_url": 1}
+        ).to_list(None)
+        for lesson in lessons:
+            index.upsert_lesson(lesson['id'], lesson['title'], await self._lesson_texts(lesson))
+        self._indexes[course_id] = index
+        return index
+
+    async def get_index(self, db, course_id: str, version: int) -> CourseIndex:
+        """Return the course index, rebuilding it when it predates `version`"""
+        index = self._indexes.get(course_id)
+        if index is not None and index.version >= version:
+            return index
+        build = self._builds.get(course_id)
+        if build is None:
+            build = asyncio.ensure_future(self._build(db, course_id, version))
+            self._builds[course_id] = build
+            build.add_done_callback(lambda _: self._builds.pop(course_id, None))
+        return await asyncio.shield(build)
+
+    async def upsert_lesson(self, course_id: str, lesson: dict, version: int):
+        """Re-index one lesson in an already loaded course index"""
+        index = self._indexes.get(course_id)
+        if index is None:
+            return
+        index.upsert_lesson(lesson['id'], lesson['title'], await self._lesson_texts(lesson))
+        index.version = max(index.version, version)
+
+    def remove_lesson(self, course_id: str, lesson_id: str, version: int):
+        index = self._indexes.get(course_id)
+        if index is not None:
+            index.remove_lesson(lesson_id)
+            index.version = max(index.version, version)
+
+    def advance(self, course_id: str, version: int):
+        """Mark a loaded index current after an edit that doesn't touch lesson content"""
+        index = self._indexes.get(course_id)
+        if index is not None:
+            index.version = max(index.version, version)
+
+    def drop(self, course_id: str):
+        self._indexes.pop(course_id, None)
+
+    async def context_for(self, db, course_id: str, version: int, question: str) -> str:
+        """Top-k chunks for a question, formatted for the prompt within the token budget"""
+        index = await self.get_index(db, course_id, version)
+        parts, used = [], 0
+        for _, chunk in index.search(question):
+            piece = f"[{chunk.lesson_title}]\n{chunk.text}"
+            cost = max(1, len(piece) // 4)
+            if used + cost > RETRIEVAL_TOKEN_BUDGET:
+                break
+            parts.append(piece)
+            used += cost
+        return "\n\n".join(parts)
@@ -0,0 +1,349 @@
+"""
+Upload storage for BritSyncAI Academy
+Uploads are streamed to a temporary file in fixed-size chunks (file IO runs
+off the event loop), hashed with SHA-256 while they are written and then
+stored under their digest. Uploading the same bytes twice resolves to the
+file that is already there. Large files can instead be sent as resumable
+sessions of fixed-size chunks (see ResumableUploads).
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+import asyncio
+import errno
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MAX_THUMBNAIL_BYTES = int(os.environ.get("MAX_THUMBNAIL_BYTES", 10 * 1024 * 1024))
+MAX_LESSON_PDF_BYTES = int(os.environ.get("MAX_LESSON_PDF_BYTES", 100 * 1024 * 1024))
+
+_IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds {limit // (1024 * 1024)} MB")
+        self.limit = limit
+
+
+class UploadRejected(Exception):
+    """The upload's content does not match what the endpoint accepts"""
+
+
+@dataclass
+class StoredFile:
+    name: str
+    path: Path
+    sha256: str
+    size: int
+    deduplicated: bool
+
+
+def sniff_image_extension(head: bytes) -> Optional[str]:
+    for signature, extension in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def is_pdf(head: bytes) -> bool:
+    # The header may follow a little leading junk, which readers tolerate
+    return b"%PDF-" in head[:1024]
+
+
+def temp_upload_path(directory: Path) -> Path:
+    return directory / f".partial-{uuid.uuid4().hex}"
+
+
+def store_by_digest(temp_path: Path, directory: Path, sha256: str, extension: str, size: int) -> StoredFile:
+    """Move a fully written temp file to <sha256><ext>, or drop it if that file exists"""
+    name = f"{sha256}{extension}"
+    final_path = directory / name
+    if final_path.exists():
+        temp_path.unlink(missing_ok=True)
+        return StoredFile(name, final_path, sha256, size, deduplicated=True)
+    # Atomic; a concurrent upload of the same bytes just replaces identical content
+    try:
+        os.replace(temp_path, final_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Different filesystem: copy next to the target first so the final rename stays atomic
+        staged = temp_upload_path(directory)
+        shutil.copyfile(temp_path, staged)
+        os.replace(staged, final_path)
+        temp_path.unlink(missing_ok=True)
+    return StoredFile(name, final_path, sha256, size, deduplicated=False)
+
+
+async def store_upload(upload, directory: Path, max_bytes: int, kind: str) -> StoredFile:
+    """Stream an UploadFile into content-addressed storage.
+
+    kind is "image" (extension from the magic bytes, falling back to the file
+    name) or "pdf" (must start with a PDF header).
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    temp_path = temp_upload_path(directory)
+    hasher = hashlib.sha256()
+    size = 0
+    extension = None
+    handle = await asyncio.to_thread(open, temp_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            if extension is None:
+                extension = _extension_for(kind, chunk, upload.filename)
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            hasher.update(chunk)
+            await asyncio.to_thread(handle.write, chunk)
+        await asyncio.to_thread(handle.close)
+        if size == 0:
+            raise UploadRejected("Empty file")
+        return await asyncio.to_thread(store_by_digest, temp_path, directory, hasher.hexdigest(), extension, size)
+    except BaseException:
+        handle.close()
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def _extension_for(kind: str, head: bytes, filename: Optional[str]) -> str:
+    if kind == "pdf":
+        if not is_pdf(head):
+            raise UploadRejected("File is not a valid PDF")
+        return ".pdf"
+    extension = sniff_image_extension(head)
+    if extension:
+        return extension
+    suffix = Path(filename or "").suffix.lower()
+    return suffix if suffix and len(suffix) <= 6 and suffix[1:].isalnum() else ".png"
+
+
+def cleanup_partials(directory: Path, older_than_seconds: float) -> int:
+    """Remove temp files left behind by interrupted uploads"""
+    removed = 0
+    cutoff = time.time() - older_than_seconds
+    for path in directory.glob(".partial-*"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+# ==================== RESUMABLE UPLOADS ====================
+RESUMABLE_CHUNK_BYTES = int(os.environ.get("RESUMABLE_CHUNK_BYTES", 8 * 1024 * 1024))
+RESUMABLE_EXPIRY_SECONDS = int(os.environ.get("RESUMABLE_EXPIRY_SECONDS", 24 * 3600))
+
+_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadSessionNotFound(Exception):
+    pass
+
+
+class ResumableUploads:
+    """Upload sessions kept on disk: <id>.json (metadata), <id>.part and one marker per received chunk.
+
+    Chunks have a fixed size agreed at creation and may arrive in any order
+    and in parallel; each one is written at its own offset with pwrite and
+    only marked as received once it is fully on disk, so no shared state is
+    rewritten and several workers can serve the same session. A chunk sent
+    with its SHA-256 is verified on receipt and the digest kept in its marker;
+    when every chunk was verified that way, finalize needs no whole-file checksum.
+    """
+
+    def __init__(self, root: Path, chunk_bytes: int = RESUMABLE_CHUNK_BYTES,
+                 expiry_seconds: int = RESUMABLE_EXPIRY_SECONDS):
+        self.root = root
+        self.chunk_bytes = chunk_bytes
+        self.expiry_seconds = expiry_seconds
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, upload_id: str):
+        if not _SESSION_ID.match(upload_id):
+            raise UploadSessionNotFound(upload_id)
+        return self.root / f"{upload_id}.json", self.root / f"{upload_id}.part", self.root / f"{upload_id}.chunks"
+
+    def _chunk_count(self, size: int) -> int:
+        return max(1, -(-size // self.chunk_bytes))
+
+    def create(self, user_id: str, kind: str, filename: str, size: int, sha256: Optional[str]) -> dict:
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path, chunk_dir = self._paths(upload_id)
+        session = {
+            "upload_id": upload_id,
+            "user_id": user_id,
+            "kind": kind,
+            "filename": filename,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "chunk_size": self.chunk_bytes,
+            "chunk_count": self._chunk_count(size),
+            "expires_at": time.time() + self.expiry_seconds,
+        }
+        chunk_dir.mkdir()
+        with open(part_path, "wb") as handle:
+            handle.truncate(size)  # sparse; chunks fill it in
+        # Written last: a session without metadata is treated as missing
+        temp_meta = meta_path.with_suffix(".json.tmp")
+        temp_meta.write_text(json.dumps(session))
+        os.replace(temp_meta, meta_path)
+        return session
+
+    def get(self, upload_id: str) -> dict:
+        meta_path, _, chunk_dir = self._paths(upload_id)
+        try:
+            session = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            raise UploadSessionNotFound(upload_id)
+        if session['expires_at'] < time.time():
+            self.delete(upload_id)
+            raise UploadSessionNotFound(upload_id)
+        try:
+            received = sorted(int(marker.name) for marker in chunk_dir.iterdir() if marker.name.isdigit())
+        except FileNotFoundError:
+            # Finalized or cancelled between reading the metadata and listing the chunks
+            raise UploadSessionNotFound(upload_id)
+        session['received_chunks'] = received
+        session['received_bytes'] = sum(self._chunk_length(session, index) for index in received)
+        return session
+
+    def _chunk_length(self, session: dict, index: int) -> int:
+        return min(session['chunk_size'], session['size'] - index * session['chunk_size'])
+
+    def chunk_index(self, session: dict, offset: int, length: int) -> int:
+        """Validate that [offset, offset + length) is exactly one chunk and return its index"""
+        if offset < 0 or offset % session['chunk_size'] or offset >= session['size']:
+            raise UploadRejected(f"Offset must be a multiple of {session['chunk_size']} within the file")
+        index = offset // session['chunk_size']
+        if length != self._chunk_length(session, index):
+            raise UploadRejected(f"Chunk at offset {offset} must be {self._chunk_length(session, index)} bytes")
+        return index
+
+    def write_chunk(self, session: dict, index: int, data: bytes, sha256: Optional[str] = None):
+        meta_path, part_path, chunk_dir = self._paths(session['upload_id'])
+        if index == 0 and session['kind'] == "pdf" and not is_pdf(data):
+            raise UploadRejected("File is not a valid PDF")
+        if sha256 and hashlib.sha256(data).hexdigest() != sha256.lower():
+            raise UploadRejected(f"Checksum mismatch for chunk {index}; send it again")
+        try:
+            fd = os.open(part_path, os.O_WRONLY)
+        except FileNotFoundError:
+            # Finalized or cancelled meanwhile
+            raise UploadSessionNotFound(session['upload_id'])
+        try:
+            os.pwrite(fd, data, index * session['chunk_size'])
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        (chunk_dir / str(index)).write_text(sha256.lower() if sha256 else "")
+
+    def finalize(self, session: dict, directory: Path, expected_sha256: Optional[str]) -> StoredFile:
+        """Verify the assembled file and move it into content-addressed storage"""
+        missing = session['chunk_count'] - len(session['received_chunks'])
+        if missing:
+            raise UploadRejected(f"{missing} chunk(s) still missing")
+        expected = (expected_sha256 or session.get('sha256') or "").lower()
+        if not expected and not self._chunks_verified(session):
+            raise UploadRejected("A SHA-256 checksum of the file or of every chunk is required to finalize")
+        _, part_path, _ = self._paths(session['upload_id'])
+        # Claim the assembled file; a concurrent finalize (or cancel) loses the rename
+        claimed = self.root / f"{session['upload_id']}.finalizing-{uuid.uuid4().hex}"
+        try:
+            os.rename(part_path, claimed)
+        except FileNotFoundError:
+            raise UploadSessionNotFound(session['upload_id'])
+        try:
+            hasher = hashlib.sha256()
+            with open(claimed, "rb") as handle:
+                while True:
+                    block = handle.read(UPLOAD_CHUNK_BYTES)
+                    if not block:
+                        break
+                    hasher.update(block)
+            digest = hasher.hexdigest()
+            if expected and digest != expected:
+                raise UploadRejected("Checksum mismatch; re-upload the chunks")
+            extension = ".pdf" if session['kind'] == "pdf" else Path(session['filename']).suffix.lower()
+            stored = store_by_digest(claimed, directory, digest, extension, session['size'])
+        except BaseException:
+            # Hand the file back so the session can still be inspected, resent or cancelled
+            if claimed.exists():
+                os.replace(claimed, part_path)
+            raise
+        self.delete(session['upload_id'])
+        return stored
+
+    def _chunks_verified(self, session: dict) -> bool:
+        _, _, chunk_dir = self._paths(session['upload_id'])
+        try:
+            return all((chunk_dir / str(index)).read_text() for index in range(session['chunk_count']))
+        except OSError:
+            return False
+
+    def delete(self, upload_id: str):
+        meta_path, part_path, chunk_dir = self._paths(upload_id)
+        meta_path.unlink(missing_ok=True)
+        part_path.unlink(missing_ok=True)
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    def cleanup_expired(self) -> int:
+        removed = 0
+        now = time.time()
+        for meta_path in self.root.glob("*.json"):
+            try:
+                expired = json.loads(meta_path.read_text())['expires_at'] < now
+            except (OSError, ValueError, KeyError):
+                try:
+                    expired = meta_path.stat().st_mtime < now - self.expiry_seconds
+                except OSError:
+                    continue
+            if expired:
+                self.delete(meta_path.stem)
+                removed += 1
+        return removed + self._cleanup_orphans(now - self.expiry_seconds)
+
+    def _cleanup_orphans(self, cutoff: float) -> int:
+        """Remove files of sessions whose metadata was never written or is already gone:
+        interrupted creates, crashed finalizes and half-finished deletes"""
+        removed = 0
+        for path in self.root.iterdir():
+            upload_id = path.name.split(".", 1)[0]
+            if path.suffix == ".json" or not _SESSION_ID.match(upload_id):
+                continue
+            if (self.root / f"{upload_id}.json").exists():
+                continue
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+                removed += 1
+            except OSError:
+                continue
+        return removed
@@ -7,6 +7,7 @@ import { Textarea } from '@/components/ui/textarea';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { X } from 'lucide-react';
 import { toast } from 'sonner';
+import { uploadLessonPdf } from '@/utils/pdfUpload';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -60,20 +61,11 @@ export default function AddLessonForm({ courseId, sectionId, onClose, onSuccess
       return;
     }
 
-    const formDataUpload = new FormData();
-    formDataUpload.append('file', file);
-
     setUploadingPdf(true);
     try {
-      const token = localStorage.getItem('token');
-      const response = await axios.post(`${API}/upload/lesson-pdf`, formDataUpload, {
-        headers: {
-          Authorization: `Bearer ${token}`,
-          'Content-Type': 'multipart/form-data'
-        }
-      });
+      const uploaded = await uploadLessonPdf(file);
 
-      setFormData(prev => ({ ...prev, content_url: `${BACKEND_URL}${response.data.url}` }));
+      setFormData(prev => ({ ...prev, content_url: `${BACKEND_URL}${uploaded.url}` }));
       toast.success('PDF uploaded successfully!');
     } catch (error) {
       toast.error('Failed to upload PDF');
@@ -92,20 +84,11 @@ export default function AddLessonForm({ courseId, sectionId, onClose, onSuccess
       return;
     }
 
-    const formDataUpload = new FormData();
-    formDataUpload.append('file', file);
-
     setUploadingNotes(true);
     try {
-      const token = localStorage.getItem('token');
-      const response = await axios.post(`${API}/upload/lesson-pdf`, formDataUpload, {
-        headers: {
-          Authorization: `Bearer ${token}`,
-          'Content-Type': 'multipart/form-data'
-        }
-      });
+      const uploaded = await uploadLessonPdf(file);
 
-      setFormData(prev => ({ ...prev, notes_url: `${BACKEND_URL}${response.data.url}` }));
+      setFormData(prev => ({ ...prev, notes_url: `${BACKEND_URL}${uploaded.url}` }));
       toast.success('Notes PDF uploaded successfully!');
     } catch (error) {
       toast.error('Failed to upload Notes PDF');
@@ -3,7 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import Navbar from '@/components/Navbar';
 import { Search, SlidersHorizontal, Star, ArrowRight, BookOpen } from 'lucide-react';
-import { getThumbnailUrl } from '@/utils/thumbnailUrl';
+import { getThumbnailUrl, getThumbnailSrcSet } from '@/utils/thumbnailUrl';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -176,12 +176,20 @@ export default function CourseCatalog({ user, logout }) {
               >
                 {/* Thumbnail */}
                 <div className="relative h-48 overflow-hidden bg-gradient-to-br from-blue-50 to-slate-100">
-                  <img
-                    src={getThumbnailUrl(course.thumbnail)}
-                    alt={course.title}
-                    className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-500"
-                    onError={(e) => { e.target.onerror = null; e.target.src = '/placeholder-course.png'; }}
-                  />
+                  <picture>
+                    <source type="image/webp" srcSet={getThumbnailSrcSet(course.thumbnail_srcset?.webp)} sizes="(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw" />
+                    <img
+                      src={getThumbnailUrl(course.thumbnail)}
+                      srcSet={getThumbnailSrcSet(course.thumbnail_srcset?.jpeg)}
+                      sizes="(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw"
+                      alt={course.title}
+                      loading="lazy"
+                      decoding="async"
+                      style={course.thumbnail_lqip ? { backgroundImage: `url(${course.thumbnail_lqip})`, backgroundSize: 'cover' } : undefined}
+                      className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-500"
+                      onError={(e) => { e.target.onerror = null; e.target.srcset = ''; e.target.src = '/placeholder-course.png'; }}
+                    />
+                  </picture>
                   {/* Hover overlay */}
                   <div className="absolute inset-0 bg-gradient-to-t from-blue-900/60 via-transparent to-transparent opacity-0 group-hover:opacity-100 transition-all duration-300 flex items-end justify-center pb-5">
                     <span className="bg-white text-primary font-bold text-sm px-5 py-2 rounded-full shadow-lg flex items-center gap-1.5">
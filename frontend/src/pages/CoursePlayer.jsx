@@ -101,7 +101,11 @@ export default function CoursePlayer({ user, logout }) {
       setEnrollment(currentEnrollment);
 
       // Load completed lessons from backend (primary source of truth)
-      const backendLessons = new Set(currentEnrollment.completed_lessons || []);
+      const lessonProgressRes = await axios.get(
+        `${API}/enrollments/${currentEnrollment.id}/lesson-progress`,
+        { headers }
+      );
+      const backendLessons = new Set(lessonProgressRes.data.completed_lessons || []);
 
       // Also check localStorage for backward compatibility and merge
       const saved = localStorage.getItem(`completed_lessons_${id}`);
@@ -223,12 +227,35 @@ export default function CoursePlayer({ user, logout }) {
 
     const token = localStorage.getItem('token');
     try {
-      const response = await axios.post(`${API}/ai/tutor?course_id=${id}&question=${encodeURIComponent(tutorInput)}`, null, {
+      // Stream the answer (SSE) so tokens render as they are generated
+      const response = await fetch(`${API}/ai/tutor?course_id=${id}&question=${encodeURIComponent(tutorInput)}&stream=true`, {
+        method: 'POST',
         headers: { Authorization: `Bearer ${token}` }
       });
-
-      const aiMessage = { role: 'assistant', content: response.data.response };
-      setTutorMessages([...tutorMessages, userMessage, aiMessage]);
+      if (!response.ok || !response.body) throw new Error(`Tutor request failed (${response.status})`);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let answer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const event of events) {
+          const dataLine = event.split('\n').find((line) => line.startsWith('data: '));
+          if (!dataLine) continue;
+          const data = JSON.parse(dataLine.slice(6));
+          if (event.startsWith('event: error')) throw new Error(data.detail);
+          if (data.token) {
+            answer += data.token;
+            setTutorMessages([...tutorMessages, userMessage, { role: 'assistant', content: answer }]);
+          }
+        }
+      }
     } catch (error) {
       toast.error('Failed to get AI response');
       console.error(error);
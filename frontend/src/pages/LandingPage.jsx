@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import Navbar from '@/components/Navbar';
-import { getThumbnailUrl } from '@/utils/thumbnailUrl';
+import { getThumbnailUrl, getThumbnailSrcSet } from '@/utils/thumbnailUrl';
 import BlogSection from '@/components/BlogSection';
 import NewsletterSignup from '@/components/NewsletterSignup';
 import '@/components/Newsletter.css';
@@ -171,12 +171,20 @@ export default function LandingPage({ user, logout }) {
               >
                 {/* Thumbnail */}
                 <div className="relative h-48 overflow-hidden bg-gradient-to-br from-indigo-100 to-violet-100">
-                  <img
-                    src={getThumbnailUrl(course.thumbnail)}
-                    alt={course.title}
-                    className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-500"
-                    onError={(e) => { e.target.onerror = null; e.target.src = '/placeholder-course.png'; }}
-                  />
+                  <picture>
+                    <source type="image/webp" srcSet={getThumbnailSrcSet(course.thumbnail_srcset?.webp)} sizes="(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw" />
+                    <img
+                      src={getThumbnailUrl(course.thumbnail)}
+                      srcSet={getThumbnailSrcSet(course.thumbnail_srcset?.jpeg)}
+                      sizes="(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw"
+                      alt={course.title}
+                      loading="lazy"
+                      decoding="async"
+                      style={course.thumbnail_lqip ? { backgroundImage: `url(${course.thumbnail_lqip})`, backgroundSize: 'cover' } : undefined}
+                      className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-500"
+                      onError={(e) => { e.target.onerror = null; e.target.srcset = ''; e.target.src = '/placeholder-course.png'; }}
+                    />
+                  </picture>
                   <div className="absolute inset-0 bg-gradient-to-t from-black/40 to-transparent opacity-0 group-hover:opacity-100 transition-opacity flex items-end justify-center pb-4">
                     <span className="bg-white text-indigo-700 font-bold text-sm px-4 py-2 rounded-full shadow-lg">
                       View Course
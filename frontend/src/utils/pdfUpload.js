@@ -0,0 +1,110 @@
+import axios from 'axios';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+// Files above this go through the resumable chunked protocol
+const RESUMABLE_THRESHOLD_BYTES = 8 * 1024 * 1024;
+const PARALLEL_CHUNKS = 3;
+const CHUNK_RETRIES = 4;
+
+const authHeaders = () => ({ Authorization: `Bearer ${localStorage.getItem('token')}` });
+const sessionKey = (file) => `pdf-upload:${file.name}:${file.size}:${file.lastModified}`;
+
+// Only one chunk is read into memory at a time; the server verifies each one
+async function sha256Hex(blob) {
+  const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function sendChunk(uploadId, file, index, chunkSize) {
+  const offset = index * chunkSize;
+  const body = file.slice(offset, Math.min(offset + chunkSize, file.size));
+  const checksum = await sha256Hex(body);
+  for (let attempt = 0; ; attempt += 1) {
+    try {
+      await axios.patch(`${API}/upload/resumable/${uploadId}`, body, {
+        params: { offset },
+        headers: { ...authHeaders(), 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': checksum },
+      });
+      return;
+    } catch (error) {
+      const status = error?.response?.status;
+      // 4xx other than 429 won't succeed on retry
+      if (attempt >= CHUNK_RETRIES || (status && status < 500 && status !== 429)) throw error;
+      await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** attempt));
+    }
+  }
+}
+
+async function openSession(file) {
+  const saved = localStorage.getItem(sessionKey(file));
+  if (saved) {
+    try {
+      const { data } = await axios.get(`${API}/upload/resumable/${saved}`, { headers: authHeaders() });
+      return data;
+    } catch {
+      localStorage.removeItem(sessionKey(file));
+    }
+  }
+  const { data } = await axios.post(
+    `${API}/upload/lesson-pdf/resumable`,
+    { filename: file.name, size: file.size },
+    { headers: authHeaders() }
+  );
+  localStorage.setItem(sessionKey(file), data.upload_id);
+  return data;
+}
+
+/**
+ * Upload a lesson PDF and resolve to the server response ({ url }).
+ * Large files are sent in parallel chunks that survive retries and page
+ * reloads; onProgress receives a 0-1 fraction.
+ */
+export async function uploadLessonPdf(file, onProgress = () => {}) {
+  if (file.size <= RESUMABLE_THRESHOLD_BYTES) {
+    const formDataUpload = new FormData();
+    formDataUpload.append('file', file);
+    const response = await axios.post(`${API}/upload/lesson-pdf`, formDataUpload, {
+      headers: { ...authHeaders(), 'Content-Type': 'multipart/form-data' },
+    });
+    onProgress(1);
+    return response.data;
+  }
+
+  const session = await openSession(file);
+  const received = new Set(session.received_chunks);
+  const pending = [];
+  for (let index = 0; index < session.chunk_count; index += 1) {
+    if (!received.has(index)) pending.push(index);
+  }
+
+  let done = received.size;
+  onProgress(done / session.chunk_count);
+  const worker = async () => {
+    while (pending.length) {
+      const index = pending.shift();
+      await sendChunk(session.upload_id, file, index, session.chunk_size);
+      done += 1;
+      onProgress(done / session.chunk_count);
+    }
+  };
+  await Promise.all(Array.from({ length: PARALLEL_CHUNKS }, worker));
+
+  try {
+    const { data } = await axios.post(
+      `${API}/upload/resumable/${session.upload_id}/finalize`,
+      {},
+      { headers: authHeaders() }
+    );
+    localStorage.removeItem(sessionKey(file));
+    return data;
+  } catch (error) {
+    // A session that can't be finalized won't be fixed by resuming; start over next time
+    if (error?.response?.status === 400) {
+      localStorage.removeItem(sessionKey(file));
+      axios.delete(`${API}/upload/resumable/${session.upload_id}`, { headers: authHeaders() }).catch(() => {});
+    }
+    throw error;
+  }
+}
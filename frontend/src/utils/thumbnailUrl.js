@@ -14,3 +14,18 @@ export function getThumbnailUrl(thumbnail) {
     // Relative path — prepend backend URL
     return `${BACKEND_URL}${thumbnail}`;
 }
+
+/**
+ * Prefixes every URL in a backend srcset string ("url 320w, url 640w")
+ * with BACKEND_URL. Returns undefined when there is no srcset.
+ */
+export function getThumbnailSrcSet(srcset) {
+    if (!srcset) return undefined;
+    return srcset
+        .split(',')
+        .map((entry) => {
+            const [url, width] = entry.trim().split(/\s+/);
+            return `${url.startsWith('http') ? url : `${BACKEND_URL}${url}`} ${width}`;
+        })
+        .join(', ');
+}